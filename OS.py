@@ -1,16 +1,28 @@
 # Updated System Code (DarkoOS.py)
 
+import time
+
+STARTED = time.perf_counter()
+
 import tkinter as tk
-from tkinter import messagebox, scrolledtext, simpledialog
+from tkinter import messagebox
+import bisect
+import functools
+import gc
+import json
+import mmap
 import os
+import queue
 import sys
-import urllib.request
+import threading
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-try:
-    from tkhtmlview import HTMLLabel
-except ImportError:
-    messagebox.showerror("Error", "tkhtmlview not found. Install with 'pip install tkhtmlview'")
-    sys.exit(1)
+# Browser (tkhtmlview, darko_web) and dialog modules are imported on first use
+import darko_calc
+from darko_core import (PRIORITIES, PROGRAMS, SYSTEM_DIR, VFS, BulkJob, Histogram, HistoryCursor, HistoryLog,
+                         ImageVFS, PerfStats, Scheduler, Shell, atomic_write, entry_icon, log, setup_logging)
 
 # Import config
 try:
@@ -18,9 +30,1160 @@ try:
 except ImportError:
     messagebox.showerror("Error", "Config file not found. Please reinstall.")
     sys.exit(1)
+try:
+    from config import disk_image  # optional: keep v_disk in this single image file
+except ImportError:
+    disk_image = None
+try:
+    from config import disk_dedup  # optional: "zlib", "lzma" or "raw" to deduplicate file contents
+except ImportError:
+    disk_dedup = None
+try:
+    from config import web_prefetch  # optional: True to fetch a page's first same-origin links ahead of clicks
+except ImportError:
+    web_prefetch = False
+
+# ---------- STARTUP ----------
+class StartupTimeline:
+    # Milliseconds from process start to each boot phase. Appended to
+    # v_disk/.darko/startup.log once the desktop is complete, and printed
+    # to stderr with --timeline or DARKOOS_TIMELINE=1.
+    def __init__(self, started, echo=False, wait_for=("icons shown", "disk indexed")):
+        self.started = started
+        self.echo = echo
+        self.marks = []
+        self.pending = set(wait_for)
+        self.on_complete = None
+
+    def mark(self, phase):
+        at = (time.perf_counter() - self.started) * 1000
+        prev = self.marks[-1][1] if self.marks else 0.0
+        self.marks.append((phase, at))
+        if self.echo:
+            print(f"DarkoOS startup: {phase:<22} {at:9.1f} ms  (+{at - prev:.1f})", file=sys.stderr)
+        self.pending.discard(phase)
+        if not self.pending and self.on_complete:
+            callback, self.on_complete = self.on_complete, None
+            callback(self)
+
+    def at(self, phase):
+        for name, at in self.marks:
+            if name == phase:
+                return at
+        return None
+
+    def summary(self):
+        unlocked, desktop = self.at("unlocked"), self.at("desktop painted")
+        return {
+            "time": time.time(),
+            "time_to_login_screen_ms": self.at("login screen painted"),
+            "time_to_desktop_ms": round(desktop - unlocked, 1) if None not in (unlocked, desktop) else None,
+            "phases": {name: round(at, 1) for name, at in self.marks},
+        }
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.summary()) + "\n")
+
+
+def after_paint(widget, callback):
+    # Pending redraws are idle tasks, so this runs once they have been drawn
+    widget.after_idle(lambda: widget.after(1, callback))
+
+
+# ---------- WORKERS ----------
+class WorkerPool:
+    # Runs blocking work off the mainloop. Results come back to the UI thread
+    # through a queue pumped by root.after, so Tk is only touched from there.
+    def __init__(self, root, threads=4, processes=0, budget_ms=8, monitor=None, charge=None):
+        self.root = root
+        self.monitor = monitor  # EventMonitor timing the result callbacks
+        self.charge = charge  # charge(widget path, seconds, background=True) for thread CPU time
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="darko-io")
+        self.serial = ThreadPoolExecutor(max_workers=1, thread_name_prefix="darko-serial")
+        self.max_processes = processes or None
+        self.processes = None
+        self.budget = budget_ms / 1000
+        self.results = queue.SimpleQueue()
+        self.owners = {}  # widget path -> set of pending futures
+        self.root.bind("<Destroy>", self.on_root_destroy, add="+")
+        self.root.after(10, self.pump)
+
+    def process_executor(self):
+        # Created on first use; workers start only when something is submitted
+        if self.processes is None:
+            self.processes = ProcessPoolExecutor(max_workers=self.max_processes)
+        return self.processes
+
+    def submit(self, fn, *args, done=None, error=None, owner=None, process=False, serial=False):
+        if process:
+            executor = self.process_executor()
+        elif serial:
+            executor = self.serial
+        else:
+            executor = self.threads
+        if self.charge is not None and not process:
+            fn = functools.partial(self.timed, fn, str(owner) if owner is not None else ".")
+        future = executor.submit(fn, *args)
+        if owner is not None:
+            key = str(owner)
+            if key not in self.owners:
+                self.owners[key] = set()
+                owner.bind("<Destroy>", lambda e, o=owner: self.on_owner_destroy(e, o), add="+")
+            self.owners[key].add(future)
+        future.add_done_callback(lambda f: self.results.put((f, done, error, owner)))
+        return future
+
+    def timed(self, fn, path, *args):
+        # Runs on a worker; thread_time leaves out the time spent waiting on I/O
+        start = time.thread_time()
+        try:
+            return fn(*args)
+        finally:
+            self.charge(path, time.thread_time() - start, background=True)
+
+    def post(self, fn, *args, owner=None):
+        # Safe from any thread: run fn(*args) on the UI thread at the next pump
+        self.results.put((None, functools.partial(fn, *args), None, owner))
+
+    def cancel(self, owner):
+        for future in self.owners.pop(str(owner), ()):
+            future.cancel()
+
+    def on_owner_destroy(self, event, owner):
+        # <Destroy> also fires for every child of a Toplevel
+        if event.widget is owner:
+            self.cancel(owner)
+
+    def on_root_destroy(self, event):
+        if event.widget is self.root:
+            self.shutdown()
+
+    def shutdown(self):
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        self.serial.shutdown(wait=False, cancel_futures=True)
+        if self.processes is not None:
+            self.processes.shutdown(wait=False, cancel_futures=True)
+
+    def call(self, fn, *args, owner=None):
+        if self.monitor is None:
+            return fn(*args)
+        return self.monitor.call(fn, *args, widget=owner)
+
+    def pump(self):
+        deadline = time.perf_counter() + self.budget
+        while time.perf_counter() < deadline:
+            try:
+                future, done, error, owner = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if future is not None and future.cancelled():
+                continue
+            if owner is not None:
+                self.owners.get(str(owner), set()).discard(future)
+                if not owner.winfo_exists():
+                    continue
+            try:
+                if future is None:
+                    self.call(done, owner=owner)
+                    continue
+                exc = future.exception()
+                if exc is not None:
+                    if error:
+                        self.call(error, exc, owner=owner)
+                    else:
+                        messagebox.showerror("Error", str(exc))
+                elif done:
+                    self.call(done, future.result(), owner=owner)
+            except Exception:
+                log.exception("worker callback failed")
+        try:
+            self.root.after(10, self.pump)
+        except tk.TclError:
+            pass
+
+
+# ---------- EVENT LOOP MONITOR ----------
+STALL_MS = 100  # handlers or heartbeats this late are listed as stalls
+SCHEDULE_MS = 10  # longest the scheduler sleeps between looking for due tasks
+SLICE_BUDGET = 0.008  # seconds of task slices per scheduler turn
+
+
+def handler_name(func):
+    # "DarkoOS.open_terminal.cmd", "after DarkoOS.schedule", "DarkoOS.open_explorer.lambda:1120"
+    prefix = ""
+    code = getattr(func, "__code__", None)
+    if code is not None and code.co_name == "callit" and "func" in code.co_freevars:
+        # Misc.after wraps the callback in a closure of its own
+        func = func.__closure__[code.co_freevars.index("func")].cell_contents
+        prefix = "after "
+    while isinstance(func, functools.partial):
+        func = func.func
+    func = getattr(func, "__func__", func)
+    name = getattr(func, "__qualname__", None) or type(func).__name__
+    name = name.replace(".<locals>", "")
+    if "<lambda>" in name and hasattr(func, "__code__"):
+        name = name.replace("<lambda>", f"lambda:{func.__code__.co_firstlineno}")
+    return prefix + name
+
+
+def event_name(args):
+    # Substituted binding arguments: %T is the event type, %K the keysym
+    if len(args) < 16:
+        return ""
+    try:
+        kind = tk.EventType(args[15]).name
+    except ValueError:
+        return ""
+    return f" <{kind}-{args[12]}>" if kind in ("KeyPress", "KeyRelease") else f" <{kind}>"
+
+
+class EventMonitor:
+    # Wall time of every Tk callback (commands, bindings, after callbacks) and
+    # of worker result callbacks, plus mainloop lag from a heartbeat that
+    # should fire every interval_ms. Read by System Monitor and perf. With a
+    # charge hook, each callback's time also goes to the window it belongs to.
+    def __init__(self, root, interval_ms=50, max_stalls=50, charge=None):
+        self.root = root
+        self.charge = charge  # charge(widget path, seconds)
+        self.interval_ms = interval_ms
+        self.stats = PerfStats()
+        self.lag = Histogram()
+        self.stalls = deque(maxlen=max_stalls)  # (time, ms, what)
+        self.expected = None
+        self.original = None
+
+    def install(self):
+        # Every Tcl -> Python callback goes through CallWrapper.__call__
+        if self.original is not None:
+            return
+        original = self.original = tk.CallWrapper.__call__
+        monitor = self
+
+        def call(wrapper, *args):
+            start = time.perf_counter()
+            try:
+                return original(wrapper, *args)
+            finally:
+                monitor.record(wrapper.func, start, event_name(args) if wrapper.subst else "", widget=wrapper.widget)
+
+        tk.CallWrapper.__call__ = call
+        self.root.after(self.interval_ms, self.beat)
+
+    def uninstall(self):
+        if self.original is not None:
+            tk.CallWrapper.__call__ = self.original
+            self.original = None
+
+    def record(self, func, start, suffix="", prefix="", widget=None):
+        ms = (time.perf_counter() - start) * 1000
+        name = prefix + handler_name(func) + suffix
+        if name == "after EventMonitor.beat":
+            return
+        self.stats.add(name, ms)
+        # Scheduler slices are charged to their own processes
+        if self.charge is not None and widget is not None and name != "after DarkoOS.schedule":
+            self.charge(str(widget), ms / 1000)
+        if ms >= STALL_MS:
+            self.stalls.append((time.time(), ms, name))
+
+    def call(self, fn, *args, prefix="done ", widget=None):
+        # For callbacks Tk does not invoke itself, like WorkerPool results
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self.record(fn, start, prefix=prefix, widget=widget or self.root)
+
+    def beat(self):
+        now = time.perf_counter()
+        if self.expected is not None:
+            lag = max(0.0, (now - self.expected) * 1000)
+            self.lag.add(lag)
+            if lag >= STALL_MS:
+                self.stalls.append((time.time(), lag, "mainloop lag"))
+        self.expected = now + self.interval_ms / 1000
+        try:
+            self.root.after(self.interval_ms, self.beat)
+        except tk.TclError:
+            pass
+
+    def reset(self):
+        self.stats.reset()
+        self.lag = Histogram()
+        self.stalls.clear()
+
+    def lag_chart(self, width=40):
+        # Heartbeat lag grouped into a few ranges, as bars
+        ranges = ((0, 1), (1, 5), (5, 16), (16, 50), (50, 100), (100, 500), (500, float("inf")))
+        counts = [0] * len(ranges)
+        for i, n in enumerate(self.lag.counts):
+            edge = Histogram.EDGES[i] if i < len(Histogram.EDGES) else float("inf")
+            for j, (low, high) in enumerate(ranges):
+                if edge <= high or j == len(ranges) - 1:
+                    counts[j] += n
+                    break
+        most = max(counts) or 1
+        return "".join(f"{f'{low:g}-{high:g} ms':>12} {'#' * round(width * n / most):<{width}} {n}\n"
+                       for (low, high), n in zip(ranges, counts))
+
+    def report(self, limit=20):
+        lag = self.lag
+        lines = [f"Mainloop lag (heartbeat every {self.interval_ms} ms, {lag.count} beats): "
+                 f"p50 {lag.percentile(50):.1f} ms, p90 {lag.percentile(90):.1f}, "
+                 f"p99 {lag.percentile(99):.1f}, max {lag.max:.1f}\n"]
+        if self.stalls:
+            lines.append(f"Stalls over {STALL_MS} ms: {len(self.stalls)}, latest:\n")
+            lines.extend(f"  {time.strftime('%H:%M:%S', time.localtime(t))} {ms:>8.1f} ms  {what}\n"
+                         for t, ms, what in list(self.stalls)[-5:])
+        return "".join(lines) + "\n" + self.stats.report(limit)
+
+    def to_dict(self):
+        data = self.stats.to_dict()
+        data["interval_ms"] = self.interval_ms
+        data["lag"] = self.lag.to_dict()
+        data["stalls"] = [{"time": t, "ms": round(ms, 3), "what": what} for t, ms, what in self.stalls]
+        return data
+
+
+# ---------- MEMORY ----------
+RAM_SOFT = 0.85  # share of the ram budget where caches are evicted and scrollback trimmed
+RAM_HARD = 0.95  # and where new windows are refused
+TRIMMED_SCROLLBACK = 500  # terminal lines kept once memory ran short
+LISTING_ENTRY_BYTES = 200  # rough cost of one cached directory entry
+
+
+def process_memory():
+    # Resident bytes of this process: /proc on Linux, psapi on Windows, else the peak from getrusage
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class Counters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage")]
+
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                    ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return 0
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def release_memory():
+    # Collects cycles and asks glibc to hand freed heap back to the system
+    gc.collect()
+    if sys.platform.startswith("linux"):
+        try:
+            import ctypes
+            ctypes.CDLL("libc.so.6").malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+def text_chars(widget):
+    # Characters held by a Text widget, counted inside Tk
+    try:
+        n = widget.count("1.0", "end", "chars")
+    except tk.TclError:
+        return 0
+    return n[0] if isinstance(n, tuple) else n or 0
+
+
+class MemoryBudget:
+    # Keeps the VM inside config.ram (MB). The total is the process's resident
+    # memory; windows and caches register what they hold so it can be shown
+    # per window and, for the trimmable ones, given back. tracemalloc is only
+    # started on request, as tracing makes DarkoOS several times slower.
+    def __init__(self, ram_mb):
+        self.limit = int(ram_mb * 1024 * 1024)
+        self.consumers = {}  # id -> (owner window or None, label, size(), trim() or None)
+        self.next_id = 0
+        self.relieved = 0.0  # when caches were last evicted
+        self.refused = 0
+        self.snapshot = None  # previous tracemalloc snapshot, for differences
+
+    def register(self, owner, label, size, trim=None):
+        key = self.next_id
+        self.next_id += 1
+        self.consumers[key] = (owner, label, size, trim)
+        if owner is not None:
+            owner.bind("<Destroy>", lambda e: self.consumers.pop(key, None) if e.widget is owner else None,
+                       add="+")
+        return key
+
+    def used(self):
+        return process_memory()
+
+    def free(self, used=None):
+        return max(0, self.limit - (self.used() if used is None else used))
+
+    def rows(self):
+        # (window title or "system", label, bytes), largest first
+        rows = []
+        for owner, label, size, trim in list(self.consumers.values()):
+            try:
+                rows.append((owner.title() if owner is not None else "system", label, size()))
+            except (tk.TclError, AttributeError):
+                continue
+        return sorted(rows, key=lambda row: -row[2])
+
+    def relieve(self):
+        # Evicts every cache and trims scrollback; returns the bytes given up
+        before = self.used()
+        for owner, label, size, trim in list(self.consumers.values()):
+            if trim is not None:
+                try:
+                    trim()
+                except tk.TclError:
+                    pass
+        release_memory()
+        self.relieved = time.monotonic()
+        return max(0, before - self.used())
+
+    def check(self):
+        # Called every few seconds; returns the bytes in use
+        used = self.used()
+        if used > self.limit * RAM_SOFT and time.monotonic() - self.relieved > 30:
+            self.relieve()
+            used = self.used()
+        return used
+
+    def admit(self):
+        # Whether another window may open
+        used = self.check()
+        if used > self.limit * RAM_HARD and time.monotonic() - self.relieved > 1:
+            self.relieve()
+            used = self.used()
+        if used > self.limit * RAM_HARD:
+            self.refused += 1
+            return False
+        return True
+
+    def report(self, limit=15):
+        used = self.used()
+        lines = [f"RAM {used / 1024 ** 2:.1f} / {self.limit / 1024 ** 2:.0f} MB in use, "
+                 f"{self.free(used) / 1024 ** 2:.1f} MB free (caches trimmed above {RAM_SOFT:.0%}, "
+                 f"windows refused above {RAM_HARD:.0%}; {self.refused} refused)\n"]
+        lines.extend(f"  {title[:30]:<30} {label:<20} {n / 1024:>10.1f} KB\n"
+                     for title, label, n in self.rows()[:limit])
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            lines.append(f"Tracing allocations: {current / 1024 ** 2:.1f} MB traced, "
+                         f"peak {peak / 1024 ** 2:.1f} MB\n")
+        return "".join(lines)
+
+    def trace(self, on):
+        if on and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not on and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.snapshot = None
+
+    def top_allocations(self, limit=15):
+        # Allocation sites by size, or by growth since the previous call; runs on a worker
+        if not tracemalloc.is_tracing():
+            return "Allocation tracing is off\n"
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+        if self.snapshot is None:
+            stats, title = snapshot.statistics("lineno"), "Largest allocation sites"
+        else:
+            stats, title = snapshot.compare_to(self.snapshot, "lineno"), "Growth since the last snapshot"
+        self.snapshot = snapshot
+        lines = [title + "\n"]
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            change = f" ({getattr(stat, 'size_diff', 0) / 1024:+.1f} KB)" if hasattr(stat, "size_diff") else ""
+            lines.append(f"  {stat.size / 1024:>10.1f} KB{change}  "
+                         f"{os.path.basename(frame.filename)}:{frame.lineno}\n")
+        return "".join(lines)
+
+
+# ---------- DESKTOP ICONS ----------
+class DesktopIcons:
+    # Desktop icons keyed by path. refresh() diffs a directory listing against
+    # what is shown, and widgets exist only for the columns that are on screen.
+    def __init__(self, parent, describe, x0=150, y0=30, dx=150, dy=50, max_y=500):
+        self.parent = parent
+        self.describe = describe  # (name, path, is_dir) -> (text, command)
+        self.x0, self.y0, self.dx, self.dy = x0, y0, dx, dy
+        self.rows = (max_y - y0) // dy + 1
+        self.items = {}  # path -> (sort key, name, is_dir)
+        self.order = []  # sort keys in grid order
+        self.widgets = {}  # path -> Button
+        self.slots = {}  # path -> (x, y) the widget is placed at
+        self.first_col = 0
+        self.timings = deque(maxlen=100)
+        parent.bind("<Configure>", lambda e: self.layout(), add="+")
+        parent.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1), add="+")
+        parent.bind("<Button-4>", lambda e: self.scroll(-1), add="+")
+        parent.bind("<Button-5>", lambda e: self.scroll(1), add="+")
+
+    def refresh(self, entries):
+        start = time.perf_counter()
+        added = relabeled = removed = 0
+        seen = set()
+        for name, path, is_dir in entries:
+            seen.add(path)
+            item = self.items.get(path)
+            if item is None:
+                key = (name.lower(), path)
+                self.items[path] = (key, name, is_dir)
+                bisect.insort(self.order, key)
+                added += 1
+            elif item[2] != is_dir:
+                self.items[path] = (item[0], name, is_dir)
+                widget = self.widgets.get(path)
+                if widget is not None:
+                    text, cmd = self.describe(name, path, is_dir)
+                    widget.config(text=text, command=cmd)
+                relabeled += 1
+        for path in [p for p in self.items if p not in seen]:
+            key = self.items.pop(path)[0]
+            del self.order[bisect.bisect_left(self.order, key)]
+            widget = self.widgets.pop(path, None)
+            if widget is not None:
+                widget.destroy()
+            self.slots.pop(path, None)
+            removed += 1
+        if added or removed:
+            self.layout()
+        self.report(start, added, removed, relabeled)
+
+    def visible_range(self):
+        width = self.parent.winfo_width()
+        if width <= 1:
+            width = self.parent.winfo_toplevel().winfo_width()
+        cols = max(1, -(-(width - self.x0) // self.dx))
+        return self.first_col * self.rows, (self.first_col + cols) * self.rows
+
+    def layout(self):
+        lo, hi = self.visible_range()
+        visible = set()
+        for i, key in enumerate(self.order[lo:hi], lo):
+            path = key[1]
+            visible.add(path)
+            col, row = divmod(i - self.first_col * self.rows, self.rows)
+            slot = (self.x0 + col * self.dx, self.y0 + row * self.dy)
+            widget = self.widgets.get(path)
+            if widget is None:
+                _, name, is_dir = self.items[path]
+                text, cmd = self.describe(name, path, is_dir)
+                widget = tk.Button(
+                    self.parent, text=text,
+                    bg="#1A1A1A", fg="white", bd=0,
+                    command=cmd
+                )
+                self.widgets[path] = widget
+            if self.slots.get(path) != slot:
+                widget.place(x=slot[0], y=slot[1])
+                self.slots[path] = slot
+        for path in [p for p in self.widgets if p not in visible]:
+            self.widgets.pop(path).destroy()
+            self.slots.pop(path, None)
+
+    def scroll(self, cols):
+        last_col = max(0, (len(self.order) - 1) // self.rows)
+        first_col = min(max(0, self.first_col + cols), last_col)
+        if first_col != self.first_col:
+            self.first_col = first_col
+            self.layout()
+
+    def report(self, start, added, removed, relabeled):
+        ms = (time.perf_counter() - start) * 1000
+        self.timings.append((ms, added, removed, relabeled))
+        log.debug("desktop diff +%d -%d ~%d of %d in %.3f ms (%d widgets)",
+                  added, removed, relabeled, len(self.items), ms, len(self.widgets))
+
+
+# ---------- EXPLORER VIEW ----------
+class DirListing:
+    # Entries of one directory as read so far, plus the sorted/filtered view over them.
+    # Pages come from a single vfs.scandir iterator, so d_type spares the isdir stats;
+    # sizes and dates come from the catalog in one query.
+    SORTS = ("Directory order", "Name", "Name (Z-A)", "Type", "Size", "Date modified")
+    cacheable = True
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = []  # (name, path, is_dir)
+        self.meta = {}  # path -> (is_dir, size, mtime_ns), for the entries the catalog knows
+        self.view = []  # indices into entries
+        self.sort = "Directory order"
+        self.pattern = ""
+        self.complete = False
+        self.mtime = None
+        self.it = None
+        self.loading = False
+        self.closed = False
+        self.from_cache = False
+
+    def read_page(self, count, vfs):
+        # Runs on a worker; only one page is ever in flight per listing
+        if self.it is None:
+            self.meta = {os.path.join(self.path, name): meta for name, meta in vfs.catalog.children(self.path).items()}
+            cached = vfs.listings.lookup(self.path)
+            if cached is not None:
+                self.from_cache = True
+                return cached, True
+            self.mtime = vfs.info(self.path)[2]
+            self.it = vfs.scandir(self.path)
+        page = []
+        done = True
+        for entry in self.it:
+            page.append(entry)
+            if len(page) >= count:
+                done = False
+                break
+        if done or self.closed:
+            self.it.close()
+        return page, done
+
+    def close(self):
+        # A page still being read closes the iterator itself when it finishes
+        self.closed = True
+        if self.it is not None and not self.loading:
+            self.it.close()
+
+    def wants_all(self):
+        return self.sort != "Directory order" or bool(self.pattern)
+
+    def matches(self, name):
+        return not self.pattern or self.pattern in name.lower()
+
+    def add(self, page, complete):
+        start = len(self.entries)
+        self.entries.extend(page)
+        self.complete = complete
+        if self.sort == "Directory order":
+            self.view.extend(i for i in range(start, len(self.entries)) if self.matches(self.entries[i][0]))
+        elif complete:
+            self.apply()
+
+    def apply(self):
+        # Re-sort/filter what is already in memory; the directory is not re-read
+        view = [i for i, e in enumerate(self.entries) if self.matches(e[0])]
+        if self.sort != "Directory order" and not self.complete:
+            view = []  # shown once the last page is in
+        elif self.sort == "Name":
+            view.sort(key=lambda i: self.entries[i][0].lower())
+        elif self.sort == "Name (Z-A)":
+            view.sort(key=lambda i: self.entries[i][0].lower(), reverse=True)
+        elif self.sort == "Type":
+            view.sort(key=lambda i: (not self.entries[i][2], os.path.splitext(self.entries[i][0])[1].lower(),
+                                     self.entries[i][0].lower()))
+        elif self.sort in ("Size", "Date modified"):
+            # Largest or newest first; entries the catalog has not seen yet go last
+            column = 1 if self.sort == "Size" else 2
+            view.sort(key=lambda i: (not self.entries[i][2], -self.meta.get(self.entries[i][1], (0, -1, -1))[column]))
+        self.view = view
+
+
+class SearchListing(DirListing):
+    # Explorer search results over the whole disk, as one page from the search index.
+    # Names are paths relative to the disk so results from different folders stay apart.
+    cacheable = False
+
+    def __init__(self, path, query, search):
+        super().__init__(path)
+        self.query = query
+        self.search = search
+
+    def read_page(self, count, vfs):
+        found = self.search.search(self.query)
+        self.meta = vfs.catalog.lookup(found)
+        return [(self.search.rel(p), p, self.meta[p][0] if p in self.meta else vfs.isdir(p)) for p in found], True
+
+    def wants_all(self):
+        return True
+
+    def close(self):
+        self.closed = True
+
+
+class ExplorerView:
+    # Listbox holding only the rows on screen; more pages of the directory are
+    # read as the user scrolls towards the end of what is loaded. Complete
+    # listings go to the shared ListingCache and are served from it next time.
+    def __init__(self, parent, workers, vfs, root_dir, on_navigate=None, page_size=500):
+        self.workers = workers
+        self.vfs = vfs
+        self.root_dir = root_dir
+        self.on_navigate = on_navigate
+        self.page_size = page_size
+        self.listing = None
+        self.current_dir = None
+        self.top = 0
+        self.selected_row = None
+        self.marked = {}  # path -> entry of a Ctrl/Shift-click selection
+        self.line_height = 18
+
+        self.frame = tk.Frame(parent, bg="#1A1A1A")
+        self.frame.pack(fill="both", expand=True, padx=10, pady=10)
+        self.scrollbar = tk.Scrollbar(self.frame, command=self.yview)
+        self.scrollbar.pack(side="right", fill="y")
+        self.listbox = tk.Listbox(
+            self.frame,
+            bg="#0A0A0A",
+            fg="white",
+            font=("Consolas", 11),
+            bd=0,
+            exportselection=False
+        )
+        self.listbox.pack(side="left", fill="both", expand=True)
+
+        self.listbox.bind("<Configure>", lambda e: self.render())
+        self.listbox.bind("<<ListboxSelect>>", self.on_select)
+        self.listbox.bind("<Control-Button-1>", lambda e: self.toggle_at(e.y))
+        self.listbox.bind("<Shift-Button-1>", lambda e: self.extend_to(e.y))
+        self.listbox.bind("<Control-a>", lambda e: self.mark_all())
+        self.listbox.bind("<MouseWheel>", lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        self.listbox.bind("<Button-4>", lambda e: self.scroll(-3))
+        self.listbox.bind("<Button-5>", lambda e: self.scroll(3))
+        self.listbox.bind("<Up>", lambda e: self.move(-1))
+        self.listbox.bind("<Down>", lambda e: self.move(1))
+        self.listbox.bind("<Prior>", lambda e: self.move(-self.rows()))
+        self.listbox.bind("<Next>", lambda e: self.move(self.rows()))
+        self.frame.bind("<Destroy>", lambda e: self.close() if e.widget is self.frame else None)
+
+    # -- navigation --
+    def navigate(self, path):
+        self.current_dir = path
+        self.top = 0
+        self.selected_row = None
+        self.start(path, pattern="")
+        if self.on_navigate:
+            self.on_navigate(path)
+        self.render()
+
+    def start(self, path, pattern=None):
+        old = self.listing
+        listing = DirListing(path)
+        if old is not None:
+            old.close()
+            listing.sort = old.sort
+            listing.pattern = old.pattern if pattern is None else pattern
+        self.listing = listing
+        self.marked.clear()
+        self.load_more()
+
+    def search(self, query, index):
+        # Results replace the listing; ".." goes back to the folder
+        old = self.listing
+        self.listing = SearchListing(self.current_dir, query, index)
+        if old is not None:
+            old.close()
+            self.listing.sort = old.sort
+        self.top = 0
+        self.selected_row = None
+        self.marked.clear()
+        self.load_more()
+        self.render()
+
+    def searching(self):
+        return isinstance(self.listing, SearchListing)
+
+    def refresh(self):
+        top, row = self.top, self.selected_row
+        if self.searching():
+            self.search(self.listing.query, self.listing.search)
+        else:
+            self.start(self.current_dir)
+        self.top, self.selected_row = top, row
+        self.render()
+
+    def close(self):
+        if self.listing is not None:
+            self.listing.close()
+
+    # -- paging --
+    def load_more(self):
+        listing = self.listing
+        if listing.loading or listing.complete:
+            return
+        listing.loading = True
+        self.workers.submit(listing.read_page, self.page_size, self.vfs,
+                            done=lambda r: self.page_loaded(listing, *r),
+                            error=lambda e: self.page_failed(listing, e), owner=self.frame)
+
+    def page_loaded(self, listing, page, complete):
+        listing.loading = False
+        if listing is not self.listing:
+            listing.close()
+            return
+        listing.add(page, complete)
+        if complete and listing.cacheable and not listing.from_cache:
+            self.vfs.listings.store(listing.path, listing.mtime, listing.entries)
+        self.render()
+
+    def page_failed(self, listing, e):
+        listing.loading = False
+        listing.complete = True
+        if listing is self.listing:
+            messagebox.showerror("Error", str(e))
+
+    def set_sort(self, sort):
+        self.listing.sort = sort
+        self.listing.apply()
+        self.top = 0
+        self.selected_row = None
+        self.render()
+
+    def set_filter(self, pattern):
+        self.listing.pattern = pattern.lower()
+        self.listing.apply()
+        self.top = 0
+        self.selected_row = None
+        self.render()
+
+    # -- rows --
+    def has_parent(self):
+        return self.current_dir != self.root_dir or self.searching()
+
+    def count(self):
+        return len(self.listing.view) + self.has_parent()
+
+    def entry(self, row):
+        if self.has_parent():
+            if row == 0:
+                return ("..", self.current_dir if self.searching() else os.path.dirname(self.current_dir), True)
+            row -= 1
+        return self.listing.entries[self.listing.view[row]]
+
+    def label(self, row):
+        # Name, then size and date columns when the catalog has the entry
+        name, path, is_dir = self.entry(row)
+        text = entry_icon(name, is_dir) + name
+        meta = self.listing.meta.get(path)
+        if meta is None or name == "..":
+            return text
+        size = "" if meta[0] else f"{meta[1] / 1024:.1f} KB"
+        return f"{text:<44.44} {size:>12}  {time.strftime('%Y-%m-%d %H:%M', time.localtime(meta[2] / 1e9))}"
+
+    def rows(self):
+        return max(1, self.listbox.winfo_height() // self.line_height)
+
+    def render(self):
+        if self.listing is None:
+            return
+        n, rows = self.count(), self.rows()
+        self.top = max(0, min(self.top, n - rows))
+        end = min(n, self.top + rows)
+        self.listbox.delete(0, "end")
+        if end > self.top:
+            self.listbox.insert("end", *[self.label(i) for i in range(self.top, end)])
+            first, second = self.listbox.bbox(0), self.listbox.bbox(1) if end - self.top > 1 else None
+            if first and second and second[1] > first[1]:
+                self.line_height = second[1] - first[1]
+        if not self.listing.complete and self.listing.view == [] and self.listing.wants_all():
+            self.listbox.insert("end", "… loading")
+        if self.marked:
+            for row in range(self.top, end):
+                if self.entry(row)[1] in self.marked and self.entry(row)[0] != "..":
+                    self.listbox.itemconfig(row - self.top, bg="#00585C")
+        if self.selected_row is not None and self.top <= self.selected_row < end:
+            self.listbox.selection_set(self.selected_row - self.top)
+            self.listbox.activate(self.selected_row - self.top)
+        if n:
+            self.scrollbar.set(self.top / n, end / n)
+        else:
+            self.scrollbar.set(0, 1)
+        if not self.listing.complete and (self.listing.wants_all() or end + rows >= n):
+            self.load_more()
+
+    def scroll(self, delta):
+        self.top += delta
+        self.render()
+        return "break"
+
+    def yview(self, *args):
+        n, rows = self.count(), self.rows()
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * n)
+        elif args[0] == "scroll":
+            step = rows if args[2] == "pages" else 1
+            self.top += int(args[1]) * step
+        self.render()
+
+    def move(self, delta):
+        n = self.count()
+        if not n:
+            return "break"
+        row = 0 if self.selected_row is None else min(max(0, self.selected_row + delta), n - 1)
+        self.selected_row = row
+        if row < self.top:
+            self.top = row
+        elif row >= self.top + self.rows():
+            self.top = row - self.rows() + 1
+        self.render()
+        return "break"
+
+    def on_select(self, event=None):
+        sel = self.listbox.curselection()
+        if sel:
+            self.selected_row = self.top + sel[0]
+        if self.marked:
+            self.marked.clear()
+            self.render()
+
+    def select_at(self, y):
+        row = self.top + self.listbox.nearest(y)
+        if row < self.count():
+            self.selected_row = row
+            if self.entry(row)[1] not in self.marked:
+                self.marked.clear()
+            self.render()
+
+    def markable(self, row):
+        return not (row == 0 and self.has_parent())
+
+    def toggle_at(self, y):
+        # Ctrl+click adds a row to the selection, or takes it out again
+        row = self.top + self.listbox.nearest(y)
+        if row >= self.count() or not self.markable(row):
+            return "break"
+        if not self.marked and self.selected_row is not None and self.markable(self.selected_row) \
+                and self.selected_row < self.count():
+            entry = self.entry(self.selected_row)
+            self.marked[entry[1]] = entry
+        entry = self.entry(row)
+        if self.marked.pop(entry[1], None) is None:
+            self.marked[entry[1]] = entry
+        self.selected_row = row
+        self.render()
+        return "break"
+
+    def extend_to(self, y):
+        # Shift+click selects every row between the last clicked one and this one
+        row = self.top + self.listbox.nearest(y)
+        if row >= self.count():
+            return "break"
+        anchor = row if self.selected_row is None else min(self.selected_row, self.count() - 1)
+        self.marked = {}
+        for r in range(min(anchor, row), max(anchor, row) + 1):
+            if self.markable(r):
+                entry = self.entry(r)
+                self.marked[entry[1]] = entry
+        self.selected_row = anchor
+        self.render()
+        return "break"
+
+    def mark_all(self):
+        self.marked = {}
+        for r in range(self.count()):
+            if self.markable(r):
+                entry = self.entry(r)
+                self.marked[entry[1]] = entry
+        self.render()
+        return "break"
+
+    def selected(self):
+        if self.selected_row is None or self.selected_row >= self.count():
+            return None
+        return self.entry(self.selected_row)
+
+    def selection(self):
+        # Every selected entry, without ".."
+        if self.marked:
+            return list(self.marked.values())
+        sel = self.selected()
+        return [] if sel is None or sel[0] == ".." else [sel]
+
+
+# ---------- LARGE FILES ----------
+LARGE_FILE_BYTES = 8 * 1024 * 1024
+
+
+class LargeFile:
+    # Memory-mapped file split into pages of page_lines lines. Only page start
+    # offsets are indexed, and only edited pages are re-encoded on save.
+    def __init__(self, path, page_lines=1000):
+        self.path = path
+        self.page_lines = page_lines
+        self.file = None
+        self.map = None
+        self.offsets = [0]  # byte offset where each page starts
+        self.indexed = False
+        self.closed = False
+        self.saving = False  # close() leaves the map to save() meanwhile
+        self.lock = threading.Lock()
+        self.open()
+
+    def open(self):
+        self.file = open(self.path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            if self.saving:
+                return  # save() still reads the map; it releases it when done
+        self.release()
+
+    def release(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        if self.file is not None:
+            self.file.close()
+
+    def build_index(self):
+        # Runs on a worker; pages become readable as soon as their end is found
+        pos, lines = self.offsets[-1], 0
+        find = self.map.find
+        while not self.closed:
+            nl = find(b"\n", pos)
+            if nl < 0:
+                break
+            pos = nl + 1
+            lines += 1
+            if lines == self.page_lines:
+                self.offsets.append(pos)
+                lines = 0
+        if self.closed:
+            return False
+        if self.offsets[-1] != self.size:
+            self.offsets.append(self.size)
+        self.indexed = True
+        return True
+
+    def pages(self):
+        return len(self.offsets) - 1
+
+    def read_page(self, page):
+        return self.map[self.offsets[page]:self.offsets[page + 1]].decode("utf-8", errors="replace")
+
+    def shifted(self, edits):
+        # Page offsets once edits are saved; the last one is the new size
+        shift, offsets = 0, self.offsets[:]
+        for page in range(self.pages()):
+            offsets[page] += shift
+            if page in edits:
+                shift += len(edits[page].encode("utf-8")) - (self.offsets[page + 1] - self.offsets[page])
+        offsets[-1] += shift
+        return offsets
+
+    def save(self, edits, chunk=1024 * 1024):
+        # Unchanged byte ranges are copied straight from the map into the temp file
+        def write(f):
+            pos = 0
+            for page in sorted(edits):
+                start, end = self.offsets[page], self.offsets[page + 1]
+                for i in range(pos, start, chunk):
+                    f.write(self.map[i:min(i + chunk, start)])
+                f.write(edits[page].encode("utf-8"))
+                pos = end
+            for i in range(pos, self.size, chunk):
+                f.write(self.map[i:min(i + chunk, self.size)])
+
+        offsets = self.shifted(edits)
+        with self.lock:
+            if self.closed:
+                raise ValueError("The file was closed")
+            self.saving = True
+        try:
+            # Windows cannot replace a file that is still open or mapped
+            atomic_write(self.path, write, ready=self.release)
+            self.offsets = offsets
+        finally:
+            with self.lock:
+                self.saving = False
+                if self.closed:
+                    self.release()
+                elif self.file.closed:
+                    self.open()
+
+
+# ---------- TERMINAL OUTPUT ----------
+TERMINAL_SCROLLBACK = 5000
+
+
+class TerminalOutput:
+    # Buffers terminal writes and flushes them at most once per frame, keeping
+    # at most max_lines of scrollback. What the user types lives after the
+    # "input" mark, so commands are read from there and never from the display.
+    def __init__(self, widget, max_lines=TERMINAL_SCROLLBACK, frame_ms=16):
+        self.widget = widget
+        self.max_lines = max_lines
+        self.frame_ms = frame_ms
+        self.pending = []
+        self.scheduled = None
+        widget.mark_set("input", "end-1c")
+        widget.mark_gravity("input", "left")
+        widget.bind("<Key>", self.guard, add="+")
+
+    def write(self, text):
+        self.pending.append(text)
+        if self.scheduled is None:
+            self.scheduled = self.widget.after(self.frame_ms, self.flush)
+
+    def flush(self):
+        self.scheduled = None
+        if not self.pending or not self.widget.winfo_exists():
+            return
+        text = "".join(self.pending)
+        self.pending = []
+        # Output goes in front of whatever is being typed
+        self.widget.mark_gravity("input", "right")
+        self.widget.insert("input", text)
+        self.widget.mark_gravity("input", "left")
+        lines = int(self.widget.index("end-1c").split(".")[0])
+        if lines > self.max_lines:
+            self.widget.delete("1.0", f"{lines - self.max_lines + 1}.0")
+        self.widget.see("end")
+
+    def trim(self, max_lines):
+        # Keeps less scrollback from now on, and drops the excess right away
+        self.max_lines = min(self.max_lines, max_lines)
+        lines = int(self.widget.index("end-1c").split(".")[0])
+        if lines > self.max_lines:
+            self.widget.delete("1.0", f"{lines - self.max_lines + 1}.0")
+
+    def read_input(self):
+        return self.widget.get("input", "end-1c")
+
+    def set_input(self, text):
+        self.widget.delete("input", "end")
+        self.widget.insert("end", text)
+        self.widget.mark_set("insert", "end")
+
+    def commit_input(self):
+        # The typed line becomes scrollback; a new input region starts at the end
+        line = self.read_input()
+        self.widget.mark_set("input", "end-1c")
+        return line
+
+    def clear(self):
+        self.pending = []
+        self.widget.delete("1.0", "end")
+        self.widget.mark_set("input", "end-1c")
+
+    def guard(self, event):
+        # Keep typing out of the scrollback
+        if self.widget.compare("insert", "<", "input"):
+            if event.char or event.keysym in ("BackSpace", "Delete"):
+                self.widget.mark_set("insert", "end")
+        if event.keysym == "BackSpace" and self.widget.compare("insert", "<=", "input") \
+                and not self.widget.tag_ranges("sel"):
+            return "break"
+
 
 class DarkoOS:
-    def __init__(self, root):
+    def __init__(self, root, timeline=None):
+        self.timeline = timeline or StartupTimeline(STARTED)
+        self.timeline.mark("imports")
         self.root = root
         self.root.title("DarkoOS Virtual Machine")
         self.root.geometry("1000x700")
@@ -32,8 +1195,38 @@ class DarkoOS:
         self.disk_gb = disk_gb
         self.disk_path = "v_disk"
 
-        os.makedirs(self.disk_path, exist_ok=True)
+        if disk_image:
+            self.vfs = ImageVFS(self.disk_path, disk_image, int(disk_gb * 1024 ** 3), store=disk_dedup)
+        else:
+            self.vfs = VFS(self.disk_path, quota=int(disk_gb * 1024 ** 3), store=disk_dedup)
+        # Every window is a process; pid 1 is the desktop itself
+        self.scheduler = Scheduler()
+        self.system = self.scheduler.spawn("system", system=True)
+        self.window_pids = {}  # toplevel widget path -> pid
+        self.monitor = EventMonitor(self.root, charge=self.charge)
+        self.monitor.install()
+        self.workers = WorkerPool(self.root, monitor=self.monitor, charge=self.charge)
+        if self.vfs.store is not None:
+            # Chunking and compression of large saves happen in other processes
+            self.vfs.store.executor = self.workers.process_executor()
+        self.listings = self.vfs.listings
+        self.disk_index = self.vfs.index
+        self.web = None  # FetchEngine, created when the first Browser opens
+        self.file_clipboard = None  # ("copy" or "move", [paths]) from Explorer's Copy/Cut
+        self.history = HistoryLog(os.path.join(self.disk_path, SYSTEM_DIR, "history"))  # shared by all terminals
+        self.memory = MemoryBudget(ram)
+        self.memory.register(None, "folder listings", lambda: self.listings.entry_count() * LISTING_ENTRY_BYTES,
+                             self.listings.clear)
+        self.memory.register(None, "calculator cache",
+                             lambda: darko_calc.compile_expression.cache_info().currsize * 1024,
+                             darko_calc.compile_expression.cache_clear)
+        self.memory.register(None, "history index", self.history.index_bytes)
+        self.system_bytes = self.get_system_size()
+        self.schedule()
+        self.timeline.mark("vfs ready")
         self.login_screen()
+        self.timeline.mark("login screen built")
+        after_paint(self.root, lambda: self.timeline.mark("login screen painted"))
 
     # ---------- LOGIN ----------
     def login_screen(self):
@@ -70,13 +1263,14 @@ class DarkoOS:
 
     def check_pass(self):
         if self.ent_pass.get() == self.password:
+            self.timeline.mark("unlocked")
             self.login_frame.destroy()
             self.boot_desktop()
         else:
             messagebox.showerror("Denied", "Wrong password")
 
     # ---------- DISK ----------
-    def get_disk_usage(self):
+    def get_system_size(self):
         total = 0
         # Add system file size
         system_file = os.path.join(os.path.dirname(__file__), "DarkoOS.py")
@@ -85,11 +1279,24 @@ class DarkoOS:
         config_file = os.path.join(os.path.dirname(__file__), "config.py")
         if os.path.exists(config_file):
             total += os.path.getsize(config_file)
-        for r, d, f in os.walk(self.disk_path):
-            for file in f:
-                total += os.path.getsize(os.path.join(r, file))
+        return total
+
+    def get_disk_usage(self):
+        # Never walks on the UI thread; reads 0 until the first walk is in
+        total = self.system_bytes + self.disk_index.used_bytes(wait=False)
         return round(total / (1024 * 1024), 2)  # in MB
 
+    def reconcile_disk(self):
+        # Catch changes made outside the VM without blocking the mainloop
+        def work():
+            self.system_bytes = self.get_system_size()
+            self.disk_index.reconcile()
+            self.vfs.catalog.reconcile()
+            self.vfs.search.save()
+            if self.vfs.store is not None:
+                self.vfs.store.collect()
+        self.workers.submit(work)
+
     def get_disk_stats(self):
         used = self.get_disk_usage()  # MB
         total = self.disk_gb * 1024  # MB
@@ -112,6 +1319,7 @@ class DarkoOS:
         )
         self.info.pack(side="left", padx=10)
         self.update_stats()
+        self.scheduler.every(self.system, 3, self.update_stats)
 
         tk.Button(
             self.top, text="Shutdown",
@@ -147,6 +1355,18 @@ class DarkoOS:
             command=self.open_browser
         ).place(x=30, y=180)
 
+        tk.Button(
+            self.desk, text="📈 Monitor",
+            bg="#1A1A1A", fg="white", bd=0,
+            command=self.open_monitor
+        ).place(x=30, y=230)
+
+        tk.Button(
+            self.desk, text="📋 Tasks",
+            bg="#1A1A1A", fg="white", bd=0,
+            command=self.open_task_manager
+        ).place(x=30, y=280)
+
         # Desktop context menu
         self.desk_ctx = tk.Menu(self.desk, tearoff=0)
         self.desk_ctx.add_command(label="New Folder", command=lambda: self.create_io("dir", self.refresh_desktop, self.disk_path))
@@ -162,66 +1382,125 @@ class DarkoOS:
 
         self.desk.bind("<Button-3>", popup)
 
-        self.icons = []
+        self.icons = DesktopIcons(self.desk, self.describe_icon)
+        self.desktop_entries = None
+        self.timeline.mark("desktop built")
+        after_paint(self.root, self.finish_boot)
+
+    def finish_boot(self):
+        # The listing and the disk walk wait until the empty desktop is on screen
+        self.timeline.mark("desktop painted")
+        self.timeline.on_complete = self.log_startup
         self.refresh_desktop()
 
+        def indexed(_):
+            self.timeline.mark("disk indexed")
+            self.update_stats()
+
+        self.workers.submit(self.disk_index.reconcile, done=indexed)
+        self.workers.submit(self.vfs.search.crawl, error=lambda e: None)
+        self.workers.submit(self.history.load, error=lambda e: None)
+        self.workers.submit(self.vfs.catalog.reconcile, error=lambda e: None)
+        if self.vfs.store is not None:
+            self.workers.submit(self.vfs.store.collect, done=lambda _: self.update_stats())
+        self.scheduler.every(self.system, 3, self.sync_desktop)
+        self.scheduler.every(self.system, 60, self.reconcile_disk)
+
+    def log_startup(self, timeline):
+        self.workers.submit(timeline.write, os.path.join(self.disk_path, SYSTEM_DIR, "startup.log"),
+                            error=lambda e: None)
+
     def refresh_desktop(self):
-        # Clear existing icons except default buttons
-        for icon in self.icons:
-            icon.destroy()
-        self.icons = []
-
-        x, y = 150, 30  # Start position for custom icons
-        for i in os.listdir(self.disk_path):
-            path = os.path.join(self.disk_path, i)
-            if os.path.isdir(path):
-                icon_text = "📁 " + i
-                cmd = lambda p=path: self.open_explorer(p)
-            elif i.endswith(".drk"):
-                icon_text = "⚙ " + i
-                prog = i[:-4]
-                if prog == "cmd":
-                    cmd = self.open_terminal
-                elif prog == "explorer":
-                    cmd = self.open_explorer
-                elif prog == "calculator":
-                    cmd = self.open_calculator
-                elif prog == "browser":
-                    cmd = self.open_browser
-                else:
-                    cmd = lambda p=path: self.open_file_from_terminal(p)
-            else:
-                icon_text = "📄 " + i
-                cmd = lambda p=path: self.open_file_from_terminal(p)
-
-            btn = tk.Button(
-                self.desk, text=icon_text,
-                bg="#1A1A1A", fg="white", bd=0,
-                command=cmd
-            )
-            btn.place(x=x, y=y)
-            self.icons.append(btn)
-
-            y += 50
-            if y > 500:
-                y = 30
-                x += 150
+        self.workers.submit(self.listings.get, self.disk_path, done=self.show_desktop, owner=self.desk)
+
+    def show_desktop(self, entries):
+        if entries is not self.desktop_entries:
+            first = self.desktop_entries is None
+            self.desktop_entries = entries
+            self.icons.refresh(entries)
+            if first:
+                self.timeline.mark("icons shown")
+
+    def sync_desktop(self):
+        # Picks up changes made outside the VM; a watched, cached root costs nothing
+        if not self.listings.current(self.disk_path):
+            self.refresh_desktop()
+
+    def describe_icon(self, i, path, is_dir):
+        icon_text = entry_icon(i, is_dir) + i
+        if is_dir:
+            cmd = lambda p=path: self.open_explorer(p)
+        elif i.endswith(".drk") and i[:-4] in PROGRAMS:
+            cmd = lambda p=i[:-4]: self.launch(p)
+        else:
+            cmd = lambda p=path: self.open_file_from_terminal(p)
+        return icon_text, cmd
 
     def update_stats(self):
         used, free, total = self.get_disk_stats()
+        if self.disk_index.loaded:
+            storage = f"{used:.2f} / {total:.2f} GB (Free {free:.2f} GB)"
+        else:
+            storage = f"… / {total:.2f} GB (indexing)"
+        usage = self.vfs.store.usage() if self.vfs.store is not None else None
+        if usage is not None:
+            logical, physical = (n / (1024 * 1024) for n in usage)
+            storage += f" | FILES: {logical:.1f} MB logical, {physical:.1f} MB physical"
+        used = self.memory.check()
+        ram = f"{used / 1024 ** 2:.0f} / {self.ram} MB (Free {self.memory.free(used) / 1024 ** 2:.0f} MB)"
         self.info.config(
-            text=f"USER: {self.user} | RAM: {self.ram} MB | "
-                 f"STORAGE: {used:.2f} / {total:.2f} GB (Free {free:.2f} GB)"
+            text=f"USER: {self.user} | RAM: {ram} | STORAGE: {storage}"
         )
-        self.root.after(3000, self.update_stats)
+
+    # ---------- PROCESSES ----------
+    def schedule(self):
+        # Task slices for up to SLICE_BUDGET per turn, then back to Tk for input and redraws
+        delay = self.scheduler.tick(SLICE_BUDGET)
+        ms = SCHEDULE_MS if delay is None else max(1, min(SCHEDULE_MS, int(delay * 1000)))
+        try:
+            self.root.after(ms, self.schedule)
+        except tk.TclError:
+            pass
+
+    def spawn(self, name, win):
+        # The window's process: closing the window ends it, killing it closes the window
+        process = self.scheduler.spawn(name, kill=win.destroy)
+        key = str(win)
+        self.window_pids[key] = process.pid
+
+        def destroyed(e):
+            if e.widget is win:
+                self.window_pids.pop(key, None)
+                self.scheduler.exit(process.pid)
+
+        win.bind("<Destroy>", destroyed, add="+")
+        return process
+
+    def process_of(self, widget):
+        pid = self.window_pids.get(str(widget.winfo_toplevel()))
+        return self.scheduler.processes.get(pid, self.system)
+
+    def charge(self, path, seconds, background=False):
+        # Any thread: CPU time of a callback or worker job, by the path of the widget it belongs to
+        top = "." + path.split(".")[1]
+        self.scheduler.charge(self.window_pids.get(top, self.system.pid), seconds, background)
+
+    def admit_window(self):
+        if self.memory.admit():
+            return True
+        messagebox.showerror("DarkoOS", f"Not enough RAM for another window: {self.memory.used() / 1024 ** 2:.0f} "
+                                        f"of {self.ram} MB in use. Close a window first.")
+        return False
 
     # ---------- EXPLORER ----------
     def open_explorer(self, current_dir=None):
+        if not self.admit_window():
+            return
         if current_dir is None:
             current_dir = self.disk_path
 
         exp = tk.Toplevel(self.root)
-        exp.title("Explorer - " + current_dir)
+        self.spawn("Explorer", exp)
         exp.geometry("750x500")
         exp.configure(bg="#1A1A1A")
 
@@ -242,122 +1521,429 @@ class DarkoOS:
             font=("Consolas", 10)
         ).pack(fill="x")
 
-        self.ex_list = tk.Listbox(
-            exp,
-            bg="#0A0A0A",
-            fg="white",
-            font=("Consolas", 11),
-            bd=0
-        )
-        self.ex_list.pack(fill="both", expand=True, padx=10, pady=10)
-
-        def refresh():
-            self.ex_list.delete(0, "end")
-            if current_dir != self.disk_path:
-                self.ex_list.insert("end", "📁 ..")
-            for i in os.listdir(current_dir):
-                path = os.path.join(current_dir, i)
-                if os.path.isdir(path):
-                    icon = "📁 "
-                elif i.endswith(".drk"):
-                    icon = "⚙ "
-                else:
-                    icon = "📄 "
-                self.ex_list.insert("end", icon + i)
+        bar = tk.Frame(exp, bg="#1A1A1A")
+        bar.pack(fill="x", padx=10)
+        search = tk.Entry(bar, bg="#0A0A0A", fg="white", bd=0, font=("Consolas", 10), insertbackground="white")
+        search.pack(side="left", fill="x", expand=True, ipady=3)
+        sort = tk.StringVar(value=DirListing.SORTS[0])
+        sort_menu = tk.OptionMenu(bar, sort, *DirListing.SORTS, command=lambda v: view.set_sort(v))
+        sort_menu.config(bg="#1A1A1A", fg="white", bd=0, highlightthickness=0)
+        sort_menu.pack(side="right", padx=(10, 0))
+
+        def navigated(path):
+            exp.title("Explorer - " + path)
+            sort.set(view.listing.sort)
+            search.delete(0, "end")
+            search.insert(0, view.listing.pattern)
+
+        view = ExplorerView(exp, self.workers, self.vfs, self.disk_path, on_navigate=navigated)
+        self.memory.register(exp, "listing", lambda: len(view.listing.entries) * LISTING_ENTRY_BYTES)
+
+        pending = []
+
+        def filter_later(e):
+            # Re-filter once typing pauses
+            for job in pending:
+                exp.after_cancel(job)
+            pending[:] = [exp.after(150, lambda: view.set_filter(search.get()))]
+
+        def search_disk(e):
+            # Enter searches names and contents of the whole disk
+            query = search.get().strip()
+            if not query:
+                return
+            for job in pending:
+                exp.after_cancel(job)
+            pending.clear()
+            search.delete(0, "end")
+            exp.title("Explorer - search: " + query)
+            view.search(query, self.vfs.search)
+
+        search.bind("<KeyRelease>", filter_later)
+        search.bind("<Return>", search_disk)
 
         ctx = tk.Menu(exp, tearoff=0)
-        ctx.add_command(label="New Folder", command=lambda: self.create_io("dir", refresh, current_dir))
-        ctx.add_command(label="New Text File", command=lambda: self.create_io("file", refresh, current_dir))
+        ctx.add_command(label="New Folder",
+                        command=lambda: self.create_io("dir", view.refresh, view.current_dir, view.frame))
+        ctx.add_command(label="New Text File",
+                        command=lambda: self.create_io("file", view.refresh, view.current_dir, view.frame))
+        ctx.add_separator()
+        ctx.add_command(label="Copy", command=lambda: self.copy_io(view))
+        ctx.add_command(label="Cut", command=lambda: self.copy_io(view, cut=True))
+        ctx.add_command(label="Paste", command=lambda: self.paste_io(view))
+        ctx.add_separator()
+        ctx.add_command(label="Delete", command=lambda: self.delete_io(view))
+        ctx.add_command(label="Rename", command=lambda: self.rename_io(view))
         ctx.add_separator()
-        ctx.add_command(label="Delete", command=lambda: self.delete_io(refresh, current_dir))
-        ctx.add_command(label="Rename", command=lambda: self.rename_io(refresh, current_dir))
+        snapshots = tk.Menu(ctx, tearoff=0)
+        snapshots.add_command(label="Create Snapshot", command=lambda: self.create_snapshot())
+        snapshots.add_command(label="Manage Snapshots...", command=lambda: self.open_snapshots(view))
+        ctx.add_cascade(label="Snapshots", menu=snapshots)
+        ctx.add_command(label="Refresh", command=view.refresh)
 
         def popup(e):
+            view.select_at(e.y)
             ctx.tk_popup(e.x_root, e.y_root)
             ctx.grab_release()
 
-        self.ex_list.bind("<Button-3>", popup)
-        self.ex_list.bind("<Double-1>", lambda e: self.open_item(refresh, current_dir, exp))
+        view.listbox.bind("<Button-3>", popup)
+        view.listbox.bind("<Double-1>", lambda e: self.open_item(view))
+        view.listbox.bind("<Return>", lambda e: self.open_item(view))
+        view.listbox.bind("<Delete>", lambda e: self.delete_io(view))
+        view.listbox.bind("<Control-c>", lambda e: self.copy_io(view))
+        view.listbox.bind("<Control-x>", lambda e: self.copy_io(view, cut=True))
+        view.listbox.bind("<Control-v>", lambda e: self.paste_io(view))
 
-        refresh()
+        view.navigate(current_dir)
 
-    def create_io(self, t, cb, current_dir):
+    def create_io(self, t, cb, current_dir, owner=None):
+        from tkinter import simpledialog
         name = simpledialog.askstring("Name", "Enter name:")
         if not name:
             return
-        path = os.path.join(current_dir, name)
-        if t == "dir":
-            os.mkdir(path)
-        else:
-            open(path + ".txt", "w", encoding="utf-8").close()
-        if cb:
-            cb()
-        if current_dir == self.disk_path:
-            self.refresh_desktop()
 
-    def delete_io(self, cb, current_dir):
-        sel = self.ex_list.get(tk.ACTIVE)
-        if not sel or sel == "📁 ..":
-            return
-        name = sel[2:]
-        path = os.path.join(current_dir, name)
-        if messagebox.askyesno("Confirm", f"Delete {name}?"):
-            if os.path.isdir(path):
-                os.rmdir(path)
+        def create():
+            # On the serial worker: the catalog, indexes and chunk store are updated too
+            path = self.vfs.resolve(os.path.join(current_dir, name if t == "dir" else name + ".txt"))
+            if t == "dir":
+                self.vfs.mkdir(path)
             else:
-                os.remove(path)
-            cb()
-        if current_dir == self.disk_path:
-            self.refresh_desktop()
+                self.vfs.touch(path)
 
-    def rename_io(self, cb, current_dir):
-        sel = self.ex_list.get(tk.ACTIVE)
-        if not sel or sel == "📁 ..":
+        def created(_):
+            if cb:
+                cb()
+            if current_dir == self.disk_path and cb != self.refresh_desktop:
+                self.refresh_desktop()
+
+        self.workers.submit(create, serial=True, owner=owner, done=created,
+                            error=lambda e: messagebox.showerror("Error", f"Could not create {name}: {e}"))
+
+    def delete_io(self, view):
+        sel = view.selection()
+        if not sel:
+            return
+        question = f"Delete {sel[0][0]}?" if len(sel) == 1 else f"Delete {len(sel)} items?"
+        if messagebox.askyesno("Confirm", question):
+            self.run_bulk("delete", [path for name, path, is_dir in sel], view=view)
+
+    def copy_io(self, view, cut=False):
+        sel = view.selection()
+        if sel:
+            self.file_clipboard = ("move" if cut else "copy", [path for name, path, is_dir in sel])
+
+    def paste_io(self, view):
+        if not self.file_clipboard or view.searching():
+            return
+        op, paths = self.file_clipboard
+        if op == "move":
+            paths = [p for p in paths if os.path.dirname(p) != view.current_dir]
+            self.file_clipboard = None
+            if not paths:
+                return
+        self.run_bulk(op, paths, view.current_dir, view=view)
+
+    def run_bulk(self, op, sources, target=None, view=None):
+        # Copy, move or delete on the workers, with a cancellable progress window
+        try:
+            job = BulkJob(self.vfs, op, sources, target, rename_conflicts=True)
+        except OSError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        win = tk.Toplevel(self.root)
+        win.title({"copy": "Copying", "move": "Moving", "delete": "Deleting"}[op])
+        process = self.spawn(win.title(), win)
+        win.bind("<Destroy>", lambda e: job.cancel() if e.widget is win else None, add="+")
+        win.geometry("460x120")
+        win.configure(bg="#1A1A1A")
+        win.protocol("WM_DELETE_WINDOW", job.cancel)
+        status = tk.Label(win, text="Preparing…", bg="#1A1A1A", fg="white", font=("Consolas", 9), anchor="w")
+        status.pack(fill="x", padx=10, pady=(10, 5))
+        bar = tk.Canvas(win, height=14, bg="#0A0A0A", highlightthickness=0)
+        bar.pack(fill="x", padx=10)
+        fill = bar.create_rectangle(0, 0, 0, 14, fill="#00ADB5", width=0)
+        tk.Button(win, text="Cancel", bg="#630000", fg="white", bd=0, command=job.cancel).pack(pady=10, ipadx=10)
+
+        def poll():
+            while not job.finished.is_set():
+                status.config(text=job.describe())
+                bar.coords(fill, 0, 0, bar.winfo_width() * job.fraction(), 14)
+                yield 0.1
+
+        def finished(error=None):
+            if win.winfo_exists():
+                win.destroy()
+            self.refresh_desktop()
+            if view is not None and view.frame.winfo_exists():
+                view.refresh()
+            if error is not None:
+                messagebox.showerror("Error", str(error))
+            elif job.errors:
+                messagebox.showerror("Error", f"{len(job.errors)} failed:\n" + "\n".join(job.errors[:10]))
+
+        self.workers.submit(job.run, done=lambda _: finished(), error=finished)
+        self.scheduler.add_task(process, poll(), "progress")
+
+    def rename_io(self, view):
+        sel = view.selected()
+        if not sel or sel[0] == "..":
             return
-        old_name = sel[2:]
-        old_path = os.path.join(current_dir, old_name)
+        old_name, old_path, is_dir = sel
+        old_name = os.path.basename(old_path)  # search results are named by relative path
+        current_dir = os.path.dirname(old_path)
+        from tkinter import simpledialog
         new_name = simpledialog.askstring("Rename", "Enter new name:", initialvalue=old_name)
         if not new_name or new_name == old_name:
             return
-        new_path = os.path.join(current_dir, new_name)
-        os.rename(old_path, new_path)
-        cb()
-        if current_dir == self.disk_path:
-            self.refresh_desktop()
+        def rename():
+            self.vfs.rename(old_path, self.vfs.resolve(os.path.join(current_dir, new_name)))
 
-    def open_item(self, cb, current_dir, exp):
-        sel = self.ex_list.get(tk.ACTIVE)
-        if not sel:
+        def renamed(_):
+            view.refresh()
+            if current_dir == self.disk_path:
+                self.refresh_desktop()
+
+        self.workers.submit(rename, serial=True, owner=view.frame, done=renamed,
+                            error=lambda e: messagebox.showerror("Error", f"Could not rename {old_name}: {e}"))
+
+    def create_snapshot(self):
+        self.workers.submit(self.vfs.snapshots.create, serial=True,
+                            done=lambda r: messagebox.showinfo("DarkoOS", f"Snapshot {r[0]} created"),
+                            error=lambda e: messagebox.showerror("Error", f"Could not create a snapshot: {e}"))
+
+    def open_snapshots(self, view=None):
+        if not self.admit_window():
             return
-        if sel == "📁 ..":
-            parent_dir = os.path.dirname(current_dir)
-            exp.destroy()
-            self.open_explorer(parent_dir)
+        win = tk.Toplevel(self.root)
+        win.title("Snapshots")
+        self.spawn("Snapshots", win)
+        win.geometry("560x440")
+        win.configure(bg="#1A1A1A")
+
+        names = tk.Listbox(win, bg="#0A0A0A", fg="white", font=("Consolas", 10), bd=0, height=8,
+                           exportselection=False)
+        names.pack(fill="x", padx=10, pady=(10, 0))
+        buttons = tk.Frame(win, bg="#1A1A1A")
+        buttons.pack(fill="x", padx=10, pady=5)
+        out = tk.Text(win, bg="#0A0A0A", fg="#00FF00", font=("Consolas", 10), bd=0)
+        out.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+
+        snapshots = self.vfs.snapshots
+        rows = []
+
+        def show(text):
+            out.delete("1.0", "end")
+            out.insert("1.0", text)
+
+        def load():
+            self.workers.submit(snapshots.list, done=fill, owner=win)
+
+        def fill(result):
+            rows[:] = result
+            names.delete(0, "end")
+            for name, created, files, size in result:
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created))
+                names.insert("end", f"{name}  {stamp}  {files} files  {size / 1024:.1f} KB")
+
+        def selected():
+            sel = names.curselection()
+            return rows[sel[0]][0] if sel else None
+
+        def create():
+            self.workers.submit(snapshots.create, serial=True, owner=win,
+                                done=lambda r: (show(f"Snapshot {r[0]} created ({r[1]} entries)"), load()))
+
+        def diff():
+            name = selected()
+            if name:
+                self.workers.submit(snapshots.diff, name, owner=win, done=lambda r: show_diff(name, *r))
+
+        def show_diff(name, added, removed, modified):
+            lines = [f"+ {p}" for p in added] + [f"- {p}" for p in removed] + [f"M {p}" for p in modified]
+            show(f"{name} -> now: {len(added)} added, {len(removed)} removed, {len(modified)} modified\n\n"
+                 + "\n".join(lines))
+
+        def restore():
+            name = selected()
+            if name and messagebox.askyesno("Confirm", f"Restore the disk to {name}?", parent=win):
+                self.workers.submit(snapshots.restore, name, serial=True, owner=win,
+                                    done=lambda n: restored(name, n))
+
+        def restored(name, n):
+            show(f"Restored {name} ({n} entries changed)")
+            self.refresh_desktop()
+            if view is not None and view.frame.winfo_exists():
+                view.refresh()
+
+        def delete():
+            name = selected()
+            if name and messagebox.askyesno("Confirm", f"Delete snapshot {name}?", parent=win):
+                self.workers.submit(snapshots.delete, name, serial=True, owner=win, done=lambda _: load())
+
+        for text, command in (("Create", create), ("Diff with current", diff), ("Restore", restore),
+                              ("Delete", delete)):
+            tk.Button(buttons, text=text, bg="#00ADB5", fg="black", bd=0, command=command).pack(
+                side="left", padx=(0, 5), ipadx=6)
+        load()
+
+    def open_item(self, view):
+        sel = view.selected()
+        if not sel:
             return
-        name = sel[2:]
-        path = os.path.join(current_dir, name)
-        if "📁" in sel:
-            exp.destroy()
-            self.open_explorer(path)
-        elif "⚙" in sel:
-            prog = name[:-4]
-            if prog == "cmd":
-                self.open_terminal()
-            elif prog == "explorer":
-                self.open_explorer()
-            elif prog == "calculator":
-                self.open_calculator()
-            elif prog == "browser":
-                self.open_browser()
-            else:
-                self.open_file_from_terminal(path)
+        name, path, is_dir = sel
+        if is_dir:
+            # Stay in the same window; listings already read are reused
+            view.navigate(path)
+        elif name.endswith(".drk") and name[:-4] in PROGRAMS:
+            self.launch(name[:-4])
         else:
             self.open_file_from_terminal(path)
 
+    def launch(self, target):
+        # A program name from PROGRAMS, or the path of a file to edit
+        if target == "cmd":
+            self.open_terminal()
+        elif target == "explorer":
+            self.open_explorer()
+        elif target == "calculator":
+            self.open_calculator()
+        elif target == "browser":
+            self.open_browser()
+        elif target == "monitor":
+            self.open_monitor()
+        elif target == "taskmgr":
+            self.open_task_manager()
+        else:
+            self.open_file_from_terminal(target)
+
+    # ---------- SYSTEM MONITOR ----------
+    def open_monitor(self):
+        win = tk.Toplevel(self.root)
+        win.title("System Monitor")
+        process = self.spawn("System Monitor", win)
+        win.geometry("820x560")
+        win.configure(bg="#1A1A1A")
+
+        buttons = tk.Frame(win, bg="#1A1A1A")
+        buttons.pack(fill="x", padx=10, pady=(10, 5))
+        status = tk.Label(buttons, bg="#1A1A1A", fg="#00ADB5", font=("Consolas", 9), anchor="w")
+        out = tk.Text(win, bg="#0A0A0A", fg="#00FF00", font=("Consolas", 9), bd=0, wrap="none")
+        out.pack(fill="both", expand=True, padx=10, pady=(0, 10))
+        allocations = [""]
+
+        def refresh():
+            view = out.yview()
+            out.delete("1.0", "end")
+            out.insert("1.0", self.memory.report() + "\n" + self.monitor.report(limit=40) + "\nHeartbeat lag\n"
+                       + self.monitor.lag_chart() + ("\n" + allocations[0] if allocations[0] else ""))
+            out.yview_moveto(view[0])
+
+        def trace():
+            tracing = not tracemalloc.is_tracing()
+            self.memory.trace(tracing)
+            allocations[0] = ""
+            trace_btn.config(text="Stop tracing" if tracing else "Trace allocations")
+            status.config(text="Tracing allocations; DarkoOS runs slower meanwhile" if tracing else "")
+
+        def snapshot():
+            self.workers.submit(self.memory.top_allocations, owner=win,
+                                done=lambda text: allocations.__setitem__(0, text))
+
+        def reset():
+            self.monitor.reset()
+            status.config(text="Timings reset")
+
+        def export():
+            name = time.strftime("perf-%Y%m%d-%H%M%S.json")
+            data = self.monitor.to_dict()
+            data["memory"] = {"used": self.memory.used(), "limit": self.memory.limit,
+                              "rows": [list(row) for row in self.memory.rows()]}
+            data = json.dumps(data, indent=1)
+            self.workers.submit(self.vfs.write_text, os.path.join(self.disk_path, name), data, serial=True,
+                                owner=win, done=lambda _: (status.config(text="Exported to " + name),
+                                                           self.refresh_desktop()))
+
+        for text, command in (("Reset", reset), ("Export", export), ("Free memory", self.memory.relieve),
+                              ("Snapshot", snapshot)):
+            tk.Button(buttons, text=text, bg="#00ADB5", fg="black", bd=0, command=command).pack(
+                side="left", padx=(0, 5), ipadx=6)
+        trace_btn = tk.Button(buttons, text="Stop tracing" if tracemalloc.is_tracing() else "Trace allocations",
+                              bg="#00ADB5", fg="black", bd=0, command=trace)
+        trace_btn.pack(side="left", padx=(0, 5), ipadx=6)
+        status.pack(side="left", padx=10, fill="x", expand=True)
+        refresh()
+        self.scheduler.every(process, 1, refresh)
+
+    # ---------- TASK MANAGER ----------
+    def open_task_manager(self):
+        if not self.admit_window():
+            return
+        win = tk.Toplevel(self.root)
+        win.title("Task Manager")
+        win.geometry("760x420")
+        win.configure(bg="#1A1A1A")
+        process = self.spawn("Task Manager", win)
+
+        header = tk.Label(win, bg="#1A1A1A", fg="#00ADB5", font=("Consolas", 9), anchor="w", justify="left")
+        header.pack(fill="x", padx=10, pady=(10, 0))
+        rows = tk.Listbox(win, bg="#0A0A0A", fg="white", font=("Consolas", 9), bd=0, exportselection=False,
+                          selectbackground="#00585C")
+        rows.pack(fill="both", expand=True, padx=10)
+        buttons = tk.Frame(win, bg="#1A1A1A")
+        buttons.pack(fill="x", padx=10, pady=10)
+        status = tk.Label(buttons, bg="#1A1A1A", fg="#00ADB5", font=("Consolas", 9), anchor="w")
+        pids = []
+
+        def selected():
+            sel = rows.curselection()
+            return pids[sel[0]] if sel else None
+
+        def refresh():
+            pid = selected()
+            lines = self.scheduler.report().splitlines()
+            header.config(text=lines[0])
+            rows.delete(0, "end")
+            pids[:] = [row[0] for row in self.scheduler.table()]
+            for line in lines[1:]:
+                rows.insert("end", line)
+            if pid in pids:
+                rows.selection_set(pids.index(pid))
+
+        def end_task():
+            pid = selected()
+            if pid is None:
+                return
+            try:
+                killed = self.scheduler.kill(pid)
+                status.config(text=f"Ended {killed.name} ({pid})")
+            except (ProcessLookupError, PermissionError) as e:
+                status.config(text=str(e))
+            if win.winfo_exists():
+                refresh()
+
+        def set_priority(priority):
+            pid = selected()
+            if pid is not None and pid in self.scheduler.processes:
+                self.scheduler.set_priority(pid, priority)
+                refresh()
+
+        tk.Button(buttons, text="End task", bg="#630000", fg="white", bd=0, command=end_task).pack(
+            side="left", padx=(0, 10), ipadx=6)
+        for priority in PRIORITIES:
+            tk.Button(buttons, text=priority.capitalize(), bg="#00ADB5", fg="black", bd=0,
+                      command=lambda p=priority: set_priority(p)).pack(side="left", padx=(0, 5), ipadx=6)
+        status.pack(side="left", padx=10, fill="x", expand=True)
+        refresh()
+        self.scheduler.every(process, 1, refresh)
+
     # ---------- TERMINAL ----------
     def open_terminal(self):
+        if not self.admit_window():
+            return
+        from tkinter import scrolledtext
         win = tk.Toplevel(self.root)
         win.title("Terminal")
+        process = self.spawn("Terminal", win)
         win.geometry("650x450")
 
         out = scrolledtext.ScrolledText(
@@ -366,140 +1952,106 @@ class DarkoOS:
         )
         out.pack(fill="both", expand=True)
 
-        out.insert("end", "DarkoOS Terminal\nType 'help' for commands\n> ")
+        term = TerminalOutput(out)
+        self.memory.register(win, "scrollback", lambda: text_chars(out), lambda: term.trim(TRIMMED_SCROLLBACK))
+        term.write("DarkoOS Terminal\nType 'help' for commands\n> ")
 
-        self.terminal_history = []
-        self.history_index = 0
+        shell = Shell(self.vfs, launch=self.launch, clear=term.clear, exit=win.destroy, monitor=self.monitor,
+                      scheduler=self.scheduler, history=self.history,
+                      submit=lambda fn, *args: self.workers.submit(fn, *args, error=lambda e: None, owner=win))
+        running = []
+        cursor = HistoryCursor(self.history)  # this window's place in the shared history
+        search = {}  # during Ctrl-R: the query and its remaining matches
 
         def cmd(event=None):
-            line = out.get("end-2l linestart", "end").strip()[2:]  # Remove '> '
-            if not line:
-                out.insert("end", "> ")
-                return "break"
-
-            self.terminal_history.append(line)
-            self.history_index = len(self.terminal_history)
-
-            args = line.split()
-            c = args[0].lower()
-
-            if c == "help":
-                out.insert("end", "\nAvailable commands:\n"
-                                  "help - show this list\n"
-                                  "echo <text> - print text\n"
-                                  "dir - list files\n"
-                                  "start <program> - start program (cmd, explorer, calculator, browser, file)\n"
-                                  "clear - clear screen\n"
-                                  "mkdir <name> - create folder\n"
-                                  "touch <name> - create file\n"
-                                  "rm <name> - delete file/folder\n"
-                                  "calc <expression> - calculate\n"
-                                  "exit - close terminal\n")
-            elif c == "echo" or c == "print":
-                out.insert("end", "\n>> " + " ".join(args[1:]) + "\n")
-            elif c == "dir" or c == "ls":
-                out.insert("end", "\n")
-                for f in os.listdir(self.disk_path):
-                    out.insert("end", f + "\n")
-            elif c == "clear" or c == "cls":
-                out.delete("1.0", "end")
-                out.insert("end", "> ")
+            if running:
                 return "break"
-            elif c == "start" and len(args) > 1:
-                target = args[1].lower()
-                if target == "cmd":
-                    self.open_terminal()
-                    out.insert("end", "\nStarted new terminal\n")
-                elif target == "explorer":
-                    self.open_explorer()
-                    out.insert("end", "\nStarted explorer\n")
-                elif target == "calculator":
-                    self.open_calculator()
-                    out.insert("end", "\nStarted calculator\n")
-                elif target == "browser":
-                    self.open_browser()
-                    out.insert("end", "\nStarted browser\n")
-                else:
-                    path = os.path.join(self.disk_path, target)
-                    if os.path.exists(path):
-                        if os.path.isdir(path):
-                            out.insert("end", "\nCannot start directory\n")
-                        else:
-                            self.open_file_from_terminal(path)
-                            out.insert("end", "\nOpened file\n")
-                    else:
-                        out.insert("end", "\nNot found\n")
-            elif c == "mkdir" and len(args) > 1:
-                try:
-                    os.mkdir(os.path.join(self.disk_path, args[1]))
-                    out.insert("end", "\nFolder created\n")
-                except Exception as e:
-                    out.insert("end", f"\nError: {e}\n")
-            elif c == "touch" and len(args) > 1:
-                try:
-                    open(os.path.join(self.disk_path, args[1]), "w").close()
-                    out.insert("end", "\nFile created\n")
-                except Exception as e:
-                    out.insert("end", f"\nError: {e}\n")
-            elif c == "rm" and len(args) > 1:
-                path = os.path.join(self.disk_path, args[1])
-                if os.path.exists(path):
-                    try:
-                        if os.path.isdir(path):
-                            os.rmdir(path)
-                        else:
-                            os.remove(path)
-                        out.insert("end", "\nDeleted\n")
-                    except Exception as e:
-                        out.insert("end", f"\nError: {e}\n")
-                else:
-                    out.insert("end", "\nNot found\n")
-            elif c == "calc" and len(args) > 1:
-                expression = " ".join(args[1:])
-                try:
-                    result = eval(expression)
-                    out.insert("end", f"\n>> {result}\n")
-                except Exception as e:
-                    out.insert("end", f"\nError: {e}\n")
-            elif c == "exit":
-                win.destroy()
+            term.flush()
+            line = term.commit_input().strip()
+            end_search()
+            cursor.reset()
+            if not line:
+                term.write("\n> ")
                 return "break"
-            else:
-                try:
-                    result = eval(line)
-                    out.insert("end", f"\n>> {result}\n")
-                except Exception as e:
-                    out.insert("end", f"\nUnknown command or error: {e}\n")
 
-            out.insert("end", "> ")
-            out.see("end")
+            self.history.append(line)
+            running.append(self.scheduler.add_task(process, pump(shell.stream(line)), line.split()[0]))
             return "break"
 
+        def pump(stream):
+            # One piece of output per slice, so a long calc range shares the frame with other windows
+            first = True
+            try:
+                for output in stream:
+                    if not win.winfo_exists():  # the command closed or killed its own terminal
+                        return
+                    if output:
+                        term.write("\n" + output if first else output)
+                        first = False
+                    yield
+            finally:
+                stream.close()
+                running.clear()
+            if not shell.exited:
+                term.write("> ")
+
         def arrow_up(event):
-            if self.history_index > 0:
-                self.history_index -= 1
-                out.delete("end-1l linestart+2c", "end")  # Clear current line after '> '
-                out.insert("end", self.terminal_history[self.history_index])
+            end_search()
+            text = cursor.up(term.read_input())
+            if text is not None:
+                term.set_input(text)
             return "break"
 
         def arrow_down(event):
-            if self.history_index < len(self.terminal_history) - 1:
-                self.history_index += 1
-                out.delete("end-1l linestart+2c", "end")
-                out.insert("end", self.terminal_history[self.history_index])
-            elif self.history_index == len(self.terminal_history) - 1:
-                self.history_index += 1
-                out.delete("end-1l linestart+2c", "end")
+            end_search()
+            text = cursor.down()
+            if text is not None:
+                term.set_input(text)
             return "break"
 
+        def reverse_search(event):
+            # Ctrl-R: newest command matching what is typed; again for the next older one
+            if not search:
+                search["query"] = term.read_input()
+                search["matches"] = self.history.matches(search["query"])
+                win.title(f"Terminal (history search: {search['query']})")
+            text = next(search["matches"], None)
+            if text is None:
+                out.bell()
+            else:
+                term.set_input(text)
+            return "break"
+
+        def end_search(restore=False):
+            if not search:
+                return
+            if restore:
+                term.set_input(search["query"])
+            search.clear()
+            if win.winfo_exists():
+                win.title("Terminal")
+
+        def key(event):
+            # Any other key keeps the match found and ends the search; Escape restores the query
+            if event.keysym == "Escape" and search:
+                end_search(restore=True)
+                return "break"
+            if event.char or not event.keysym.endswith(("_L", "_R")):
+                end_search()
+
         out.bind("<Return>", cmd)
         out.bind("<Up>", arrow_up)
         out.bind("<Down>", arrow_down)
+        out.bind("<Control-r>", reverse_search)
+        out.bind("<Key>", key, add="+")
 
     # ---------- CALCULATOR ----------
     def open_calculator(self):
+        if not self.admit_window():
+            return
         calc = tk.Toplevel(self.root)
         calc.title("Calculator")
+        self.spawn("Calculator", calc)
         calc.geometry("300x400")
         calc.configure(bg="#1A1A1A")
 
@@ -526,7 +2078,7 @@ class DarkoOS:
     def calc_button(self, text):
         if text == "=":
             try:
-                result = str(eval(self.calc_entry.get()))
+                result = str(darko_calc.evaluate(self.calc_entry.get()))
                 self.calc_entry.delete(0, tk.END)
                 self.calc_entry.insert(tk.END, result)
             except Exception as e:
@@ -538,72 +2090,305 @@ class DarkoOS:
         self.calc_entry.delete(0, tk.END)
 
     # ---------- BROWSER ----------
+    def load_browser(self):
+        # tkhtmlview and the HTTP stack are only imported once a Browser opens
+        if self.web is None:
+            import importlib.util
+            if importlib.util.find_spec("tkhtmlview") is None:
+                messagebox.showerror("Error", "tkhtmlview not found. Install with 'pip install tkhtmlview'")
+                return False
+            import darko_web
+            cache = darko_web.PageCache(os.path.join(self.disk_path, SYSTEM_DIR, "web"), index=self.disk_index)
+            self.web = darko_web.FetchEngine(cache, darko_web.HTTPPool(), prefetch_links=4 if web_prefetch else 0)
+            self.memory.register(None, "web page cache", lambda: cache.mem_bytes, cache.trim)
+        return True
+
     def open_browser(self):
+        if not self.admit_window() or not self.load_browser():
+            return
         win = tk.Toplevel(self.root)
         win.title("Browser")
+        process = self.spawn("Browser", win)
         win.geometry("800x600")
 
         frame = tk.Frame(win, bg="#1A1A1A")
         frame.pack(fill="x")
 
-        self.url_entry = tk.Entry(frame, bg="#0A0A0A", fg="white", font=("Arial", 14), bd=0, width=50)
-        self.url_entry.pack(side="left", padx=10, pady=5, fill="x", expand=True)
-        self.url_entry.insert(0, "https://www.google.com")
+        # Per-window state; history is served from the page cache
+        tab = {"history": [], "pos": -1, "win": win, "process": process, "render": None}
 
-        tk.Button(frame, text="Go", bg="#00ADB5", fg="black", bd=0,
-                  command=self.load_page).pack(side="right", padx=10)
+        tk.Button(frame, text="◀", bg="#1A1A1A", fg="white", bd=0,
+                  command=lambda: self.browser_step(tab, -1)).pack(side="left", padx=(10, 0))
+        tk.Button(frame, text="▶", bg="#1A1A1A", fg="white", bd=0,
+                  command=lambda: self.browser_step(tab, 1)).pack(side="left", padx=(5, 0))
 
-        self.browser_content = tk.Frame(win)
-        self.browser_content.pack(fill="both", expand=True)
+        tab["url_entry"] = tk.Entry(frame, bg="#0A0A0A", fg="white", font=("Arial", 14), bd=0, width=50)
+        tab["url_entry"].pack(side="left", padx=10, pady=5, fill="x", expand=True)
+        tab["url_entry"].insert(0, "https://www.google.com")
+        tab["url_entry"].bind("<Return>", lambda e: self.load_page(tab))
 
-        self.load_page()  # Load initial page
-
-    def load_page(self):
-        url = self.url_entry.get()
-        try:
-            with urllib.request.urlopen(url) as response:
-                content = response.read().decode('utf-8')
-
-            for widget in self.browser_content.winfo_children():
-                widget.destroy()
-
-            html_label = HTMLLabel(self.browser_content, html=content)
-            html_label.pack(fill="both", expand=True)
-        except Exception as e:
+        tk.Button(frame, text="Go", bg="#00ADB5", fg="black", bd=0,
+                  command=lambda: self.load_page(tab)).pack(side="right", padx=10)
+
+        tab["status"] = tk.Label(win, bg="#1A1A1A", fg="#00ADB5", font=("Consolas", 9), anchor="w")
+        tab["status"].pack(fill="x", side="bottom")
+
+        tab["content"] = tk.Frame(win)
+        tab["content"].pack(fill="both", expand=True)
+        self.memory.register(win, "page", lambda: sum(text_chars(w) for w in tab["content"].winfo_children()
+                                                      if w.winfo_class() == "Text"))
+
+        self.load_page(tab)  # Load initial page
+
+    def browser_step(self, tab, step):
+        pos = tab["pos"] + step
+        if 0 <= pos < len(tab["history"]):
+            tab["pos"] = pos
+            self.load_page(tab, tab["history"][pos], push=False)
+
+    def load_page(self, tab, url=None, push=True):
+        # Typed URLs are revalidated; back/forward use the cached copy as is
+        import darko_web
+        if url is None:
+            url = tab["url_entry"].get().strip()
+        if not url:
+            return
+        if "://" not in url:
+            url = "https://" + url
+        tab["url_entry"].delete(0, "end")
+        tab["url_entry"].insert(0, url)
+        if push:
+            del tab["history"][tab["pos"] + 1:]
+            tab["history"].append(url)
+            tab["pos"] = len(tab["history"]) - 1
+        win = tab["win"]
+        tab["status"].config(text="Loading " + url)
+
+        def progress(received, length):
+            total = f" / {int(length) // 1024} KB" if length and length.isdigit() else ""
+            self.workers.post(tab["status"].config, {"text": f"Loading {url}: {received // 1024} KB{total}"},
+                              owner=win)
+
+        def fetch():
+            page = self.web.fetch(url, progress, push)
+            title, chunks = darko_web.split_html(page.text())
+            return page, title, chunks
+
+        def show(result):
+            page, title, chunks = result
+            if tab["history"][tab["pos"]] != url:
+                return  # a newer navigation already started
+            # Redirects may have landed somewhere else; history keeps the URL the cache knows
+            tab["url_entry"].delete(0, "end")
+            tab["url_entry"].insert(0, page.final_url)
+            self.render_page(tab, chunks)
+            win.title("Browser - " + (title or page.final_url))
+            stats = self.web.pool.stats()
+            tab["status"].config(text=f"{page.final_url}  ({len(page.body) // 1024} KB, {page.charset}) | "
+                                      f"conn reuse {stats['hits']}/{stats['hits'] + stats['misses']}, "
+                                      f"ttfb p50 {stats['ttfb_ms_p50']} ms")
+            self.workers.submit(self.web.prefetch, page, error=lambda e: None)
+
+        def failed(e):
+            tab["status"].config(text="")
             messagebox.showerror("Error", f"Failed to load page: {e}")
 
+        self.workers.submit(fetch, done=show, error=failed, owner=win)
+
+    def render_page(self, tab, chunks, cap=None):
+        # One batch per slice of the window's process until the cap; "Load more" lifts it
+        import darko_web
+        from tkhtmlview import HTMLLabel
+        cap = cap or darko_web.RENDER_CAP_BYTES
+        if tab["render"] is not None:
+            self.scheduler.cancel(tab["render"])
+        for widget in tab["content"].winfo_children():
+            widget.destroy()
+
+        html_label = HTMLLabel(tab["content"], html="")
+        html_label.pack(fill="both", expand=True)
+        more = tk.Button(tab["content"], text="Load more", bg="#00ADB5", fg="black", bd=0)
+        state = {"next": 0, "limit": cap}
+
+        def steps():
+            # Every render lays out the whole prefix again, so each batch is at least
+            # as large as what is already shown and the total work stays linear
+            while state["next"] < len(chunks) and state["limit"] > 0:
+                batch = []
+                shown = len(getattr(html_label, "rendered", ""))
+                size = 0
+                while state["next"] < len(chunks) and state["limit"] > 0 and (not batch or size < shown):
+                    chunk = chunks[state["next"]]
+                    batch.append(chunk)
+                    size += len(chunk)
+                    state["next"] += 1
+                    state["limit"] -= len(chunk)
+                darko_web.append_html(html_label, "".join(batch))
+                yield
+            if state["next"] < len(chunks):
+                more.pack(fill="x", side="bottom", before=html_label)
+
+        def render():
+            tab["render"] = self.scheduler.add_task(tab["process"], steps(), "render")
+
+        def load_more():
+            more.pack_forget()
+            state["limit"] = cap
+            render()
+
+        more.config(command=load_more)
+        render()
+
     def open_file_from_terminal(self, path):
+        if not self.admit_window():
+            return
+        from tkinter import scrolledtext
         win = tk.Toplevel(self.root)
         win.title(os.path.basename(path))
+        self.spawn(os.path.basename(path), win)
 
         area = scrolledtext.ScrolledText(
             win, bg="#0F0F0F", fg="white",
-            font=("Consolas", 11)
+            font=("Consolas", 11), undo=True
         )
         area.pack(fill="both", expand=True)
 
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                area.insert("1.0", f.read())
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-
-        tk.Button(
+        save_btn = tk.Button(
             win, text="SAVE",
-            bg="#00ADB5", fg="black",
+            bg="#00ADB5", fg="black", state="disabled",
             command=lambda: self.save_file(path, area.get("1.0", "end-1c"))
-        ).pack(fill="x")
-
-    def save_file(self, path, content):
+        )
+        save_btn.pack(fill="x")
+        self.memory.register(win, "editor buffer", lambda: text_chars(area))
+
+        def read():
+            if self.vfs.host_files and self.vfs.getsize(path) > LARGE_FILE_BYTES:
+                return None
+            return self.vfs.read_text(path)
+
+        def show(text):
+            if text is None:
+                self.open_large_file(path, win, area, save_btn)
+                return
+            area.insert("1.0", text)
+            area.edit_reset()
+            save_btn.config(state="normal")
+
+        self.workers.submit(read, done=show, owner=win)
+
+    def open_large_file(self, path, win, area, save_btn):
+        # Only one page of the file is ever inside the widget
         try:
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(content)
-            messagebox.showinfo("DarkoOS", "Saved")
+            doc = LargeFile(path)
         except Exception as e:
             messagebox.showerror("Error", str(e))
+            return
+        edits = {}  # page -> edited text
+        state = {"page": 0, "shown": False, "saving": False, "pending": {}}
+        self.memory.register(win, "unsaved pages", lambda: sum(len(t) for t in list(edits.values())))
+
+        bar = tk.Frame(win, bg="#1A1A1A")
+        bar.pack(fill="x", before=area)
+        status = tk.Label(bar, bg="#1A1A1A", fg="#00ADB5", font=("Consolas", 10))
+
+        def keep_edits():
+            if area.edit_modified():
+                edits[state["page"]] = area.get("1.0", "end-1c")
+
+        def show_page(page):
+            if state["saving"] or not 0 <= page < doc.pages():
+                return
+            keep_edits()
+            state["page"] = page
+            state["shown"] = True
+            text = edits[page] if page in edits else doc.read_page(page)
+            area.delete("1.0", "end")
+            area.insert("1.0", text)
+            area.edit_reset()
+            area.edit_modified(False)
+            update_status()
+
+        def update_status():
+            total = f"{doc.pages()}" if doc.indexed else f"{doc.pages()}+ (indexing)"
+            status.config(text=f"Page {state['page'] + 1} / {total}  ({doc.size / (1024 * 1024):.1f} MB)")
+
+        def indexing():
+            # Poll the background indexer until the first page and then the whole file is ready
+            while not doc.closed:
+                if not state["shown"] and doc.pages():
+                    show_page(0)
+                update_status()
+                if doc.indexed:
+                    save_btn.config(state="normal")
+                    return
+                yield 0.2
+
+        def save():
+            keep_edits()
+            area.edit_modified(False)
+            if not edits:
+                messagebox.showinfo("DarkoOS", "Saved")
+                return
+            pending = state["pending"] = dict(edits)
+            state["saving"] = True
+
+            def write():
+                self.vfs.check_space(path, doc.shifted(pending)[-1])
+                doc.save(pending)
+                self.vfs.changed(path)
+
+            def saved(_):
+                if not win.winfo_exists():
+                    return
+                state["saving"] = False
+                state["pending"] = {}
+                for page in pending:
+                    if edits.get(page) is pending[page]:
+                        del edits[page]
+                update_status()
+                messagebox.showinfo("DarkoOS", "Saved")
+
+            def failed(e):
+                if win.winfo_exists():
+                    state["saving"] = False
+                    state["pending"] = {}
+                messagebox.showerror("Error", f"Could not save {os.path.basename(path)}: {e}")
+
+            # Not owned by the window: a save already asked for must land even if it is closed
+            self.workers.submit(write, done=saved, error=failed, serial=True)
+
+        def close():
+            keep_edits()
+            unsaved = [page for page in edits if state["pending"].get(page) is not edits[page]]
+            if unsaved and not messagebox.askyesno("Confirm", f"Close {os.path.basename(path)} without saving "
+                                                   f"{len(unsaved)} edited page(s)?", parent=win):
+                return
+            win.destroy()
+
+        tk.Button(bar, text="◀", bg="#1A1A1A", fg="white", bd=0,
+                  command=lambda: show_page(state["page"] - 1)).pack(side="left", padx=5)
+        tk.Button(bar, text="▶", bg="#1A1A1A", fg="white", bd=0,
+                  command=lambda: show_page(state["page"] + 1)).pack(side="left", padx=5)
+        status.pack(side="left", padx=10)
+        area.bind("<Control-Prior>", lambda e: show_page(state["page"] - 1) or "break")
+        area.bind("<Control-Next>", lambda e: show_page(state["page"] + 1) or "break")
+        save_btn.config(command=save, state="disabled")
+        win.protocol("WM_DELETE_WINDOW", close)
+        win.bind("<Destroy>", lambda e: doc.close() if e.widget is win else None, add="+")
+
+        self.workers.submit(doc.build_index, owner=win)
+        self.scheduler.add_task(self.process_of(win), indexing(), "indexing")
+
+    def save_file(self, path, content):
+        # Writes go through the serial worker so saves of one file land in order
+        def write():
+            self.vfs.write_text(path, content)
+
+        self.workers.submit(write, done=lambda _: messagebox.showinfo("DarkoOS", "Saved"), serial=True)
 
 
 if __name__ == "__main__":
+    setup_logging()
     root = tk.Tk()
-    DarkoOS(root)
+    DarkoOS(root, StartupTimeline(STARTED, echo="--timeline" in sys.argv[1:] or bool(os.environ.get("DARKOOS_TIMELINE"))))
     root.mainloop()
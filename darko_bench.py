@@ -0,0 +1,504 @@
+# DarkoOS benchmarks: synthetic v_disk trees and timings of the hot paths.
+#
+# Headless by default: disk usage, listings, search, file round trips and
+# terminal commands through darko_core, and page loads through darko_web
+# against a local HTTP server. --gui also drives the Tk desktop, Explorer,
+# editor, terminal and Browser (under xvfb-run on a machine without a
+# display). Results go to a JSON file; with --baseline the run fails when a
+# timing got slower than the tolerance allows.
+#
+#     python darko_bench.py --files 1000 10000 --out bench.json
+#     python darko_bench.py --baseline bench.json
+#     xvfb-run python darko_bench.py --gui --files 1000
+
+import argparse
+import http.server
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+
+from darko_core import CODECS, SYSTEM_DIR, ImageVFS, SearchIndex, Shell, VFS
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+FANOUT = 8  # folders per level in the deep layout
+LEAF_FILES = 64  # files per folder in the deep layout
+BIG_TREE = 100000  # from this many files, whole-tree benchmarks run once
+
+
+# ---------- TREES ----------
+def vocabulary(rng, count=2000):
+    return ["".join(rng.choice(LETTERS) for _ in range(rng.randint(3, 9))) for _ in range(count)]
+
+
+def text_blob(rng, words, size):
+    out, n = [], 0
+    while n < size:
+        line = " ".join(rng.choice(words) for _ in range(10))
+        out.append(line)
+        n += len(line) + 1
+    return "\n".join(out)[:size]
+
+
+def file_paths(layout, files):
+    # Relative paths of the synthetic files, folders before the files in them
+    if layout == "flat":
+        return [f"file{i:07d}.txt" for i in range(files)]
+    depth = max(1, math.ceil(math.log(max(files / LEAF_FILES, 1), FANOUT)))
+    paths = []
+    for i in range(files):
+        leaf, digits = i // LEAF_FILES, []
+        for _ in range(depth):
+            leaf, digit = divmod(leaf, FANOUT)
+            digits.append(f"d{digit}")
+        paths.append(os.path.join(*reversed(digits), f"file{i:07d}.txt"))
+    return paths
+
+
+def populate(vfs, layout, files, small_bytes, large, large_mb, seed=1):
+    # Host trees are written with plain files; fsync per file would dominate
+    rng = random.Random(seed)
+    words = vocabulary(rng)
+    image = isinstance(vfs, ImageVFS)
+
+    def put(path, data):
+        if image:
+            vfs.write_raw(path, data)
+        else:
+            with open(path, "wb") as f:
+                f.write(data)
+
+    made = set()
+    for rel in file_paths(layout, files):
+        folder = os.path.dirname(rel)
+        if folder and folder not in made:
+            vfs.makedirs_raw(os.path.join(vfs.root, folder))
+            made.add(folder)
+        size = rng.randint(small_bytes // 8, small_bytes * 2)
+        put(os.path.join(vfs.root, rel), text_blob(rng, words, size).encode())
+    if large:
+        vfs.makedirs_raw(os.path.join(vfs.root, "large"))
+        line = (text_blob(rng, words, 100) + "\n").encode()
+        body = line * (large_mb * 1024 * 1024 // len(line))
+        for i in range(large):
+            put(os.path.join(vfs.root, "large", f"large{i}.txt"), body)
+    return words
+
+
+def open_disk(workdir, args):
+    disk = os.path.join(workdir, "v_disk")
+    if args.image:
+        return ImageVFS(disk, os.path.join(workdir, "v_disk.img"), int(args.size_gb * 1024 ** 3), store=args.dedup)
+    return VFS(disk, store=args.dedup)
+
+
+def prepare(base, layout, files, args):
+    # One workspace per dataset, reused while its spec stays the same
+    spec = {"layout": layout, "files": files, "small_bytes": args.small_bytes, "large": args.large,
+            "large_mb": args.large_mb, "image": bool(args.image), "dedup": args.dedup}
+    workdir = os.path.join(base, f"{layout}-{files}")
+    marker = os.path.join(workdir, "tree.json")
+    try:
+        with open(marker, "r", encoding="utf-8") as f:
+            if json.load(f) == spec:
+                return workdir, open_disk(workdir, args), vocabulary(random.Random(1))
+    except (OSError, ValueError):
+        pass
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(workdir)
+    start = time.perf_counter()
+    vfs = open_disk(workdir, args)
+    words = populate(vfs, layout, files, args.small_bytes, args.large, args.large_mb)
+    with open(marker, "w", encoding="utf-8") as f:
+        json.dump(spec, f)
+    print(f"  generated {layout}-{files} in {time.perf_counter() - start:.1f} s", file=sys.stderr)
+    return workdir, vfs, words
+
+
+# ---------- TIMING ----------
+def measure(fn, repeat=5, warmup=1, setup=None, ops=1):
+    # Milliseconds per run (per op when one run does ops of them); setup is not timed
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+    runs = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000 / ops)
+    result = {"median_ms": round(statistics.median(runs), 4), "min_ms": round(min(runs), 4),
+              "max_ms": round(max(runs), 4), "runs": repeat}
+    if ops > 1:
+        result["ops"] = ops
+        result["ops_per_s"] = round(1000 / result["median_ms"]) if result["median_ms"] else None
+    return result
+
+
+class Suite:
+    def __init__(self, only=None):
+        self.only = only
+        self.results = {}
+
+    def run(self, name, fn, **kwargs):
+        if self.only and not any(part in name for part in self.only):
+            return
+        try:
+            result = measure(fn, **kwargs)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+        self.results[name] = result
+        shown = result.get("error") or f"{result['median_ms']:.3f} ms"
+        print(f"  {name:<44} {shown}", file=sys.stderr)
+
+
+# ---------- CORE BENCHMARKS ----------
+def bench_core(suite, prefix, vfs, words, files, large):
+    whole = {"repeat": 1, "warmup": 0} if files >= BIG_TREE else {"repeat": 5}
+    root = vfs.root
+    suite.run(f"{prefix}/disk_index_reconcile", vfs.index.reconcile, **whole)
+    suite.run(f"{prefix}/get_disk_usage", lambda: [vfs.index.used_bytes(wait=False) for _ in range(1000)],
+              ops=1000)
+    suite.run(f"{prefix}/listing_root_cold", lambda: vfs.listings.get(root),
+              setup=lambda: vfs.listings.invalidate(root))
+    suite.run(f"{prefix}/listing_root_cached", lambda: [vfs.listings.get(root) for _ in range(100)], ops=100)
+    suite.run(f"{prefix}/walk_tree", lambda: sum(1 for _ in vfs.walk()), **whole)
+
+    index_path = os.path.join(root, SYSTEM_DIR, "search.idx")
+
+    def fresh_search():
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        vfs.search = SearchIndex(vfs, index_path)
+
+    suite.run(f"{prefix}/search_crawl_cold", lambda: vfs.search.crawl(), setup=fresh_search, **whole)
+    suite.run(f"{prefix}/search_crawl_saved", lambda: vfs.search.crawl(),
+              setup=lambda: (vfs.search.save(), setattr(vfs, "search", SearchIndex(vfs, index_path))), **whole)
+    suite.run(f"{prefix}/search_find", lambda: vfs.search.find("file00012"))
+    suite.run(f"{prefix}/search_grep", lambda: vfs.search.grep(f"{words[7]} {words[11]}"))
+
+    catalog = vfs.catalog
+
+    def empty_catalog():
+        catalog.query("DELETE FROM entries")
+        catalog.reconciled = False
+
+    suite.run(f"{prefix}/catalog_reconcile_cold", catalog.reconcile, setup=empty_catalog, **whole)
+    suite.run(f"{prefix}/catalog_reconcile_warm", catalog.reconcile, **whole)
+    suite.run(f"{prefix}/catalog_largest", lambda: catalog.largest(20))
+    suite.run(f"{prefix}/catalog_recent", lambda: catalog.recent(20))
+    suite.run(f"{prefix}/catalog_children_root", lambda: catalog.children(root))
+    suite.run(f"{prefix}/catalog_folder_totals", lambda: catalog.folder_totals(root), **whole)
+
+    small = os.path.join(root, "bench_roundtrip.txt")
+    text = "DarkoOS benchmark line\n" * 200
+
+    def roundtrip(path, content):
+        vfs.write_text(path, content)
+        return vfs.read_text(path)
+
+    suite.run(f"{prefix}/file_roundtrip_small", lambda: [roundtrip(small, text) for _ in range(20)], ops=20)
+    if vfs.exists(small):
+        vfs.remove(small)
+    if large:
+        path = os.path.join(root, "large", "large0.txt")
+        content = vfs.read_text(path)
+        suite.run(f"{prefix}/file_roundtrip_large", lambda: roundtrip(path, content), repeat=3)
+
+    shell = Shell(vfs)
+    commands = ["echo hello", "calc 2+3*4", "calc sqrt(2)**10", "mkdir bench_dir", "touch bench_dir/a.txt",
+                "find file0001", "rm -r bench_dir", "nosuchcommand"]
+    suite.run(f"{prefix}/shell_command", lambda: [shell.run(c) for c in commands * 5], ops=len(commands) * 5)
+    suite.run(f"{prefix}/shell_dir", lambda: shell.run("dir"), **whole)
+
+
+# ---------- WEB ----------
+class PageHandler(http.server.BaseHTTPRequestHandler):
+    # /page/<n>: a generated page with links and an ETag, so revalidation gets a 304
+    body = b""
+
+    def do_GET(self):
+        etag = '"darko-bench"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.send_header("ETag", etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def page_body(words, paragraphs=2000):
+    rng = random.Random(2)
+    parts = ["<html><head><title>DarkoOS bench</title><style>p{color:red}</style></head><body>"]
+    for i in range(paragraphs):
+        parts.append(f"<h3>{rng.choice(words)}</h3><p>{' '.join(rng.choice(words) for _ in range(20))} "
+                     f"<a href=\"/page/{i}\">link {i}</a></p>")
+    parts.append("</body></html>")
+    return "".join(parts).encode()
+
+
+def start_server(words):
+    PageHandler.body = page_body(words)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), PageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def bench_web(suite, base_url, workdir):
+    import darko_web
+    cache_dir = os.path.join(workdir, "web-cache")
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    engine = darko_web.FetchEngine(darko_web.PageCache(cache_dir), darko_web.HTTPPool())
+    counter = iter(range(10 ** 9))
+    suite.run("web/fetch_cold", lambda: engine.fetch(f"{base_url}/page/{next(counter)}", revalidate=True))
+    url = f"{base_url}/page/cached"
+    engine.fetch(url)
+    suite.run("web/fetch_revalidate", lambda: engine.fetch(url, revalidate=True))
+    suite.run("web/fetch_history", lambda: engine.fetch(url, revalidate=False))
+    text = engine.fetch(url).text()
+    suite.run("web/split_html", lambda: darko_web.split_html(text))
+    engine.pool.close()
+
+
+# ---------- GUI ----------
+def settle(root, done, timeout=120):
+    # Runs the mainloop until done() holds, as a user would wait for it
+    deadline = time.perf_counter() + timeout
+    while not done():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("GUI did not finish in time")
+        root.update()
+
+
+def find_widget(widget, cls, text=None):
+    for child in widget.winfo_children():
+        if child.winfo_class() == cls and (text is None or child.cget("text") == text):
+            return child
+        found = find_widget(child, cls, text)
+        if found is not None:
+            return found
+    return None
+
+
+def new_window(root, open_it):
+    before = set(root.winfo_children())
+    open_it()
+    return next(w for w in root.winfo_children() if w not in before)
+
+
+def bench_gui(suite, prefix, workdir, args, base_url):
+    import tkinter as tk
+
+    # The desktop reads config.py; the benchmark brings its own
+    config = types.ModuleType("config")
+    config.user, config.passw, config.ram, config.disk_gb = "bench", "bench", 4, args.size_gb
+    config.disk_image = "v_disk.img" if args.image else None
+    config.disk_dedup = args.dedup
+    sys.modules["config"] = config
+    import OS
+
+    notes = []
+    OS.messagebox.showinfo = lambda *a, **k: notes.append(a)
+    OS.messagebox.showerror = lambda *a, **k: notes.append(a)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    root = tk.Tk()
+    try:
+        app = OS.DarkoOS(root)
+        app.ent_pass.insert(0, "bench")
+        app.check_pass()
+        settle(root, lambda: app.disk_index.loaded and app.desktop_entries is not None)
+
+        suite.run(f"{prefix}/gui_get_disk_usage", lambda: [app.get_disk_usage() for _ in range(1000)], ops=1000)
+
+        shown = []
+        show_desktop = app.show_desktop
+        app.show_desktop = lambda entries: (show_desktop(entries), shown.append(entries))
+
+        def refresh_desktop():
+            shown.clear()
+            app.refresh_desktop()
+            settle(root, lambda: shown)
+            root.update_idletasks()
+
+        suite.run(f"{prefix}/gui_refresh_desktop_cold", refresh_desktop,
+                  setup=lambda: app.listings.invalidate(app.disk_path))
+        suite.run(f"{prefix}/gui_refresh_desktop_cached", refresh_desktop)
+
+        win = tk.Toplevel(root)
+        view = OS.ExplorerView(win, app.workers, app.vfs, app.disk_path)
+        view.navigate(app.disk_path)
+
+        def refresh_explorer():
+            view.refresh()
+            listing = view.listing
+            settle(root, lambda: not listing.loading and (listing.complete or listing.entries))
+            root.update_idletasks()
+
+        suite.run(f"{prefix}/gui_explorer_refresh_cold", refresh_explorer,
+                  setup=lambda: app.listings.invalidate(app.disk_path))
+        suite.run(f"{prefix}/gui_explorer_refresh_cached", refresh_explorer)
+        win.destroy()
+
+        small = os.path.join(app.disk_path, "bench_editor.txt")
+        app.vfs.write_text(small, "DarkoOS benchmark line\n" * 2000)
+
+        def editor_roundtrip(path):
+            editor = new_window(root, lambda: app.open_file_from_terminal(path))
+            save = find_widget(editor, "Button", "SAVE")
+            settle(root, lambda: str(save.cget("state")) == "normal")
+            notes.clear()
+            save.invoke()
+            settle(root, lambda: notes)
+            editor.destroy()
+
+        suite.run(f"{prefix}/gui_open_save_small", lambda: editor_roundtrip(small))
+        if args.large:
+            suite.run(f"{prefix}/gui_open_save_large",
+                      lambda: editor_roundtrip(os.path.join(app.disk_path, "large", "large0.txt")), repeat=3)
+        app.vfs.remove(small)
+
+        terminal = new_window(root, app.open_terminal)
+        out = find_widget(terminal, "Text")
+
+        def type_commands():
+            for line in ("echo hello", "calc 2+3*4", "mkdir bench_dir", "rm -r bench_dir", "find file0001"):
+                out.insert("end", line)
+                out.event_generate("<Return>")
+                settle(root, lambda: out.get("end-3c", "end-1c") == "> ")
+
+        suite.run(f"{prefix}/gui_terminal_command", type_commands, ops=5)
+        terminal.destroy()
+
+        if app.load_browser() and base_url:
+            tabs = []
+            load_page = app.load_page
+            # The new window's own start page is not fetched; only local pages are
+            app.load_page = lambda tab, url=None, push=True: (tabs.append(tab) if url is None
+                                                              else load_page(tab, url, push))
+            app.open_browser()
+            tab = tabs[0]
+            counter = iter(range(10 ** 9))
+
+            def browse(fresh):
+                url = f"{base_url}/page/gui{next(counter) if fresh else ''}"
+                load_page(tab, url)
+                settle(root, lambda: tab["status"].cget("text").startswith(url + "  ("))
+                root.update_idletasks()
+
+            suite.run(f"{prefix}/gui_load_page_cold", lambda: browse(True), repeat=3)
+            suite.run(f"{prefix}/gui_load_page_revalidate", lambda: browse(False), repeat=3)
+            tab["win"].destroy()
+    finally:
+        root.destroy()
+        os.chdir(cwd)
+
+
+# ---------- RESULTS ----------
+def compare(results, baseline, tolerance, floor_ms):
+    # Regressions as (name, baseline ms, current ms)
+    slower = []
+    for name, result in sorted(results.items()):
+        old = baseline.get(name)
+        if not old or "median_ms" not in old or "median_ms" not in result:
+            continue
+        before, now = old["median_ms"], result["median_ms"]
+        if now > before * (1 + tolerance) and now - before > floor_ms:
+            slower.append((name, before, now))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="darko_bench", description="Benchmark DarkoOS hot paths on synthetic disks.")
+    parser.add_argument("--files", type=int, nargs="+", default=[1000, 10000], help="file counts (default: 1000 10000)")
+    parser.add_argument("--layouts", nargs="+", choices=("flat", "deep"), default=["flat", "deep"])
+    parser.add_argument("--small-bytes", type=int, default=1024, help="typical size of the small files")
+    parser.add_argument("--large", type=int, default=2, help="large files per disk (default: 2)")
+    parser.add_argument("--large-mb", type=int, default=16, help="size of each large file (default: 16)")
+    parser.add_argument("--image", action="store_true", help="use a single-file disk image")
+    parser.add_argument("--size-gb", type=float, default=8, help="size of a new disk image (default: 8)")
+    parser.add_argument("--dedup", choices=sorted(CODECS), help="store file contents deduplicated")
+    parser.add_argument("--workdir", help="where the synthetic disks are kept (default: a temp folder)")
+    parser.add_argument("--gui", action="store_true", help="also drive the Tk desktop (needs a display, e.g. xvfb-run)")
+    parser.add_argument("--no-web", action="store_true", help="skip the local HTTP benchmarks")
+    parser.add_argument("--only", nargs="+", help="run benchmarks whose name contains one of these")
+    parser.add_argument("--out", default="bench.json", help="results file (default: bench.json)")
+    parser.add_argument("--baseline", help="fail when slower than the results in this file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown (default: 0.25 = 25%%)")
+    parser.add_argument("--floor-ms", type=float, default=1.0, help="ignore slowdowns smaller than this")
+    args = parser.parse_args(argv)
+
+    base = args.workdir or tempfile.mkdtemp(prefix="darko-bench-")
+    os.makedirs(base, exist_ok=True)
+    suite = Suite(args.only)
+    server = base_url = None
+    try:
+        for layout in args.layouts:
+            for files in args.files:
+                prefix = f"{layout}-{files}"
+                print(f"{prefix}:", file=sys.stderr)
+                workdir, vfs, words = prepare(base, layout, files, args)
+                bench_core(suite, prefix, vfs, words, files, args.large)
+                if vfs.store is not None:
+                    vfs.store.collect()
+                if args.gui:
+                    if base_url is None and not args.no_web:
+                        server, base_url = start_server(words)
+                    try:
+                        bench_gui(suite, prefix, workdir, args, base_url)
+                    except Exception as e:  # no display, most likely
+                        suite.results[f"{prefix}/gui"] = {"error": f"{type(e).__name__}: {e}"}
+                        print(f"  {prefix}/gui failed: {e}", file=sys.stderr)
+        if not args.no_web:
+            print("web:", file=sys.stderr)
+            if server is None:
+                server, base_url = start_server(vocabulary(random.Random(1)))
+            bench_web(suite, base_url, base)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if not args.workdir:
+            shutil.rmtree(base, ignore_errors=True)
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline")},
+        "results": suite.results,
+    }
+    slower = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            slower = compare(suite.results, json.load(f)["results"], args.tolerance, args.floor_ms)
+        report["regressions"] = [{"name": n, "baseline_ms": b, "median_ms": m} for n, b, m in slower]
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for name, before, now in slower:
+        print(f"REGRESSION {name}: {before:.3f} ms -> {now:.3f} ms ({now / before - 1:+.0%})", file=sys.stderr)
+    failed = [n for n, r in suite.results.items() if "error" in r]
+    print(f"{len(suite.results)} benchmarks, {len(slower)} regressions, {len(failed)} failed -> {args.out}",
+          file=sys.stderr)
+    return 1 if slower or failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+# DarkoOS calculator engine.
+#
+# Expressions are parsed once, checked against a whitelist of AST nodes and
+# names, compiled and kept in an LRU cache. Used by the terminal calc command
+# and the Calculator window. "calc <expr> for x in start:stop[:step]" evaluates
+# over a range, with NumPy when it is installed.
+
+import ast
+import functools
+import math
+import re
+
+FUNCTIONS = {name: getattr(math, name) for name in (
+    "sin", "cos", "tan", "asin", "acos", "atan", "atan2", "sinh", "cosh", "tanh",
+    "exp", "log", "log10", "log2", "sqrt", "floor", "ceil", "fabs", "hypot",
+    "degrees", "radians",
+)}
+FUNCTIONS.update(abs=abs, round=round, min=min, max=max)
+CONSTANTS = {"pi": math.pi, "e": math.e, "tau": math.tau, "inf": math.inf}
+
+# NumPy spelling of each function, for range evaluation; None runs the range in Python.
+# min and max take any number of arguments, so they fold the two-argument ufunc
+NUMPY_NAMES = {
+    "sin": "sin", "cos": "cos", "tan": "tan", "asin": "arcsin", "acos": "arccos", "atan": "arctan",
+    "atan2": "arctan2", "sinh": "sinh", "cosh": "cosh", "tanh": "tanh", "exp": "exp", "log": "log",
+    "log10": "log10", "log2": "log2", "sqrt": "sqrt", "floor": "floor", "ceil": "ceil", "fabs": "fabs",
+    "hypot": "hypot", "degrees": "degrees", "radians": "radians", "abs": "abs", "round": "round",
+    "min": "minimum", "max": "maximum", "factorial": None, "gcd": None,
+}
+NUMPY_FOLDED = {"min", "max"}
+
+NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.Call, ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.USub, ast.UAdd,
+)
+
+MAX_POW_BITS = 100000
+MAX_FACTORIAL = 5000
+CHUNK = 1 << 18  # range points per streamed step with NumPy
+PY_CHUNK = 1 << 14  # and without it
+
+RANGE = re.compile(r"^(?P<expr>.+?)\s+for\s+(?P<var>[A-Za-z_]\w*)\s+in\s+(?P<range>[^\s]+)\s*$")
+
+
+class CalcError(ValueError):
+    pass
+
+
+def safe_pow(a, b):
+    if isinstance(a, int) and isinstance(b, int) and b > 0 and abs(a) > 1 and a.bit_length() * b > MAX_POW_BITS:
+        raise CalcError("Result too large")
+    return a ** b
+
+
+def safe_factorial(n):
+    # Also takes the whole-number floats a range steps through
+    if isinstance(n, float) and n.is_integer():
+        n = int(n)
+    if n > MAX_FACTORIAL:
+        raise CalcError("Result too large")
+    return math.factorial(n)
+
+
+def whole_gcd(*args):
+    # math.gcd, also for the whole-number floats a range steps through
+    if not all(float(a).is_integer() for a in args):
+        raise CalcError("gcd needs whole numbers")
+    return math.gcd(*(int(a) for a in args))
+
+
+FUNCTIONS["factorial"] = safe_factorial
+FUNCTIONS["gcd"] = whole_gcd
+
+
+class PowToCall(ast.NodeTransformer):
+    # a ** b becomes _pow(a, b) so huge integer powers can be refused
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            return ast.copy_location(ast.Call(ast.Name("_pow", ast.Load()), [node.left, node.right], []), node)
+        return node
+
+
+class Expression:
+    def __init__(self, text, variables):
+        self.text = text
+        self.variables = variables
+        tree = ast.parse(text.strip(), mode="eval")
+        self.names = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, NODES):
+                raise CalcError(f"Not allowed in expressions: {type(node).__name__}")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float, complex)):
+                raise CalcError("Only numbers are allowed")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS or node.keywords:
+                    raise CalcError("Unknown function")
+            if isinstance(node, ast.Name):
+                if node.id not in FUNCTIONS and node.id not in CONSTANTS and node.id not in variables:
+                    raise CalcError(f"Unknown name: {node.id}")
+                self.names.add(node.id)
+        tree = ast.fix_missing_locations(PowToCall().visit(tree))
+        self.code = compile(tree, "<calc>", "eval")
+
+    def scope(self, **values):
+        scope = dict(FUNCTIONS, **CONSTANTS)
+        scope["_pow"] = safe_pow
+        scope.update(values)
+        return scope
+
+    def __call__(self, **values):
+        return eval(self.code, {"__builtins__": {}}, self.scope(**values))
+
+    def vectorized(self, np):
+        # Namespace mapping every name to its NumPy ufunc, or None if one has no equivalent
+        scope = {}
+        for name in self.names:
+            if name in FUNCTIONS:
+                numpy_name = NUMPY_NAMES.get(name)
+                if numpy_name is None:
+                    return None
+                ufunc = getattr(np, numpy_name)
+                if name in NUMPY_FOLDED:
+                    # A third positional argument to a ufunc would be its out array
+                    scope[name] = lambda *args, ufunc=ufunc: functools.reduce(ufunc, args)
+                else:
+                    scope[name] = ufunc
+        scope["_pow"] = np.power
+        scope.update(CONSTANTS)
+        return scope
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(text, variables=()):
+    return Expression(text, variables)
+
+
+def evaluate(text):
+    return compile_expression(text)()
+
+
+def format_result(value):
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e16:
+        return str(int(value))
+    return str(value)
+
+
+def parse_range(spec):
+    parts = spec.split(":")
+    if len(parts) not in (2, 3):
+        raise CalcError("Range must be start:stop or start:stop:step")
+    start, stop = float(parts[0]), float(parts[1])
+    step = float(parts[2]) if len(parts) == 3 else 1.0
+    if step == 0 or (stop - start) / step < 0:
+        raise CalcError("Empty range")
+    return start, stop, step, max(0, math.ceil((stop - start) / step))
+
+
+def is_range(text):
+    return RANGE.match(text.strip()) is not None
+
+
+def evaluate_range(text):
+    # Generator of output lines: one summary per chunk, then the totals
+    match = RANGE.match(text.strip())
+    if match is None:
+        raise CalcError("Expected: <expression> for <var> in start:stop[:step]")
+    var = match.group("var")
+    expr = compile_expression(match.group("expr"), (var,))
+    start, stop, step, count = parse_range(match.group("range"))
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+    scope = expr.vectorized(np) if np is not None else None
+    chunk = CHUNK if scope is not None else PY_CHUNK
+    total = n = 0
+    low = high = None
+    for first in range(0, count, chunk):
+        size = min(chunk, count - first)
+        if scope is not None:
+            xs = start + step * np.arange(first, first + size, dtype=float)
+            ys = np.broadcast_to(eval(expr.code, {"__builtins__": {}}, dict(scope, **{var: xs})), xs.shape)
+            i_low, i_high = int(np.argmin(ys)), int(np.argmax(ys))
+            c_low, c_high = (float(ys[i_low]), float(xs[i_low])), (float(ys[i_high]), float(xs[i_high]))
+            c_sum = float(np.sum(ys))
+        else:
+            c_low = c_high = None
+            c_sum = 0.0
+            names = expr.scope()
+            for i in range(first, first + size):
+                x = names[var] = start + step * i
+                y = float(eval(expr.code, {"__builtins__": {}}, names))
+                c_sum += y
+                if c_low is None or y < c_low[0]:
+                    c_low = (y, x)
+                if c_high is None or y > c_high[0]:
+                    c_high = (y, x)
+        n += size
+        total += c_sum
+        low = c_low if low is None or c_low[0] < low[0] else low
+        high = c_high if high is None or c_high[0] > high[0] else high
+        yield (f"[{n}/{count}] chunk mean {c_sum / size:.6g}, min {c_low[0]:.6g}, "
+               f"max {c_high[0]:.6g}\n")
+    if not n:
+        yield "Empty range\n"
+        return
+    yield (f">> n={n} sum={total:.10g} mean={total / n:.10g} "
+           f"min={low[0]:.10g} (at {var}={low[1]:.6g}) max={high[0]:.10g} (at {var}={high[1]:.6g})"
+           f"{'' if scope is not None else ' [no NumPy]'}\n")
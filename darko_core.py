@@ -0,0 +1,3366 @@
+# DarkoOS core: the virtual disk and the terminal command set, without Tk.
+#
+# OS.py builds the desktop on top of this module. It can also run on its own
+# to execute terminal commands from .drk scripts or stdin:
+#
+#     python darko_core.py setup.drk
+#     echo "mkdir docs" | python darko_core.py --disk v_disk
+
+import argparse
+import bisect
+import contextlib
+import errno
+import hashlib
+import json
+import logging
+import lzma
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import darko_calc
+
+# Failures of background work, and timings when asked for; OS.py logs here too
+log = logging.getLogger("darkoos")
+
+
+def setup_logging():
+    # Messages go to stderr; DARKOOS_TIMINGS=1 adds the debug timings
+    logging.basicConfig(format="DarkoOS: %(message)s",
+                        level=logging.DEBUG if os.environ.get("DARKOOS_TIMINGS") else logging.INFO)
+
+# ---------- LISTINGS ----------
+SYSTEM_DIR = ".darko"  # VM-internal data inside v_disk, hidden from listings
+SNAPSHOT_DIR = os.path.join(SYSTEM_DIR, "snapshots")
+
+
+def list_entries(path):
+    # (name, full path, is_dir) for every entry of a directory, read off the UI thread
+    with os.scandir(path) as it:
+        return [(e.name, e.path, e.is_dir()) for e in it if e.name != SYSTEM_DIR]
+
+
+def entry_icon(name, is_dir):
+    if is_dir:
+        return "📁 "
+    if name.endswith(".drk"):
+        return "⚙ "
+    return "📄 "
+
+
+# ---------- LISTING CACHE ----------
+class InotifyWatcher:
+    # Linux inotify through ctypes; calls on_change(dir) from a daemon thread
+    # whenever an entry is created, deleted or moved in a watched directory.
+    MASK = 0x100 | 0x200 | 0x40 | 0x80 | 0x400 | 0x800  # CREATE DELETE MOVED_FROM MOVED_TO DELETE_SELF MOVE_SELF
+    IGNORED = 0x8000
+
+    def __init__(self, on_change):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.on_change = on_change
+        self.lock = threading.Lock()
+        self.paths = {}  # wd -> path
+        self.wds = {}  # path -> wd
+        threading.Thread(target=self.run, name="darko-inotify", daemon=True).start()
+
+    def watch(self, path):
+        with self.lock:
+            if path in self.wds:
+                return True
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+            if wd < 0:
+                return False
+            self.wds[path] = wd
+            self.paths[wd] = path
+            return True
+
+    def watching(self, path):
+        return path in self.wds
+
+    def unwatch(self, path):
+        with self.lock:
+            wd = self.wds.pop(path, None)
+            if wd is not None:
+                self.paths.pop(wd, None)
+                self.libc.inotify_rm_watch(self.fd, wd)
+
+    def run(self):
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except OSError:
+                return
+            pos = 0
+            while pos + 16 <= len(data):
+                wd, mask, cookie, length = struct.unpack_from("iIII", data, pos)
+                pos += 16 + length
+                with self.lock:
+                    path = self.paths.get(wd)
+                    if path is not None and mask & self.IGNORED:
+                        del self.paths[wd]
+                        self.wds.pop(path, None)
+                if path is not None:
+                    self.on_change(path)
+
+
+class ListingCache:
+    # Directory listings shared by the desktop, Explorer and terminal. Entries
+    # are dropped by inotify where available, otherwise checked against the
+    # directory mtime; DarkoOS mutations invalidate them directly.
+    def __init__(self, max_dirs=256):
+        self.max_dirs = max_dirs
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # path -> (mtime_ns, entries)
+        self.watcher = None
+        if sys.platform.startswith("linux"):
+            try:
+                self.watcher = InotifyWatcher(self.invalidate)
+            except (OSError, AttributeError):
+                self.watcher = None
+
+    def lookup(self, path):
+        # Cached entries if still valid, else None; costs no syscall when watched
+        path = os.path.normpath(path)
+        with self.lock:
+            hit = self.cache.get(path)
+            if hit is None:
+                return None
+            self.cache.move_to_end(path)
+        if self.watcher is not None and self.watcher.watching(path):
+            return hit[1]
+        try:
+            if os.stat(path).st_mtime_ns == hit[0]:
+                return hit[1]
+        except OSError:
+            pass
+        self.invalidate(path)
+        return None
+
+    def get(self, path):
+        entries = self.lookup(path)
+        if entries is None:
+            mtime = os.stat(path).st_mtime_ns
+            entries = list_entries(path)
+            self.store(path, mtime, entries)
+        return entries
+
+    def store(self, path, mtime, entries):
+        path = os.path.normpath(path)
+        if self.watcher is not None and self.watcher.watch(path):
+            # Anything that changed before the watch existed would go unnoticed
+            try:
+                if os.stat(path).st_mtime_ns != mtime:
+                    return
+            except OSError:
+                return
+        with self.lock:
+            self.cache[path] = (mtime, entries)
+            self.cache.move_to_end(path)
+            evicted = []
+            while len(self.cache) > self.max_dirs:
+                evicted.append(self.cache.popitem(last=False)[0])
+        if self.watcher is not None:
+            for old in evicted:
+                self.watcher.unwatch(old)
+
+    def cached(self, path):
+        return os.path.normpath(path) in self.cache
+
+    def entry_count(self):
+        with self.lock:
+            return sum(len(entries) for mtime, entries in self.cache.values())
+
+    def clear(self):
+        # Drops every listing, to give memory back for instance
+        with self.lock:
+            paths = list(self.cache)
+            self.cache.clear()
+        if self.watcher is not None:
+            for path in paths:
+                self.watcher.unwatch(path)
+
+    def current(self, path):
+        # Known valid without re-reading: cached and watched
+        path = os.path.normpath(path)
+        return path in self.cache and self.watcher is not None and self.watcher.watching(path)
+
+    def invalidate(self, path):
+        with self.lock:
+            self.cache.pop(os.path.normpath(path), None)
+
+    def invalidate_entry(self, path):
+        # A created, deleted or renamed entry changes its parent's listing
+        path = os.path.normpath(path)
+        self.invalidate(os.path.dirname(path))
+        prefix = path + os.sep
+        with self.lock:
+            for d in [k for k in self.cache if k == path or k.startswith(prefix)]:
+                del self.cache[d]
+
+
+# ---------- FILES ----------
+def atomic_write(path, write, ready=None):
+    # write(f) fills a temp file next to path, which then replaces it in one rename;
+    # ready(), if given, runs just before the rename
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix="." + os.path.basename(path) + ".",
+                               suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(path):
+            shutil.copymode(path, tmp)
+        if ready is not None:
+            ready()
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def escapes(rel):
+    # True for a relative path that leads out of its base, but not for names such as "..notes"
+    return rel == os.pardir or rel.startswith(os.pardir + os.sep)
+
+
+class WalkedIndex:
+    # Shared by DiskIndex, SearchIndex and Catalog, which a full walk rebuilds
+    # off the UI thread and the VFS hooks keep current in between. A hook that
+    # lands while a walk runs is remembered, since the walk may have read the
+    # disk before it, and applied again on top of the walk's result.
+    loaded = True  # False in indexes whose hooks wait for the first walk
+
+    def __init__(self, fs):
+        self.fs = fs  # the VFS, read through so either backend can be walked
+        self.root_path = os.path.normpath(fs.root)
+        self.walking = False
+        self.touched = set()
+
+    def _mark(self, *paths):
+        # Under self.lock, from every hook; False while the first walk is still to come
+        if self.walking:
+            self.touched.update(paths)
+        return self.loaded
+
+    def _start_walk(self):
+        # Under self.lock; False when a walk is running already
+        if self.walking:
+            return False
+        self.walking = True
+        self.touched = set()
+        return True
+
+    def _finish_walk(self):
+        # Under self.lock; the paths hooks touched while the walk ran
+        touched, self.touched = self.touched, set()
+        self.walking = False
+        return touched
+
+    def covers(self, path):
+        return True
+
+    def walk_subtree(self, path):
+        # (path, is_dir, size, mtime_ns) of path itself, then of everything below it
+        is_dir, size, mtime = self.fs.info(path)
+        return [(path, is_dir, size, mtime)] + (list(self.fs.walk(path)) if is_dir else [])
+
+    def _read_subtree(self, path):
+        return self.walk_subtree(path)
+
+    def refresh(self, path):
+        # Re-reads path and everything below it, after a bulk copy for instance.
+        # _read_subtree() runs unlocked; _replace() swaps the result in under the lock.
+        path = os.path.normpath(path)
+        if not self.covers(path):
+            return
+        if not self.loaded:
+            with self.lock:
+                self._mark(path)
+            return
+        try:
+            found = self._read_subtree(path)
+        except OSError:
+            self.remove(path)
+            return
+        with self.lock:
+            if self._mark(path):
+                self._replace(path, found)
+
+
+# ---------- DISK INDEX ----------
+class DiskIndex(WalkedIndex):
+    # Keeps file sizes per directory so usage is O(1) to read.
+    # DarkoOS mutations update it in place, reconcile() re-walks in the background.
+    def __init__(self, fs):
+        super().__init__(fs)
+        self.lock = threading.Lock()
+        self.dirs = {}  # dir -> {file name: size}
+        self.dir_totals = {}  # dir -> bytes of files directly inside
+        self.total = 0
+        self.loaded = False  # the first walk happens on first use or reconcile()
+
+    def scan(self):
+        # Snapshots are hardlinks to files counted here already, so they are skipped
+        snapshots = os.path.join(self.root_path, SNAPSHOT_DIR)
+        dirs, totals, total = {}, {}, 0
+        for r, d, f in os.walk(self.root_path):
+            r = os.path.normpath(r)
+            if r == os.path.dirname(snapshots):
+                d[:] = [x for x in d if os.path.join(r, x) != snapshots]
+            sizes = {}
+            for file in f:
+                try:
+                    sizes[file] = os.path.getsize(os.path.join(r, file))
+                except OSError:
+                    continue
+            dirs[r] = sizes
+            totals[r] = sum(sizes.values())
+            total += totals[r]
+        return dirs, totals, total
+
+    def used_bytes(self, wait=True):
+        if wait and not self.loaded:
+            self.reconcile()
+        return self.total
+
+    def dir_bytes(self, path, recursive=True):
+        path = os.path.normpath(path)
+        if not self.loaded:
+            self.reconcile()
+        with self.lock:
+            if not recursive:
+                return self.dir_totals.get(path, 0)
+            prefix = path + os.sep
+            return sum(v for k, v in self.dir_totals.items() if k == path or k.startswith(prefix))
+
+    def _set_file(self, path, size):
+        parent, name = os.path.split(path)
+        sizes = self.dirs.setdefault(parent, {})
+        old = sizes.get(name, 0)
+        sizes[name] = size
+        self.dir_totals[parent] = self.dir_totals.get(parent, 0) + size - old
+        self.total += size - old
+
+    def _drop(self, path):
+        parent, name = os.path.split(path)
+        sizes = self.dirs.get(parent)
+        if sizes is not None and name in sizes:
+            size = sizes.pop(name)
+            self.dir_totals[parent] -= size
+            self.total -= size
+        prefix = path + os.sep
+        for d in [k for k in self.dirs if k == path or k.startswith(prefix)]:
+            self.total -= self.dir_totals.pop(d, 0)
+            del self.dirs[d]
+
+    def update(self, path):
+        # Re-stat one entry after it was created or written
+        path = os.path.normpath(path)
+        with self.lock:
+            if not self._mark(path):
+                return
+            if os.path.isdir(path):
+                self.dirs.setdefault(path, {})
+                self.dir_totals.setdefault(path, 0)
+            else:
+                try:
+                    self._set_file(path, os.path.getsize(path))
+                except OSError:
+                    self._drop(path)
+
+    def remove(self, path):
+        path = os.path.normpath(path)
+        with self.lock:
+            if self._mark(path):
+                self._drop(path)
+
+    def rename(self, old_path, new_path):
+        old_path = os.path.normpath(old_path)
+        new_path = os.path.normpath(new_path)
+        with self.lock:
+            if not self._mark(old_path, new_path):
+                return
+            parent, name = os.path.split(old_path)
+            sizes = self.dirs.get(parent, {})
+            if name in sizes:
+                size = sizes[name]
+                self._drop(old_path)
+                self._set_file(new_path, size)
+                return
+            prefix = old_path + os.sep
+            for d in [k for k in self.dirs if k == old_path or k.startswith(prefix)]:
+                moved = new_path + d[len(old_path):]
+                self.dirs[moved] = self.dirs.pop(d)
+                self.dir_totals[moved] = self.dir_totals.pop(d)
+
+    def _replace(self, path, found):
+        self._drop(path)
+        for p, is_dir, size, mtime in found:
+            if is_dir:
+                self.dirs.setdefault(p, {})
+                self.dir_totals.setdefault(p, 0)
+            else:
+                self._set_file(p, size)
+
+    def reconcile(self):
+        # Full walk off the UI thread; entries touched meanwhile are re-applied
+        with self.lock:
+            if not self._start_walk():
+                return
+        try:
+            dirs, totals, total = self.scan()
+        except Exception:
+            with self.lock:
+                self._finish_walk()
+            raise
+        with self.lock:
+            self.dirs, self.dir_totals, self.total = dirs, totals, total
+            touched = self._finish_walk()
+            self.loaded = True
+            for path in touched:
+                if os.path.isdir(path):
+                    self.dirs.setdefault(path, {})
+                    self.dir_totals.setdefault(path, 0)
+                elif os.path.exists(path):
+                    self._set_file(path, os.path.getsize(path))
+                else:
+                    self._drop(path)
+
+
+# ---------- SEARCH INDEX ----------
+SEARCH_MAX_BYTES = 1 << 20  # larger files are found by name only
+SEARCH_VERIFY = 2000  # most grep candidates read back per query
+SEARCH_BATCH = 256
+WORD = re.compile(r"[^\W_]+")
+
+
+def words(text):
+    return {w for w in WORD.findall(text.lower()) if len(w) <= 64}
+
+
+def read_searchable(fs, path):
+    # Text of a file for the index, or "" for large and binary files
+    data = fs.read_bytes(path, SEARCH_MAX_BYTES + 1)
+    if len(data) > SEARCH_MAX_BYTES or b"\0" in data[:4096]:
+        return ""
+    return data.decode("utf-8", errors="ignore")
+
+
+def grep_file(fs, path, needle):
+    # (line number, line) for every line containing needle, case-insensitive
+    try:
+        text = read_searchable(fs, path)
+    except OSError:
+        return []
+    if needle not in text.lower():
+        return []
+    return [(i, line.strip()) for i, line in enumerate(text.splitlines(), 1) if needle in line.lower()]
+
+
+class SearchIndex(WalkedIndex):
+    # Inverted index from words to v_disk paths, one for names and one for
+    # text contents, saved under SYSTEM_DIR. crawl() brings it up to date in
+    # the background, re-reading only files whose size or mtime changed; VFS
+    # mutations update it in place. Until the first crawl, queries scan.
+    def __init__(self, fs, index_path):
+        super().__init__(fs)
+        self.index_path = index_path
+        self.lock = threading.Lock()
+        self.docs = {}  # path -> (mtime_ns, size or -1 for dirs, name words, content words)
+        self.names = {}  # word -> paths
+        self.content = {}  # word -> paths
+        self.keys = []  # sorted name words, for prefix lookups
+        self.content_keys = []  # sorted content words, likewise
+        self.loaded = False
+        self.dirty = False
+
+    def ignored(self, path):
+        rel = os.path.relpath(path, self.root_path)
+        return escapes(rel) or SYSTEM_DIR in rel.split(os.sep)
+
+    def covers(self, path):
+        return not self.ignored(path)
+
+    def read(self, path):
+        is_dir, size, mtime = self.fs.info(path)
+        name = words(os.path.basename(path))
+        if is_dir:
+            return (mtime, -1, name, frozenset())
+        return (mtime, size, name, frozenset(words(read_searchable(self.fs, path))))
+
+    # -- postings --
+    def _add(self, path, doc, keep_sorted=True):
+        self.docs[path] = doc
+        for w in doc[2]:
+            paths = self.names.get(w)
+            if paths is None:
+                paths = self.names[w] = set()
+                if keep_sorted:
+                    bisect.insort(self.keys, w)
+            paths.add(path)
+        for w in doc[3]:
+            paths = self.content.get(w)
+            if paths is None:
+                paths = self.content[w] = set()
+                if keep_sorted:
+                    bisect.insort(self.content_keys, w)
+            paths.add(path)
+
+    def _discard(self, path):
+        doc = self.docs.pop(path, None)
+        if doc is None:
+            return
+        for w in doc[2]:
+            paths = self.names[w]
+            paths.discard(path)
+            if not paths:
+                del self.names[w]
+                del self.keys[bisect.bisect_left(self.keys, w)]
+        for w in doc[3]:
+            paths = self.content[w]
+            paths.discard(path)
+            if not paths:
+                del self.content[w]
+                del self.content_keys[bisect.bisect_left(self.content_keys, w)]
+
+    def _under(self, path):
+        prefix = path + os.sep
+        return [p for p in self.docs if p == path or p.startswith(prefix)]
+
+    def _mark(self, *paths):
+        self.dirty = True
+        return super()._mark(*paths)
+
+    # -- updates from DarkoOS mutations --
+    def update(self, path):
+        path = os.path.normpath(path)
+        if self.ignored(path):
+            return
+        try:
+            doc = self.read(path)
+        except OSError:
+            doc = None
+        with self.lock:
+            if not self._mark(path):
+                return
+            self._discard(path)
+            if doc is not None:
+                self._add(path, doc)
+
+    def remove(self, path):
+        path = os.path.normpath(path)
+        with self.lock:
+            if self._mark(path):
+                for p in self._under(path):
+                    self._discard(p)
+
+    def _read_subtree(self, path):
+        paths = [entry[0] for entry in self.walk_subtree(path)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            return list(zip(paths, pool.map(self.try_read, paths)))
+
+    def _replace(self, path, found):
+        for p in self._under(path):
+            self._discard(p)
+        for p, doc in found:
+            if doc is not None:
+                self._add(p, doc)
+
+    def rename(self, old_path, new_path):
+        old_path = os.path.normpath(old_path)
+        new_path = os.path.normpath(new_path)
+        with self.lock:
+            if not self._mark(old_path, new_path):
+                return
+            for p in self._under(old_path):
+                mtime, size, name, content = self.docs[p]
+                self._discard(p)
+                moved = new_path + p[len(old_path):]
+                if p == old_path:
+                    name = words(os.path.basename(new_path))
+                self._add(moved, (mtime, size, name, content))
+
+    # -- crawling and persistence --
+    def crawl(self):
+        # Re-reads only what changed since the saved index or the last crawl
+        with self.lock:
+            if not self._start_walk():
+                return
+            previous = dict(self.docs) if self.loaded else None
+        try:
+            if previous is None:
+                previous = self.load()
+            docs, stale = {}, []
+            for path, is_dir, size, mtime in self.fs.walk():
+                old = previous.get(path)
+                if old is not None and (old[1] == -1 if is_dir else old[:2] == (mtime, size)):
+                    docs[path] = old
+                else:
+                    stale.append(path)
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                for path, doc in zip(stale, pool.map(self.try_read, stale)):
+                    if doc is not None:
+                        docs[path] = doc
+            # Postings are built aside so mutations are not held up meanwhile
+            fresh = SearchIndex(self.fs, self.index_path)
+            for path, doc in docs.items():
+                fresh._add(path, doc, keep_sorted=False)
+            fresh.keys = sorted(fresh.names)
+            fresh.content_keys = sorted(fresh.content)
+        except Exception:
+            with self.lock:
+                self._finish_walk()
+            raise
+        with self.lock:
+            self.docs, self.names, self.content = fresh.docs, fresh.names, fresh.content
+            self.keys, self.content_keys = fresh.keys, fresh.content_keys
+            touched = self._finish_walk()
+            self.loaded = True
+            self.dirty = self.dirty or bool(stale) or len(docs) != len(previous)
+            for path in touched:
+                try:
+                    found = self._read_subtree(path)
+                except OSError:
+                    found = []
+                self._replace(path, found)
+        self.save()
+
+    def try_read(self, path):
+        try:
+            return self.read(path)
+        except OSError:
+            return None
+
+    def load(self):
+        # Docs from the saved index; names are rebuilt from the paths
+        try:
+            with open(self.index_path, "rb") as f:
+                data = json.loads(zlib.decompress(f.read()))
+        except (OSError, ValueError, zlib.error):
+            return {}
+        if data.get("version") != 1:
+            return {}
+        docs = {}
+        for rel, (mtime, size, content) in data["docs"].items():
+            path = os.path.join(self.root_path, rel)
+            docs[path] = (mtime, size, words(os.path.basename(path)), frozenset(content.split()))
+        return docs
+
+    def save(self):
+        with self.lock:
+            if not self.loaded or not self.dirty:
+                return
+            self.dirty = False
+            data = {"version": 1, "docs": {os.path.relpath(p, self.root_path): [d[0], d[1], " ".join(d[3])]
+                                           for p, d in self.docs.items()}}
+        blob = zlib.compress(json.dumps(data).encode("utf-8"), 1)
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        atomic_write(self.index_path, lambda f: f.write(blob))
+
+    # -- queries --
+    def rel(self, path):
+        return os.path.relpath(path, self.root_path)
+
+    def lookup(self, postings, keys, query):
+        # Paths holding every word of query, or None if it has no words. A word
+        # inside the query is looked up whole; one at its end may begin a longer
+        # word, found by bisecting the sorted keys. A name may also hold the
+        # first word anywhere, as find matches inside names; content is only
+        # searched that way by grep_file, on the candidates this returns.
+        found = None
+        for m in WORD.finditer(query):
+            w = m.group()
+            if m.start() > 0 and m.end() < len(query):
+                hits = postings.get(w, set())
+            elif m.start() == 0 and postings is self.names:
+                hits = set()
+                for key in postings:
+                    if w in key:
+                        hits |= postings[key]
+            else:
+                hits = set()
+                pos = bisect.bisect_left(keys, w)
+                while pos < len(keys) and keys[pos].startswith(w):
+                    hits |= postings[keys[pos]]
+                    pos += 1
+            found = hits if found is None else found & hits
+            if not found:
+                break
+        return found
+
+    def find(self, query, limit=50):
+        # Paths whose name contains query, best matches first
+        q = query.strip().lower()
+        if not q:
+            return []
+        if not self.loaded:
+            found = self.scan_names(q)
+        else:
+            with self.lock:
+                found = self.lookup(self.names, self.keys, q)
+                if found is None:
+                    found = self.docs
+                found = [p for p in found if q in os.path.basename(p).lower()]
+
+        def rank(path):
+            name = os.path.basename(path).lower()
+            if q in (name, os.path.splitext(name)[0]):
+                score = 0
+            elif name.startswith(q):
+                score = 1
+            elif any(w.startswith(q) for w in words(name)):
+                score = 2
+            else:
+                score = 3
+            return score, path.count(os.sep), name
+        return sorted(found, key=rank)[:limit]
+
+    def scan_names(self, q):
+        # Cold find: a folder level at a time, its folders listed in parallel as grep reads files
+        found, level = [], [self.fs.root]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            while level:
+                below = []
+                for entries in pool.map(self.try_list, level):
+                    for name, path, is_dir in entries:
+                        if q in name.lower():
+                            found.append(path)
+                        if is_dir:
+                            below.append(path)
+                level = below
+        return found
+
+    def try_list(self, path):
+        try:
+            return list(self.fs.scandir(path, follow_symlinks=False))
+        except OSError:
+            return []
+
+    def grep(self, pattern, limit=50):
+        # [(path, [(line number, line), ...])]: matches in the name first, then
+        # most matching lines, among the most recently modified candidates
+        needle = pattern.strip().lower()
+        if not needle:
+            return []
+        if not self.loaded:
+            candidates = [path for path, is_dir, size, mtime in self.fs.walk() if not is_dir]
+        else:
+            with self.lock:
+                candidates = self.lookup(self.content, self.content_keys, needle)
+                if candidates is None:
+                    candidates = [p for p, d in self.docs.items() if d[1] >= 0]
+                candidates = sorted(candidates, key=lambda p: -self.docs[p][0])[:SEARCH_VERIFY]
+        # Cold or not, candidates are read back in parallel until there are enough
+        results = []
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            for start in range(0, len(candidates), SEARCH_BATCH):
+                batch = candidates[start:start + SEARCH_BATCH]
+                matches = pool.map(grep_file, [self.fs] * len(batch), batch, [needle] * len(batch))
+                results += [(p, lines) for p, lines in zip(batch, matches) if lines]
+                if len(results) >= limit * 2:
+                    break
+        results.sort(key=lambda r: (needle not in os.path.basename(r[0]).lower(), -len(r[1])))
+        return results[:limit]
+
+    def search(self, query, limit=200):
+        # Explorer search: name matches first, then files containing the text
+        paths = self.find(query, limit)
+        seen = set(paths)
+        paths += [p for p, lines in self.grep(query, limit) if p not in seen]
+        return paths[:limit]
+
+
+# ---------- CATALOG ----------
+CATALOG_BATCH = 1000  # rows per reconcile transaction
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    program TEXT
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_parent ON entries (parent);
+CREATE INDEX IF NOT EXISTS entries_size ON entries (size) WHERE is_dir = 0;
+CREATE INDEX IF NOT EXISTS entries_mtime ON entries (mtime_ns) WHERE is_dir = 0;
+"""
+
+
+def entry_kind(name, is_dir):
+    # "folder", or the lowercase extension ("" for none)
+    return "folder" if is_dir else os.path.splitext(name)[1][1:].lower()
+
+
+def entry_program(name, is_dir):
+    # The program a .drk file starts, or None
+    stem, ext = os.path.splitext(name)
+    return stem if not is_dir and ext == ".drk" and stem in PROGRAMS else None
+
+
+class Catalog(WalkedIndex):
+    # Type, size, mtime and .drk program of every v_disk entry in SQLite under
+    # SYSTEM_DIR, so views and queries need no stat calls. DarkoOS mutations
+    # update it through the VFS hooks, one transaction each; reconcile() walks
+    # the disk off the UI thread and applies the differences in batches.
+    # Paths are stored relative to the disk root.
+    def __init__(self, vfs, path):
+        super().__init__(vfs)
+        self.vfs = vfs
+        self.path = path
+        self.lock = threading.RLock()
+        self.db = None
+        self.reconciled = False  # a full walk has run in this session
+
+    def connect(self):
+        # Opened on first use, from whichever thread; self.lock serialises access
+        if self.db is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(CATALOG_SCHEMA)
+            self.db = db
+        return self.db
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+    def rel(self, path):
+        # "" for the root, None outside the catalogued tree
+        rel = os.path.relpath(os.path.normpath(path), self.root_path)
+        if rel == ".":
+            return ""
+        if escapes(rel) or rel.split(os.sep, 1)[0] == SYSTEM_DIR:
+            return None
+        return rel
+
+    def full(self, rel):
+        return os.path.join(self.root_path, rel) if rel else self.root_path
+
+    def row(self, rel, is_dir, size, mtime_ns):
+        parent, name = os.path.split(rel)
+        return rel, parent, name, int(is_dir), size, mtime_ns, entry_kind(name, is_dir), entry_program(name, is_dir)
+
+    def subtree(self, rel):
+        # WHERE clause and arguments for rel and everything below it
+        return "(path = ? OR (path > ? AND path < ?))", (rel, rel + os.sep, rel + chr(ord(os.sep) + 1))
+
+    def transaction(self, work):
+        with self.lock:
+            db = self.connect()
+            db.execute("BEGIN")
+            try:
+                result = work(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+            return result
+
+    def put(self, db, rows):
+        db.executemany("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def drop(self, db, rel):
+        where, args = self.subtree(rel)
+        db.execute("DELETE FROM entries WHERE " + where, args)
+
+    def covers(self, path):
+        return self.rel(path) is not None
+
+    def parents(self, *paths):
+        # Rows of the folders holding paths, whose mtime the change moved on
+        rows = []
+        for path in paths:
+            parent = os.path.dirname(os.path.normpath(path))
+            rel = self.rel(parent)
+            if rel:
+                try:
+                    rows.append(self.row(rel, *self.vfs.info(parent)))
+                except OSError:
+                    pass
+        return rows
+
+    # -- updates --
+    def update(self, path):
+        # One entry after it was created or written; a folder's contents are left alone
+        rel = self.rel(path)
+        if not rel:
+            return
+        try:
+            rows = [self.row(rel, *self.vfs.info(path))]
+        except OSError:
+            self.remove(path)
+            return
+        rows += self.parents(path)
+        with self.lock:
+            self._mark(path)
+            self.transaction(lambda db: self.put(db, rows))
+
+    def remove(self, path):
+        rel = self.rel(path)
+        if not rel:
+            return
+        rows = self.parents(path)
+
+        def drop(db):
+            self.drop(db, rel)
+            self.put(db, rows)
+
+        with self.lock:
+            self._mark(path)
+            self.transaction(drop)
+
+    def rename(self, old_path, new_path):
+        old, new = self.rel(old_path), self.rel(new_path)
+        if not old or not new:
+            return
+        parent, name = os.path.split(new)
+        args = self.subtree(old)[1]
+        cut = len(old) + 1
+        rows = self.parents(old_path, new_path)
+
+        def move(db):
+            self.drop(db, new)
+            db.execute("UPDATE entries SET path = ? || substr(path, ?), parent = ? || substr(parent, ?) "
+                       "WHERE path > ? AND path < ?", (new, cut, new, cut) + args[1:])
+            db.execute("UPDATE entries SET path = ?, parent = ?, name = ?, "
+                       "kind = CASE WHEN is_dir THEN 'folder' ELSE ? END, "
+                       "program = CASE WHEN is_dir THEN NULL ELSE ? END WHERE path = ?",
+                       (new, parent, name, entry_kind(name, False), entry_program(name, False), old))
+            self.put(db, rows)
+
+        with self.lock:
+            self._mark(old_path, new_path)
+            self.transaction(move)
+
+    def _read_subtree(self, path):
+        rel = self.rel(path)
+        found = self.walk_subtree(path)
+        rows = [self.row(rel, *found[0][1:])] + self.parents(path) if rel else []
+        # walk() joins names onto path, so the relative path is a slice away
+        cut = len(path) + 1
+        rows.extend(self.row(os.path.join(rel, p[cut:]), d, s, m) for p, d, s, m in found[1:])
+        return rows
+
+    def _replace(self, path, rows):
+        rel = self.rel(path)
+
+        def replace(db):
+            if rel:
+                self.drop(db, rel)
+            else:
+                db.execute("DELETE FROM entries")
+            self.put(db, rows)
+
+        self.transaction(replace)
+
+    def reconcile(self):
+        # Full walk off the UI thread. Each directory is compared with its rows
+        # and the differences are written CATALOG_BATCH at a time, so hooks on
+        # other threads wait for one batch at most. Entries touched meanwhile
+        # are read again at the end.
+        with self.lock:
+            if not self._start_walk():
+                return 0
+        upserts, removals = [], []
+        changed = 0
+
+        def write(db):
+            self.put(db, upserts)
+            for rel in removals:
+                self.drop(db, rel)
+
+        def flush():
+            nonlocal changed
+            if upserts or removals:
+                self.transaction(write)
+                changed += len(upserts) + len(removals)
+                upserts.clear()
+                removals.clear()
+
+        def compare(parent, found):
+            with self.lock:
+                known = {name: (is_dir, size, mtime) for name, is_dir, size, mtime in self.connect().execute(
+                    "SELECT name, is_dir, size, mtime_ns FROM entries WHERE parent = ?", (parent,))}
+            for name, meta in found.items():
+                if known.pop(name, None) != meta:
+                    upserts.append(self.row(os.path.join(parent, name), *meta))
+            removals.extend(os.path.join(parent, name) for name in known)
+            if len(upserts) + len(removals) >= CATALOG_BATCH:
+                flush()
+
+        try:
+            pending = {""}  # folders whose contents have not been compared yet
+            current, found = None, {}
+            cut = len(self.vfs.root) + 1
+            for path, is_dir, size, mtime in self.vfs.walk():
+                parent, _, name = path[cut:].rpartition(os.sep)
+                if parent != current:
+                    if current is not None:
+                        compare(current, found)
+                    pending.discard(parent)
+                    current, found = parent, {}
+                found[name] = (int(is_dir), size, mtime)
+                if is_dir:
+                    pending.add(os.path.join(parent, name))
+            if current is not None:
+                compare(current, found)
+            for parent in pending:  # empty folders
+                compare(parent, {})
+            flush()
+        finally:
+            with self.lock:
+                touched = self._finish_walk()
+        self.reconciled = True
+        for path in touched:
+            if self.vfs.exists(path):
+                self.update(path)
+            else:
+                self.remove(path)
+        return changed
+
+    def ensure(self):
+        # Headless runs walk once before the first query; the desktop reconciles at boot
+        if not self.reconciled and not self.walking:
+            self.reconcile()
+
+    # -- queries --
+    def query(self, sql, args=()):
+        with self.lock:
+            return self.connect().execute(sql, args).fetchall()
+
+    def children(self, path):
+        # {name: (is_dir, size, mtime_ns)} of one folder
+        return {name: (bool(is_dir), size, mtime) for name, is_dir, size, mtime in self.query(
+            "SELECT name, is_dir, size, mtime_ns FROM entries WHERE parent = ?", (self.rel(path),))}
+
+    def lookup(self, paths, batch=500):
+        # {path: (is_dir, size, mtime_ns)} of those paths that are catalogued
+        found = {}
+        rels = {}
+        for path in paths:
+            rel = self.rel(path)
+            if rel:
+                rels[rel] = path
+        keys = list(rels)
+        for i in range(0, len(keys), batch):
+            chunk = keys[i:i + batch]
+            for rel, is_dir, size, mtime in self.query(
+                    f"SELECT path, is_dir, size, mtime_ns FROM entries WHERE path IN ({','.join('?' * len(chunk))})",
+                    chunk):
+                found[rels[rel]] = (bool(is_dir), size, mtime)
+        return found
+
+    def largest(self, count=20, kind=None):
+        # (path, size, mtime_ns) of the biggest files, optionally of one kind
+        sql = "SELECT path, size, mtime_ns FROM entries WHERE is_dir = 0"
+        args = ()
+        if kind is not None:
+            sql += " AND kind = ?"
+            args = (kind,)
+        return [(self.full(p), s, m) for p, s, m in self.query(sql + " ORDER BY size DESC LIMIT ?", args + (count,))]
+
+    def recent(self, count=20):
+        # (path, size, mtime_ns) of the most recently modified files
+        return [(self.full(p), s, m) for p, s, m in self.query(
+            "SELECT path, size, mtime_ns FROM entries WHERE is_dir = 0 ORDER BY mtime_ns DESC LIMIT ?", (count,))]
+
+    def totals(self, path=None):
+        # (bytes, files) below one folder, the whole disk by default
+        rel = self.rel(path or self.root_path)
+        if not rel:
+            return tuple(self.query("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries WHERE is_dir = 0")[0])
+        where, args = self.subtree(rel)
+        return tuple(self.query("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries "
+                                "WHERE is_dir = 0 AND " + where, args)[0])
+
+    def folder_totals(self, path=None):
+        # (path, is_dir, bytes, files) of each entry in a folder, folders counted with everything
+        # in them, largest first
+        rows = []
+        for name, (is_dir, size, mtime) in self.children(path or self.root_path).items():
+            full = os.path.join(path or self.root_path, name)
+            rows.append((full, True, *self.totals(full)) if is_dir else (full, False, size, 1))
+        rows.sort(key=lambda row: -row[2])
+        return rows
+
+    def programs(self):
+        # {path: program} of the .drk files that start one
+        return {self.full(p): program for p, program in self.query(
+            "SELECT path, program FROM entries WHERE program IS NOT NULL")}
+
+
+# ---------- CHUNK STORE ----------
+MANIFEST_MAGIC = b"DARKOCAS\x01"
+MANIFEST_HEAD = struct.Struct("<Q")  # logical size
+MANIFEST_ENTRY = struct.Struct("<32sI")  # sha256, chunk length
+CHUNK_MIN = 2048
+CHUNK_MAX = 65536
+CHUNK_MASK = 0x3F  # a boundary after about one line in 64
+OFFLOAD_BYTES = 256 * 1024  # smaller saves are chunked in-process
+CODECS = {"zlib": b"z", "lzma": b"x", "raw": b"-"}
+
+
+def split_chunks(data):
+    # Content-defined (start, end) ranges: a chunk ends after a line whose
+    # CRC has its low bits clear, once it holds CHUNK_MIN bytes, so editing
+    # a line only changes the chunks around it. CHUNK_MAX caps long lines.
+    bounds = []
+    start = pos = 0
+    for line in data.splitlines(keepends=True):
+        pos += len(line)
+        while pos - start > CHUNK_MAX:
+            bounds.append((start, start + CHUNK_MAX))
+            start += CHUNK_MAX
+        if pos - start >= CHUNK_MIN and not zlib.crc32(line) & CHUNK_MASK:
+            bounds.append((start, pos))
+            start = pos
+    if start < len(data):
+        bounds.append((start, len(data)))
+    return bounds
+
+
+def chunk_digests(data):
+    # Runs in the process pool for large saves
+    return [(hashlib.sha256(data[s:e]).digest(), s, e) for s, e in split_chunks(data)]
+
+
+def compress_chunks(pieces, codec):
+    # Runs in the process pool for large saves
+    blobs = []
+    for piece in pieces:
+        if codec == "zlib":
+            packed = zlib.compress(piece, 6)
+        elif codec == "lzma":
+            packed = lzma.compress(piece, preset=6)
+        else:
+            packed = piece
+        if codec == "raw" or len(packed) >= len(piece):
+            blobs.append(CODECS["raw"] + piece)
+        else:
+            blobs.append(CODECS[codec] + packed)
+    return blobs
+
+
+def unpack_chunk(blob):
+    tag, body = blob[:1], blob[1:]
+    if tag == CODECS["zlib"]:
+        return zlib.decompress(body)
+    if tag == CODECS["lzma"]:
+        return lzma.decompress(body)
+    return body
+
+
+class ChunkStore:
+    # Deduplicated, compressed file contents for a VFS. A file written
+    # through the store holds a manifest (MANIFEST_MAGIC, its size, then the
+    # sha256 and length of each chunk); chunks live once each under
+    # SYSTEM_DIR/chunks. Files without the magic are read as they are.
+    # Chunks are never dropped on write or delete, only by collect(), which
+    # marks from every manifest, so a lost count can never lose data.
+    def __init__(self, fs, codec="zlib", executor=None):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown compression: {codec}")
+        self.fs = fs
+        self.codec = codec
+        self.executor = executor  # ProcessPoolExecutor for large saves, if any
+        self.directory = os.path.join(fs.root, SYSTEM_DIR, "chunks")
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)  # notified when the last writer finishes
+        self.writers = 0  # saves between storing their chunks and writing their manifest
+        self.known = set()  # digests known to be stored
+        self.recent = set()  # digests used since the last collect() began
+        self.logical = None  # bytes, once collect() has counted them
+        self.physical = None
+        self.garbage = True  # a collect() could free something
+
+    def chunk_path(self, digest):
+        name = digest.hex()
+        return os.path.join(self.directory, name[:2], name[2:])
+
+    def call(self, fn, *args, offload=False):
+        if offload and self.executor is not None:
+            return self.executor.submit(fn, *args).result()
+        return fn(*args)
+
+    def has(self, digest):
+        with self.lock:
+            self.recent.add(digest)
+            if digest in self.known:
+                return True
+        if self.fs.exists(self.chunk_path(digest)):
+            with self.lock:
+                self.known.add(digest)
+            return True
+        return False
+
+    @staticmethod
+    def parse(manifest):
+        size, = MANIFEST_HEAD.unpack_from(manifest, len(MANIFEST_MAGIC))
+        at = len(MANIFEST_MAGIC) + MANIFEST_HEAD.size
+        return size, list(MANIFEST_ENTRY.iter_unpack(manifest[at:]))
+
+    def sizes(self, path):
+        # (logical, physical) bytes of what path holds now, (0, 0) if nothing
+        try:
+            head = self.fs.read_raw(path, len(MANIFEST_MAGIC) + MANIFEST_HEAD.size)
+            physical = self.fs.info(path)[1]
+        except OSError:
+            return 0, 0
+        if head.startswith(MANIFEST_MAGIC) and len(head) == len(MANIFEST_MAGIC) + MANIFEST_HEAD.size:
+            return MANIFEST_HEAD.unpack_from(head, len(MANIFEST_MAGIC))[0], physical
+        return physical, physical
+
+    @contextlib.contextmanager
+    def writing(self):
+        # Held from write() until the manifest is written, so collect() cannot
+        # start a sweep that misses the chunks the manifest is about to use
+        with self.lock:
+            self.writers += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.writers -= 1
+                if not self.writers:
+                    self.idle.notify_all()
+
+    def write(self, path, data):
+        # Stores the chunks of data not stored yet and returns the manifest to write at path,
+        # inside writing()
+        offload = len(data) >= OFFLOAD_BYTES
+        pieces = self.call(chunk_digests, data, offload=offload)
+        missing, seen = [], set()
+        for digest, s, e in pieces:
+            if digest not in seen and not self.has(digest):
+                missing.append((digest, s, e))
+            seen.add(digest)
+        blobs = self.call(compress_chunks, [data[s:e] for d, s, e in missing], self.codec, offload=offload)
+        stored = 0
+        for (digest, s, e), blob in zip(missing, blobs):
+            chunk = self.chunk_path(digest)
+            self.fs.check_space(chunk, len(blob))
+            self.fs.makedirs_raw(os.path.dirname(chunk))
+            self.fs.write_raw(chunk, blob)
+            self.fs.index.update(chunk)
+            stored += len(blob)
+            with self.lock:
+                self.known.add(digest)
+        manifest = (MANIFEST_MAGIC + MANIFEST_HEAD.pack(len(data))
+                    + b"".join(MANIFEST_ENTRY.pack(d, e - s) for d, s, e in pieces))
+        old_logical, old_physical = self.sizes(path)
+        with self.lock:
+            if old_physical:
+                self.garbage = True
+            if self.logical is not None:
+                self.logical += len(data) - old_logical
+                self.physical += len(manifest) + stored - old_physical
+        return manifest
+
+    def forget(self, path):
+        # Before path is deleted; its chunks wait for the next collect()
+        logical, physical = self.sizes(path)
+        with self.lock:
+            self.garbage = True
+            if self.logical is not None:
+                self.logical -= logical
+                self.physical -= physical
+
+    def added(self, path):
+        # After path was copied or linked in below write(); its chunks are already stored
+        logical, physical = self.sizes(path)
+        with self.lock:
+            if self.logical is not None:
+                self.logical += logical
+                self.physical += physical
+
+    def read(self, manifest, limit=-1):
+        size, entries = self.parse(manifest)
+        left = size if limit < 0 else min(size, limit)
+        out = []
+        for digest, length in entries:
+            if left <= 0:
+                break
+            out.append(unpack_chunk(self.fs.read_raw(self.chunk_path(digest))))
+            left -= length
+        data = b"".join(out)
+        return data if limit < 0 else data[:limit]
+
+    def usage(self):
+        # (logical, physical) bytes of user files, None until collect() has run
+        if self.logical is None:
+            return None
+        return self.logical, self.physical
+
+    def collect(self):
+        # Mark and sweep: counts usage and removes chunks no manifest refers to
+        with self.lock:
+            if not self.garbage and self.logical is not None:
+                return
+            # Saves in flight added their chunks to the old recent set; let them land first
+            while self.writers:
+                self.idle.wait()
+            self.garbage = False
+            self.recent = set()
+        live, logical, physical = set(), 0, 0
+        snapshots = os.path.join(self.fs.root, SNAPSHOT_DIR)
+        for top in (None, snapshots):
+            # Snapshot manifests keep their chunks alive but are not usage of their own
+            for path, is_dir, size, mtime in self.fs.walk(top):
+                if is_dir:
+                    continue
+                try:
+                    raw = self.fs.read_raw(path, len(MANIFEST_MAGIC))
+                    if raw == MANIFEST_MAGIC:
+                        raw = self.fs.read_raw(path)
+                        n, entries = self.parse(raw)
+                        live.update(digest for digest, length in entries)
+                    else:
+                        n = size
+                except OSError:
+                    continue
+                if top is None:
+                    logical += n
+                    physical += size
+        for sub in self.fs.list_raw(self.directory):
+            folder = os.path.join(self.directory, sub)
+            for name in self.fs.list_raw(folder):
+                chunk = os.path.join(folder, name)
+                try:
+                    digest = bytes.fromhex(sub + name)
+                except ValueError:
+                    continue
+                with self.lock:
+                    keep = digest in live or digest in self.recent
+                try:
+                    if keep:
+                        physical += self.fs.info(chunk)[1]
+                    else:
+                        self.fs.remove_raw(chunk)
+                        self.fs.index.remove(chunk)
+                except OSError:
+                    continue
+        with self.lock:
+            self.known = live | self.recent
+            self.logical, self.physical = logical, physical
+
+
+# ---------- SNAPSHOTS ----------
+SNAPSHOT_NAME = re.compile(r"^[\w.-]+$")
+
+
+class Snapshots:
+    # Copy-on-write checkpoints of the disk under SNAPSHOT_DIR. A snapshot is
+    # a tree of hardlinks (shared extents on an image) to the files as they
+    # were, so taking one copies no data: VFS writes always replace a file
+    # rather than change it in place. Each snapshot saves its metadata next
+    # to the tree, and diffs compare that instead of walking again.
+    def __init__(self, vfs):
+        self.vfs = vfs
+        self.directory = os.path.join(vfs.root, SNAPSHOT_DIR)
+        self.lock = threading.Lock()
+
+    def tree(self, name):
+        return os.path.join(self.directory, name)
+
+    def meta_path(self, name):
+        return os.path.join(self.directory, name + ".json")
+
+    def names(self):
+        return sorted(n[:-5] for n in self.vfs.list_raw(self.directory) if n.endswith(".json"))
+
+    def metadata(self, name):
+        try:
+            return json.loads(self.vfs.read_raw(self.meta_path(name)))
+        except FileNotFoundError:
+            raise FileNotFoundError(errno.ENOENT, "No such snapshot", name) from None
+
+    def current(self):
+        # {relative path: [is_dir, size, mtime_ns]} of the live disk, from the search index once it is loaded
+        search = self.vfs.search
+        if search.loaded:
+            with search.lock:
+                return {os.path.relpath(p, search.root_path).replace(os.sep, "/"): [d[1] < 0, max(d[1], 0), d[0]]
+                        for p, d in search.docs.items()}
+        return {os.path.relpath(p, self.vfs.root).replace(os.sep, "/"): [is_dir, size if not is_dir else 0, mtime]
+                for p, is_dir, size, mtime in self.vfs.walk()}
+
+    def create(self, name=None):
+        name = name or time.strftime("%Y%m%d-%H%M%S")
+        if not SNAPSHOT_NAME.match(name):
+            raise ValueError("Snapshot names may only use letters, digits, '.', '-' and '_'")
+        with self.lock:
+            if self.vfs.exists(self.meta_path(name)):
+                raise FileExistsError(errno.EEXIST, "Snapshot exists", name)
+            tree = self.tree(name)
+            self.vfs.makedirs_raw(tree)
+            entries = {}
+            for path, is_dir, size, mtime in self.vfs.walk():
+                rel = os.path.relpath(path, self.vfs.root)
+                target = os.path.join(tree, rel)
+                if is_dir:
+                    self.vfs.makedirs_raw(target)
+                else:
+                    self.vfs.link_raw(path, target)
+                entries[rel.replace(os.sep, "/")] = [is_dir, 0 if is_dir else size, mtime]
+            meta = {"name": name, "created": time.time(), "entries": entries}
+            self.vfs.write_raw(self.meta_path(name), json.dumps(meta).encode("utf-8"))
+        return name, len(entries)
+
+    def list(self):
+        # (name, created, files, bytes) for each snapshot, oldest first
+        out = []
+        for name in self.names():
+            meta = self.metadata(name)
+            files = [e for e in meta["entries"].values() if not e[0]]
+            out.append((name, meta["created"], len(files), sum(e[1] for e in files)))
+        return sorted(out, key=lambda s: s[1])
+
+    def diff(self, old, new=None):
+        # (added, removed, modified) relative paths from snapshot old to
+        # snapshot new, or to the live disk when new is None
+        before = self.metadata(old)["entries"]
+        after = self.metadata(new)["entries"] if new else self.current()
+        added = sorted(p for p in after if p not in before)
+        removed = sorted(p for p in before if p not in after)
+        modified = sorted(p for p, e in after.items() if p in before and not e[0]
+                          and (before[p][0] or e[1:] != before[p][1:]))
+        return added, removed, modified
+
+    def restore(self, name):
+        # Brings the live disk back to the snapshot, touching only what differs
+        entries = self.metadata(name)["entries"]
+        tree = self.tree(name)
+        vfs = self.vfs
+        with self.lock:
+            live = {os.path.relpath(p, vfs.root).replace(os.sep, "/"): (is_dir, size, mtime)
+                    for p, is_dir, size, mtime in vfs.walk()}
+            changed = 0
+            for rel in sorted(live, key=lambda r: -r.count("/")):
+                kept = entries.get(rel)
+                is_dir, size, mtime = live[rel]
+                if kept is not None and kept[0] == is_dir and (is_dir or [size, mtime] == kept[1:]):
+                    continue
+                vfs.remove(os.path.join(vfs.root, *rel.split("/")))
+                changed += 1
+            for rel in sorted(entries, key=lambda r: r.count("/")):
+                path = os.path.join(vfs.root, *rel.split("/"))
+                if vfs.exists(path):
+                    continue
+                if entries[rel][0]:
+                    vfs.mkdir(path)
+                else:
+                    vfs.link_raw(os.path.join(tree, *rel.split("/")), path)
+                    if vfs.store is not None:
+                        vfs.store.added(path)
+                    vfs.changed(path)
+                changed += 1
+        return changed
+
+    def delete(self, name):
+        with self.lock:
+            self.metadata(name)
+            tree = self.tree(name)
+            entries = list(self.vfs.walk(tree))
+            for path, is_dir, size, mtime in sorted(entries, key=lambda e: -e[0].count(os.sep)):
+                self.vfs.remove_raw(path)
+            self.vfs.remove_raw(tree)
+            self.vfs.remove_raw(self.meta_path(name))
+        if self.vfs.store is not None:
+            self.vfs.store.garbage = True
+
+
+# ---------- BULK OPERATIONS ----------
+class BulkJob:
+    # A recursive copy, move or delete of several paths. File work is spread
+    # over a thread pool; progress can be read and cancel() called from any
+    # thread. Caches are brought up to date once per top-level path at the
+    # end rather than once per file.
+    VERBS = {"copy": "Copied", "move": "Moved", "delete": "Deleted"}
+
+    def __init__(self, vfs, op, sources, target=None, threads=8, rename_conflicts=False):
+        if op not in self.VERBS:
+            raise ValueError(f"Unknown operation: {op}")
+        self.vfs = vfs
+        self.op = op
+        # Only user files: never outside the disk, inside SYSTEM_DIR or the disk itself
+        self.sources = [vfs.resolve(s) for s in sources]
+        self.target = target and vfs.resolve(target)
+        root = os.path.normpath(vfs.root)
+        if any(os.path.normpath(s) == root for s in self.sources):
+            raise PermissionError(errno.EACCES, "Cannot copy, move or delete the whole disk", vfs.root)
+        self.threads = threads
+        self.rename_conflicts = rename_conflicts  # "name (copy)" instead of failing, as Explorer pastes
+        self.lock = threading.Lock()
+        self.files = self.bytes = 0
+        self.total_files = self.total_bytes = 0
+        self.errors = []
+        self.cancelled = False
+        self.finished = threading.Event()
+        self.failure = None
+        self.started = None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def destination(self, src):
+        vfs = self.vfs
+        if len(self.sources) > 1 or vfs.isdir(self.target):
+            dst = os.path.join(self.target, os.path.basename(src))
+        else:
+            dst = self.target
+        if os.path.normpath(dst) == src or (dst + os.sep).startswith(src + os.sep):
+            if not self.rename_conflicts or self.op != "copy" or os.path.dirname(dst) != os.path.dirname(src):
+                raise OSError(errno.EINVAL, "Cannot copy or move a folder into itself", dst)
+        if vfs.exists(dst):
+            if not self.rename_conflicts or self.op != "copy":
+                raise FileExistsError(errno.EEXIST, "File exists", dst)
+            stem, ext = os.path.splitext(dst) if not vfs.isdir(src) else (dst, "")
+            n = 1
+            while vfs.exists(dst):
+                dst = f"{stem} (copy{'' if n == 1 else f' {n}'}){ext}"
+                n += 1
+        return dst
+
+    def count(self, size):
+        with self.lock:
+            self.files += 1
+            self.bytes += size
+
+    def run(self):
+        self.started = time.perf_counter()
+        done = []  # (source, destination) of each top-level path worked on
+        try:
+            if self.op == "delete":
+                self.delete(done)
+            else:
+                pairs = [(src, self.destination(src)) for src in self.sources]
+                if self.op == "move":
+                    self.move(pairs, done)
+                else:
+                    self.copy(pairs, done)
+        except BaseException as e:
+            self.failure = e
+            raise
+        finally:
+            self.refresh(done)
+            self.finished.set()
+        return self.describe()
+
+    def start(self):
+        # run() on a thread of its own; failures land in self.failure
+        threading.Thread(target=self.run_quietly, name="darko-bulk", daemon=True).start()
+
+    def run_quietly(self):
+        try:
+            self.run()
+        except Exception:
+            pass
+
+    def plan(self, src, dst):
+        # Directories (created in order) and files (size) below src
+        dirs, files = [], []
+        if not self.vfs.isdir(src):
+            files.append((src, dst, self.vfs.getsize(src)))
+            return dirs, files
+        dirs.append(dst)
+        for path, is_dir, size, mtime in self.vfs.walk(src):
+            target = dst + path[len(src):]
+            if is_dir:
+                dirs.append(target)
+            else:
+                files.append((path, target, size))
+        return dirs, files
+
+    def spread(self, fn, items):
+        with ThreadPoolExecutor(max_workers=self.threads) as pool:
+            for _ in pool.map(fn, items):
+                pass
+
+    def copy(self, pairs, done):
+        plans = [self.plan(src, dst) for src, dst in pairs]
+        self.total_files = sum(len(files) for dirs, files in plans)
+        self.total_bytes = sum(size for dirs, files in plans for src, dst, size in files)
+        self.vfs.check_space(pairs[0][1], self.total_bytes)
+        for (src, dst), (dirs, files) in zip(pairs, plans):
+            if self.cancelled:
+                break
+            done.append((src, dst))
+            for d in sorted(dirs, key=lambda p: p.count(os.sep)):
+                self.vfs.makedirs_raw(d)
+            self.spread(self.copy_file, files)
+
+    def copy_file(self, item):
+        src, dst, size = item
+        if self.cancelled:
+            return
+        try:
+            self.vfs.copy_raw(src, dst)
+            if self.vfs.store is not None:
+                self.vfs.store.added(dst)
+            self.count(size)
+        except OSError as e:
+            self.errors.append(f"{src}: {e}")
+
+    def move(self, pairs, done):
+        self.total_files = len(pairs)
+        for src, dst in pairs:
+            if self.cancelled:
+                break
+            # One rename per top-level path, however many files are below it
+            self.vfs.rename_raw(src, dst)
+            done.append((src, dst))
+            self.count(0)
+
+    def delete(self, done):
+        plans = [(src, self.plan(src, src)) for src in self.sources]
+        self.total_files = sum(len(files) for src, (dirs, files) in plans)
+        self.total_bytes = sum(size for src, (dirs, files) in plans for path, target, size in files)
+        for src, (dirs, files) in plans:
+            if self.cancelled:
+                break
+            done.append((src, None))
+            self.spread(self.delete_file, files)
+            for d in sorted(dirs, key=lambda p: -p.count(os.sep)):
+                if self.cancelled:
+                    break
+                try:
+                    self.vfs.remove_raw(d)
+                except OSError as e:
+                    self.errors.append(f"{d}: {e}")
+
+    def delete_file(self, item):
+        path, target, size = item
+        if self.cancelled:
+            return
+        try:
+            if self.vfs.store is not None:
+                self.vfs.store.forget(path)
+            self.vfs.remove_raw(path)
+            self.count(size)
+        except OSError as e:
+            self.errors.append(f"{path}: {e}")
+
+    def refresh(self, done):
+        vfs = self.vfs
+        for src, dst in done:
+            if self.op == "copy":
+                vfs.added(dst)
+            elif self.op == "move":
+                vfs.renamed(src, dst)
+            elif vfs.exists(src):
+                vfs.added(src)  # cancelled or partly failed: re-read what is left
+            else:
+                vfs.removed(src)
+
+    def describe(self):
+        elapsed = max(time.perf_counter() - (self.started or time.perf_counter()), 1e-6)
+        mb, total_mb = self.bytes / (1024 * 1024), self.total_bytes / (1024 * 1024)
+        text = (f"{self.VERBS[self.op]} {self.files}/{self.total_files} files, {mb:.1f}/{total_mb:.1f} MB "
+                f"({mb / elapsed:.1f} MB/s, {self.files / elapsed:.0f} files/s)")
+        if self.cancelled:
+            text += ", cancelled"
+        if self.errors:
+            text += f", {len(self.errors)} failed"
+        return text
+
+    def fraction(self):
+        if self.total_bytes:
+            return self.bytes / self.total_bytes
+        return self.files / self.total_files if self.total_files else 0
+
+
+# ---------- VFS ----------
+class VFS:
+    # v_disk operations shared by the desktop, Explorer, editor and terminal.
+    # Every mutation keeps the size index, the search index, the catalog and the listing cache current.
+    # Contents go through a ChunkStore when one is configured.
+    def __init__(self, root, quota=None, store=None):
+        self.root = root
+        self.quota = quota  # bytes; writes past it fail with ENOSPC
+        os.makedirs(root, exist_ok=True)
+        self.index = DiskIndex(self)
+        self.search = SearchIndex(self, os.path.join(root, SYSTEM_DIR, "search.idx"))
+        self.catalog = Catalog(self, os.path.join(root, SYSTEM_DIR, "catalog.db"))
+        self.listings = ListingCache()
+        self.store = ChunkStore(self, store) if store else None
+        self.host_files = self.store is None  # paths hold the real bytes, so large files can be mmap'd
+        self.snapshots = Snapshots(self)
+
+    def path(self, name, cwd=None):
+        return self.resolve(os.path.join(cwd or self.root, name))
+
+    def resolve(self, path):
+        # path in root/name form; anything outside the disk or inside SYSTEM_DIR is refused
+        root = os.path.realpath(self.root)
+        real = os.path.realpath(path)
+        try:
+            inside = os.path.commonpath([real, root]) == root
+        except ValueError:  # another drive
+            inside = False
+        if not inside:
+            raise PermissionError(errno.EACCES, "Outside the virtual disk", path)
+        rel = os.path.relpath(real, root)
+        if rel == ".":
+            return self.root
+        if rel.split(os.sep, 1)[0] == SYSTEM_DIR:
+            raise PermissionError(errno.EACCES, "Reserved for DarkoOS", path)
+        return os.path.join(self.root, rel)
+
+    def changed(self, path):
+        self.index.update(path)
+        self.search.update(path)
+        self.catalog.update(path)
+        self.listings.invalidate_entry(path)
+
+    def added(self, path):
+        # A whole new subtree, after a bulk copy
+        self.index.refresh(path)
+        self.search.refresh(path)
+        self.catalog.refresh(path)
+        self.listings.invalidate_entry(path)
+
+    def removed(self, path):
+        self.index.remove(path)
+        self.search.remove(path)
+        self.catalog.remove(path)
+        self.listings.invalidate_entry(path)
+
+    def renamed(self, old_path, new_path):
+        self.index.rename(old_path, new_path)
+        self.search.rename(old_path, new_path)
+        self.catalog.rename(old_path, new_path)
+        self.listings.invalidate_entry(old_path)
+        self.listings.invalidate_entry(new_path)
+
+    def check_space(self, path, size):
+        if self.quota is None:
+            return
+        try:
+            old = self.getsize(path)
+        except OSError:
+            old = 0
+        if self.index.used_bytes() + size - old > self.quota:
+            raise OSError(errno.ENOSPC, "Not enough space on the virtual disk", path)
+
+    def listdir(self, path=None):
+        return self.listings.get(path or self.root)
+
+    def scandir(self, path, follow_symlinks=True):
+        # (name, path, is_dir) of each entry as the directory is read
+        with os.scandir(path) as it:
+            for e in it:
+                if e.name != SYSTEM_DIR:
+                    yield e.name, e.path, e.is_dir(follow_symlinks=follow_symlinks)
+
+    def walk(self, top=None):
+        # (path, is_dir, size, mtime_ns) of everything below top, SYSTEM_DIR excluded
+        stack = [top or self.root]
+        while stack:
+            try:
+                it = os.scandir(stack.pop())
+            except OSError:
+                continue
+            with it:
+                for e in it:
+                    if e.name == SYSTEM_DIR:
+                        continue
+                    try:
+                        st = e.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    is_dir = stat.S_ISDIR(st.st_mode)
+                    yield e.path, is_dir, st.st_size, st.st_mtime_ns
+                    if is_dir:
+                        stack.append(e.path)
+
+    def info(self, path):
+        # (is_dir, size, mtime_ns)
+        st = os.stat(path)
+        return stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime_ns
+
+    def exists(self, path):
+        return os.path.exists(path)
+
+    def isdir(self, path):
+        return os.path.isdir(path)
+
+    def getsize(self, path):
+        return os.path.getsize(path)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+        self.changed(path)
+
+    def touch(self, path):
+        # Replaced, never truncated in place: a snapshot may link the old file
+        self.write_raw(path, b"")
+        self.changed(path)
+
+    def remove(self, path):
+        if os.path.isdir(path):
+            os.rmdir(path)
+        else:
+            if self.store is not None:
+                self.store.forget(path)
+            os.remove(path)
+        self.removed(path)
+
+    def rename(self, old_path, new_path):
+        os.rename(old_path, new_path)
+        self.renamed(old_path, new_path)
+
+    # -- bytes as stored, below the chunk store --
+    def read_raw(self, path, limit=-1):
+        with open(path, "rb") as f:
+            return f.read(limit)
+
+    def write_raw(self, path, data):
+        atomic_write(path, lambda f: f.write(data))
+
+    def remove_raw(self, path):
+        if os.path.isdir(path):
+            os.rmdir(path)
+        else:
+            os.remove(path)
+
+    def link_raw(self, src, dst):
+        os.link(src, dst)
+
+    def copy_raw(self, src, dst):
+        shutil.copyfile(src, dst)
+
+    def rename_raw(self, src, dst):
+        os.rename(src, dst)
+
+    def makedirs_raw(self, path):
+        os.makedirs(path, exist_ok=True)
+
+    def list_raw(self, path):
+        try:
+            return os.listdir(path)
+        except OSError:
+            return []
+
+    # -- file contents --
+    def read_bytes(self, path, limit=-1):
+        data = self.read_raw(path, limit)
+        if data.startswith(MANIFEST_MAGIC):
+            store = self.store or ChunkStore(self, "raw")  # written while deduplication was on
+            return store.read(data if limit < 0 else self.read_raw(path), limit)
+        return data
+
+    def read_text(self, path):
+        return self.read_bytes(path).decode("utf-8").replace("\r\n", "\n")
+
+    def write_text(self, path, text):
+        data = text.encode("utf-8")
+        store = self.store
+        with store.writing() if store is not None else contextlib.nullcontext():
+            if store is not None:
+                data = store.write(path, data)
+            self.check_space(path, len(data))
+            self.write_raw(path, data)
+        self.changed(path)
+
+
+# ---------- DISK IMAGE ----------
+class ImageDisk:
+    # v_disk as one preallocated container file, memory-mapped: a header
+    # block, the block allocation bitmap, a table of fixed-size directory
+    # entries, then data blocks. Each file is stored as up to MAX_EXTENTS
+    # runs of blocks. Writes go to fresh blocks and the entry is rewritten
+    # last, so an interrupted write leaves the old contents in place.
+    # Entries may share extents (link()); blocks are freed with the last one.
+    MAGIC = b"DARKOIMG"
+    VERSION = 1
+    BLOCK = 4096
+    ENTRY = 256
+    NAME_MAX = 128
+    MAX_EXTENTS = 12
+    HEADER = struct.Struct("<8sIIQIIIII")  # magic, version, block size, blocks, entries, bitmap at/blocks, table at/blocks
+    RECORD = struct.Struct("<BBHIQQ")  # used, is_dir, name length, parent, size, mtime_ns
+    EXTENT = struct.Struct("<II")  # first block, block count
+    NAME_AT = RECORD.size
+    EXTENTS_AT = NAME_AT + NAME_MAX
+
+    def __init__(self, path, size=None):
+        self.path = path
+        self.lock = threading.RLock()
+        new = not os.path.exists(path)
+        if new:
+            if not size:
+                raise FileNotFoundError(errno.ENOENT, "No disk image", path)
+            self.format(path, size)
+        self.file = open(path, "r+b")
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        (magic, version, block, self.blocks, self.entries,
+         bitmap_at, bitmap_len, table_at, table_len) = self.HEADER.unpack_from(self.map, 0)
+        if magic != self.MAGIC or version != self.VERSION or block != self.BLOCK:
+            raise ValueError("Not a DarkoOS disk image: " + path)
+        self.bitmap = bitmap_at * self.BLOCK
+        self.table = table_at * self.BLOCK
+        self.meta_blocks = table_at + table_len
+        self.nodes = {}
+        if new:
+            self.set_bits(0, self.meta_blocks, True)
+            self.put(0, (True, 0, 0, time.time_ns(), "", ()))
+        self.mount()
+
+    @classmethod
+    def format(cls, path, size):
+        blocks = size // cls.BLOCK
+        entries = min(1 << 20, max(1024, blocks // 4))  # one per 16 KB, as ext4 does
+        bitmap_len = -(-blocks // (8 * cls.BLOCK))
+        table_len = -(-entries * cls.ENTRY // cls.BLOCK)
+        if blocks <= 1 + bitmap_len + table_len:
+            raise ValueError("Disk image too small")
+        with open(path, "wb") as f:
+            # Sparse on most hosts: space is taken as blocks are first written
+            f.truncate(blocks * cls.BLOCK)
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, cls.BLOCK, blocks, entries,
+                                    1, bitmap_len, 1 + bitmap_len, table_len))
+
+    def close(self):
+        with self.lock:
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+
+    # -- directory table --
+    def mount(self):
+        self.nodes = {}  # entry -> (is_dir, parent, size, mtime_ns, name, extents)
+        self.children = {}  # dir entry -> {name: entry}
+        used = self.map[self.table:self.table + self.entries * self.ENTRY:self.ENTRY]
+        self.spare = [i for i in range(self.entries - 1, -1, -1) if not used[i]]  # pop() gives low slots first
+        for i in range(self.entries):
+            if used[i]:
+                self.nodes[i] = self.get(i)
+        for i, node in self.nodes.items():
+            if node[0]:
+                self.children.setdefault(i, {})
+            if i:
+                self.children.setdefault(node[1], {})[node[4]] = i
+        self.refs = {}  # extent -> entries using it
+        for node in self.nodes.values():
+            for extent in node[5]:
+                self.refs[extent] = self.refs.get(extent, 0) + 1
+        self.load_free()
+
+    def get(self, i):
+        off = self.table + i * self.ENTRY
+        used, is_dir, length, parent, size, mtime = self.RECORD.unpack_from(self.map, off)
+        name = bytes(self.map[off + self.NAME_AT:off + self.NAME_AT + length]).decode("utf-8")
+        extents = []
+        for k in range(self.MAX_EXTENTS):
+            start, count = self.EXTENT.unpack_from(self.map, off + self.EXTENTS_AT + k * self.EXTENT.size)
+            if not count:
+                break
+            extents.append((start, count))
+        return bool(is_dir), parent, size, mtime, name, tuple(extents)
+
+    def put(self, i, node):
+        is_dir, parent, size, mtime, name, extents = node
+        raw = name.encode("utf-8")
+        off = self.table + i * self.ENTRY
+        self.map[off:off + self.ENTRY] = bytes(self.ENTRY)
+        for k, (start, count) in enumerate(extents):
+            self.EXTENT.pack_into(self.map, off + self.EXTENTS_AT + k * self.EXTENT.size, start, count)
+        self.map[off + self.NAME_AT:off + self.NAME_AT + len(raw)] = raw
+        self.RECORD.pack_into(self.map, off, 1, is_dir, len(raw), parent, size, mtime)
+        self.nodes[i] = node
+
+    # -- block allocator --
+    def load_free(self):
+        # Free runs from the bitmap; whole 0x00/0xff bytes are skipped at C speed
+        bits = self.map[self.bitmap:self.bitmap + (self.blocks + 7) // 8]
+        self.free = []  # sorted [first block, count]
+        for m in re.finditer(rb"\x00+|[^\x00\xff]", bits):
+            if m.group()[0] == 0:
+                self.add_free(m.start() * 8, (m.end() - m.start()) * 8)
+            else:
+                for b in range(8):
+                    if not m.group()[0] >> b & 1:
+                        self.add_free(m.start() * 8 + b, 1)
+        if self.free and self.free[-1][0] + self.free[-1][1] > self.blocks:
+            self.free[-1][1] = self.blocks - self.free[-1][0]
+            if self.free[-1][1] <= 0:
+                self.free.pop()
+        self.free_blocks = sum(run[1] for run in self.free)
+
+    def add_free(self, start, count):
+        # Append-only variant of release() for load_free, which goes in order
+        if self.free and self.free[-1][0] + self.free[-1][1] == start:
+            self.free[-1][1] += count
+        else:
+            self.free.append([start, count])
+
+    def set_bits(self, start, count, value):
+        end = start + count
+        while start < end and start % 8:
+            self.set_bit(start, value)
+            start += 1
+        whole = (end - start) // 8
+        if whole:
+            off = self.bitmap + start // 8
+            self.map[off:off + whole] = (b"\xff" if value else b"\x00") * whole
+            start += whole * 8
+        while start < end:
+            self.set_bit(start, value)
+            start += 1
+
+    def set_bit(self, block, value):
+        off = self.bitmap + block // 8
+        if value:
+            self.map[off] |= 1 << block % 8
+        else:
+            self.map[off] &= ~(1 << block % 8) & 0xFF
+
+    def allocate(self, count):
+        # First run that fits, else the first runs in disk order
+        if count > self.free_blocks:
+            raise OSError(errno.ENOSPC, "Not enough space on the virtual disk")
+        taken = []
+        for i, (start, n) in enumerate(self.free):
+            if n >= count:
+                taken.append((i, count))
+                break
+        else:
+            need = count
+            for i, (start, n) in enumerate(self.free):
+                taken.append((i, min(n, need)))
+                need -= taken[-1][1]
+                if not need:
+                    break
+            if len(taken) > self.MAX_EXTENTS:
+                raise OSError(errno.ENOSPC, "Virtual disk too fragmented for this file")
+        extents = []
+        for i, n in reversed(taken):
+            run = self.free[i]
+            extents.append((run[0], n))
+            self.set_bits(run[0], n, True)
+            run[0] += n
+            run[1] -= n
+            if not run[1]:
+                del self.free[i]
+        self.free_blocks -= count
+        return tuple(reversed(extents))
+
+    def release(self, extents):
+        for start, count in extents:
+            self.set_bits(start, count, False)
+            i = bisect.bisect(self.free, [start, count])
+            self.free.insert(i, [start, count])
+            if i + 1 < len(self.free) and start + count == self.free[i + 1][0]:
+                self.free[i][1] += self.free.pop(i + 1)[1]
+            if i and self.free[i - 1][0] + self.free[i - 1][1] == start:
+                self.free[i - 1][1] += self.free.pop(i)[1]
+            self.free_blocks += count
+
+    def unref(self, extents):
+        # Blocks go back to the allocator once no entry refers to them
+        for extent in extents:
+            self.refs[extent] -= 1
+            if not self.refs[extent]:
+                del self.refs[extent]
+                self.release((extent,))
+
+    def used_bytes(self):
+        return (self.blocks - self.free_blocks) * self.BLOCK
+
+    def capacity(self):
+        return self.blocks * self.BLOCK
+
+    # -- paths (tuples of names below the root) --
+    def lookup(self, parts):
+        i = 0
+        for name in parts:
+            i = self.children.get(i, {}).get(name)
+            if i is None:
+                raise FileNotFoundError(errno.ENOENT, "No such file or directory", "/".join(parts))
+        return i
+
+    def parent(self, parts):
+        if not parts:
+            raise PermissionError(errno.EPERM, "Operation not permitted on the root", "")
+        i = self.lookup(parts[:-1])
+        if not self.nodes[i][0]:
+            raise NotADirectoryError(errno.ENOTDIR, "Not a directory", "/".join(parts[:-1]))
+        if len(parts[-1].encode("utf-8")) > self.NAME_MAX:
+            raise OSError(errno.ENAMETOOLONG, "File name too long", "/".join(parts))
+        return i
+
+    def listdir(self, parts):
+        with self.lock:
+            i = self.lookup(parts)
+            if not self.nodes[i][0]:
+                raise NotADirectoryError(errno.ENOTDIR, "Not a directory", "/".join(parts))
+            return [(name, self.nodes[c][0]) for name, c in self.children[i].items()]
+
+    def stat(self, parts):
+        with self.lock:
+            return self.nodes[self.lookup(parts)]
+
+    def touch_dir(self, i):
+        node = self.nodes[i]
+        self.put(i, node[:3] + (time.time_ns(),) + node[4:])
+
+    def create(self, parts, is_dir):
+        parent = self.parent(parts)
+        if parts[-1] in self.children[parent]:
+            raise FileExistsError(errno.EEXIST, "File exists", "/".join(parts))
+        if not self.spare:
+            raise OSError(errno.ENOSPC, "Virtual disk directory table is full")
+        i = self.spare.pop()
+        self.put(i, (is_dir, parent, 0, time.time_ns(), parts[-1], ()))
+        self.children[parent][parts[-1]] = i
+        if is_dir:
+            self.children[i] = {}
+        self.touch_dir(parent)
+        return i
+
+    def mkdir(self, parts):
+        with self.lock:
+            self.create(parts, True)
+
+    def read(self, parts, limit=-1):
+        with self.lock:
+            is_dir, parent, size, mtime, name, extents = self.nodes[self.lookup(parts)]
+            if is_dir:
+                raise IsADirectoryError(errno.EISDIR, "Is a directory", "/".join(parts))
+            left = size if limit < 0 else min(size, limit)
+            out = []
+            for start, count in extents:
+                if left <= 0:
+                    break
+                off = start * self.BLOCK
+                n = min(left, count * self.BLOCK)
+                out.append(self.map[off:off + n])
+                left -= n
+            return b"".join(out)
+
+    def write(self, parts, data):
+        with self.lock:
+            created = False
+            try:
+                i = self.lookup(parts)
+            except FileNotFoundError:
+                i = self.create(parts, False)
+                created = True
+            node = self.nodes[i]
+            if node[0]:
+                raise IsADirectoryError(errno.EISDIR, "Is a directory", "/".join(parts))
+            try:
+                extents = self.allocate(-(-len(data) // self.BLOCK)) if data else ()
+            except OSError:
+                if created:
+                    self.remove(parts)
+                raise
+            pos = 0
+            for start, count in extents:
+                off = start * self.BLOCK
+                chunk = data[pos:pos + count * self.BLOCK]
+                self.map[off:off + len(chunk)] = chunk
+                pos += len(chunk)
+            for extent in extents:
+                self.refs[extent] = 1
+            self.put(i, (False, node[1], len(data), time.time_ns(), node[4], extents))
+            self.unref(node[5])
+
+    def remove(self, parts):
+        with self.lock:
+            i = self.lookup(parts)
+            if not i:
+                raise PermissionError(errno.EPERM, "Operation not permitted on the root", "")
+            is_dir, parent, size, mtime, name, extents = self.nodes[i]
+            if is_dir and self.children[i]:
+                raise OSError(errno.ENOTEMPTY, "Directory not empty", "/".join(parts))
+            self.map[self.table + i * self.ENTRY] = 0
+            del self.nodes[i]
+            self.children.pop(i, None)
+            del self.children[parent][name]
+            self.spare.append(i)
+            self.unref(extents)
+            self.touch_dir(parent)
+
+    def link(self, old_parts, new_parts):
+        # A second entry for the same blocks, as a hardlink would be
+        with self.lock:
+            node = self.nodes[self.lookup(old_parts)]
+            if node[0]:
+                raise IsADirectoryError(errno.EISDIR, "Is a directory", "/".join(old_parts))
+            i = self.create(new_parts, False)
+            self.put(i, (False, self.nodes[i][1], node[2], node[3], new_parts[-1], node[5]))
+            for extent in node[5]:
+                self.refs[extent] += 1
+
+    def rename(self, old_parts, new_parts):
+        with self.lock:
+            i = self.lookup(old_parts)
+            if not i:
+                raise PermissionError(errno.EPERM, "Operation not permitted on the root", "")
+            if new_parts == old_parts:
+                return
+            if new_parts[:len(old_parts)] == old_parts:
+                raise OSError(errno.EINVAL, "Cannot move a folder into itself", "/".join(new_parts))
+            parent = self.parent(new_parts)
+            target = self.children[parent].get(new_parts[-1])
+            if target is not None:
+                # Like os.rename: a file replaces a file, a folder an empty folder
+                if self.nodes[target][0] != self.nodes[i][0]:
+                    raise IsADirectoryError(errno.EISDIR, "Is a directory", "/".join(new_parts))
+                self.remove(new_parts)
+            node = self.nodes[i]
+            del self.children[node[1]][node[4]]
+            self.touch_dir(node[1])
+            self.put(i, (node[0], parent, node[2], node[3], new_parts[-1], node[5]))
+            self.children[parent][new_parts[-1]] = i
+            self.touch_dir(parent)
+
+
+class ImageUsage:
+    # DiskIndex stand-in for an ImageVFS: usage comes from the allocator, so
+    # there is nothing to walk or keep current.
+    loaded = True
+
+    def __init__(self, vfs):
+        self.vfs = vfs
+
+    def used_bytes(self, wait=True):
+        return self.vfs.disk.used_bytes()
+
+    def dir_bytes(self, path, recursive=True):
+        if recursive:
+            return sum(size for p, is_dir, size, mtime in self.vfs.walk(path) if not is_dir)
+        return sum(self.vfs.getsize(p) for name, p, is_dir in self.vfs.scandir(path) if not is_dir)
+
+    def update(self, path):
+        pass
+
+    def remove(self, path):
+        pass
+
+    def rename(self, old_path, new_path):
+        pass
+
+    def refresh(self, path):
+        pass
+
+    def reconcile(self):
+        pass
+
+
+class ImageListings:
+    # ListingCache stand-in for an ImageVFS. Nothing outside the VFS can
+    # change the image, so a listing stays valid until a mutation drops it.
+    watcher = None
+
+    def __init__(self, vfs):
+        self.vfs = vfs
+        self.lock = threading.Lock()
+        self.cache = {}
+
+    def lookup(self, path):
+        path = os.path.normpath(path)
+        with self.lock:
+            entries = self.cache.get(path)
+        if entries is None:
+            try:
+                entries = list(self.vfs.scandir(path))
+            except OSError:
+                return None
+            with self.lock:
+                self.cache[path] = entries
+        return entries
+
+    def get(self, path):
+        entries = self.lookup(path)
+        if entries is None:
+            raise FileNotFoundError(errno.ENOENT, "No such file or directory", path)
+        return entries
+
+    def store(self, path, mtime, entries):
+        pass
+
+    def cached(self, path):
+        return os.path.normpath(path) in self.cache
+
+    def entry_count(self):
+        with self.lock:
+            return sum(len(entries) for entries in self.cache.values())
+
+    def clear(self):
+        with self.lock:
+            self.cache.clear()
+
+    def current(self, path):
+        return self.cached(path)
+
+    def invalidate(self, path):
+        with self.lock:
+            self.cache.pop(os.path.normpath(path), None)
+
+    def invalidate_entry(self, path):
+        path = os.path.normpath(path)
+        self.invalidate(os.path.dirname(path))
+        prefix = path + os.sep
+        with self.lock:
+            for d in [k for k in self.cache if k == path or k.startswith(prefix)]:
+                del self.cache[d]
+
+
+class ImageVFS(VFS):
+    # The VFS on a single-file disk image. Paths keep the root/name form, so
+    # callers cannot tell the backends apart; the host root directory is
+    # only used for SYSTEM_DIR. The image size is the quota.
+    host_files = False
+
+    def __init__(self, root, image_path, size, store=None):
+        self.root = root
+        os.makedirs(os.path.join(root, SYSTEM_DIR), exist_ok=True)
+        self.disk = ImageDisk(image_path, size)
+        self.quota = self.disk.capacity()
+        self.index = ImageUsage(self)
+        self.search = SearchIndex(self, os.path.join(root, SYSTEM_DIR, "search.idx"))
+        self.catalog = Catalog(self, os.path.join(root, SYSTEM_DIR, "catalog.db"))
+        self.listings = ImageListings(self)
+        self.store = ChunkStore(self, store) if store else None  # chunks go inside the image
+        self.snapshots = Snapshots(self)
+
+    def parts(self, path):
+        rel = os.path.relpath(os.path.normpath(path), os.path.normpath(self.root))
+        if rel == ".":
+            return ()
+        if escapes(rel):
+            raise FileNotFoundError(errno.ENOENT, "Outside the virtual disk", path)
+        return tuple(rel.split(os.sep))
+
+    def check_space(self, path, size):
+        pass  # the allocator refuses what does not fit
+
+    def scandir(self, path, follow_symlinks=True):
+        for name, is_dir in self.disk.listdir(self.parts(path)):
+            if name != SYSTEM_DIR:
+                yield name, os.path.join(path, name), is_dir
+
+    def walk(self, top=None):
+        stack = [top or self.root]
+        while stack:
+            d = stack.pop()
+            try:
+                entries = self.disk.listdir(self.parts(d))
+            except OSError:
+                continue
+            for name, is_dir in entries:
+                if name == SYSTEM_DIR:
+                    continue
+                path = os.path.join(d, name)
+                try:
+                    is_dir, size, mtime = self.info(path)
+                except OSError:
+                    continue
+                yield path, is_dir, size, mtime
+                if is_dir:
+                    stack.append(path)
+
+    def info(self, path):
+        is_dir, parent, size, mtime, name, extents = self.disk.stat(self.parts(path))
+        return is_dir, size, mtime
+
+    def exists(self, path):
+        try:
+            self.disk.stat(self.parts(path))
+            return True
+        except OSError:
+            return False
+
+    def isdir(self, path):
+        try:
+            return self.disk.stat(self.parts(path))[0]
+        except OSError:
+            return False
+
+    def getsize(self, path):
+        return self.info(path)[1]
+
+    def mkdir(self, path):
+        self.disk.mkdir(self.parts(path))
+        self.changed(path)
+
+    def touch(self, path):
+        self.disk.write(self.parts(path), b"")
+        self.changed(path)
+
+    def remove(self, path):
+        if self.store is not None and not self.isdir(path):
+            self.store.forget(path)
+        self.disk.remove(self.parts(path))
+        self.removed(path)
+
+    def rename(self, old_path, new_path):
+        self.disk.rename(self.parts(old_path), self.parts(new_path))
+        self.renamed(old_path, new_path)
+
+    def read_raw(self, path, limit=-1):
+        return self.disk.read(self.parts(path), limit)
+
+    def write_raw(self, path, data):
+        self.disk.write(self.parts(path), data)
+
+    def remove_raw(self, path):
+        self.disk.remove(self.parts(path))
+
+    def link_raw(self, src, dst):
+        self.disk.link(self.parts(src), self.parts(dst))
+
+    def copy_raw(self, src, dst):
+        # A clone: the copy shares blocks until either side is rewritten
+        self.link_raw(src, dst)
+
+    def rename_raw(self, src, dst):
+        self.disk.rename(self.parts(src), self.parts(dst))
+
+    def makedirs_raw(self, path):
+        parts = self.parts(path)
+        for i in range(1, len(parts) + 1):
+            try:
+                self.disk.mkdir(parts[:i])
+            except FileExistsError:
+                pass
+
+    def list_raw(self, path):
+        try:
+            return [name for name, is_dir in self.disk.listdir(self.parts(path))]
+        except OSError:
+            return []
+
+
+# ---------- HISTORY ----------
+class HistoryLog:
+    # Terminal commands, one per line, appended to a file under SYSTEM_DIR and
+    # read through mmap, so opening it costs nothing however long it is.
+    # Up/Down walk the map backwards from a byte offset and need no index.
+    # Searches use one that load() builds on a worker: every distinct command
+    # once, newest first, joined into a single string for str.find and re to
+    # scan in C. Commands run since then are searched from a list first.
+    def __init__(self, path):
+        self.path = path
+        self.map = None
+        self.lock = threading.Lock()
+        self.recent = []  # appended this session, oldest first
+        self.blob = None  # "\n" + distinct commands, newest first, each followed by "\n"
+        self.loaded = False
+
+    def view(self):
+        # The map, grown when the file has; b"" while there is nothing to map
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return b""
+        with self.lock:
+            if self.map is None or len(self.map) < size:
+                # The old map is left to be freed once no reader holds it
+                with open(self.path, "rb") as f:
+                    self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+            return self.map if self.map is not None else b""
+
+    def end(self):
+        # Offset just after the last complete entry
+        data = self.view()
+        return data.rfind(b"\n") + 1
+
+    def before(self, offset):
+        # (start, text) of the entry ending right before offset, or None at the top
+        if offset <= 0:
+            return None
+        data = self.view()
+        start = data.rfind(b"\n", 0, offset - 1) + 1
+        return start, data[start:offset - 1].decode("utf-8", "replace")
+
+    def after(self, offset):
+        # (start, text) of the entry following the one at offset, or None at the bottom
+        data = self.view()
+        start = data.find(b"\n", offset) + 1
+        end = data.find(b"\n", start) if start else -1
+        if end < 0:
+            return None
+        return start, data[start:end].decode("utf-8", "replace")
+
+    def append(self, line):
+        # Repeats of the last command are not stored again
+        line = line.replace("\n", " ").strip()
+        if not line:
+            return
+        last = self.before(self.end())
+        if last is not None and last[1] == line:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(line.encode("utf-8") + b"\n")
+        self.recent.append(line)
+
+    def last(self, count):
+        entries = []
+        offset = self.end()
+        while len(entries) < count:
+            entry = self.before(offset)
+            if entry is None:
+                break
+            offset, text = entry
+            entries.append(text)
+        return entries[::-1]
+
+    def load(self):
+        # Worker thread. Commands appended meanwhile are in recent as well
+        data = self.view()
+        lines = bytes(data[:data.rfind(b"\n") + 1]).decode("utf-8", "replace").split("\n")
+        lines.pop()
+        self.blob = "\n" + "".join(line + "\n" for line in dict.fromkeys(reversed(lines)))
+        self.loaded = True
+
+    def index_bytes(self):
+        return len(self.blob) if self.blob is not None else 0
+
+    def matches(self, query, mode="fuzzy"):
+        # Distinct commands, newest first. "prefix": starting with query; "substring":
+        # containing it; "fuzzy": those, then the ones with its characters in order
+        seen = set()
+        blob = self.blob or "\n"
+        if not query:
+            yield from (text for text in reversed(self.recent) if not (text in seen or seen.add(text)))
+            yield from (text for text in blob.split("\n") if text and text not in seen)
+            return
+        needle = "\n" + query if mode == "prefix" else query
+        for text in reversed(self.recent):
+            if (text.startswith(query) if mode == "prefix" else query in text) and text not in seen:
+                seen.add(text)
+                yield text
+        pos = 0
+        while True:
+            found = blob.find(needle, pos)
+            if found < 0:
+                break
+            start = blob.rfind("\n", 0, found + len(needle) - len(query)) + 1
+            pos = blob.find("\n", found + len(needle))
+            text = blob[start:pos]
+            if text not in seen:
+                seen.add(text)
+                yield text
+        if mode != "fuzzy" or len(query) < 2:
+            return
+        pattern = re.compile("[^\n]*?".join(map(re.escape, query)))
+        for text in reversed(self.recent):
+            if text not in seen and pattern.search(text):
+                seen.add(text)
+                yield text
+        pos = 0
+        while True:
+            match = pattern.search(blob, pos)
+            if match is None:
+                break
+            start = blob.rfind("\n", 0, match.start()) + 1
+            pos = blob.find("\n", match.end())
+            text = blob[start:pos]
+            if text not in seen:
+                seen.add(text)
+                yield text
+
+
+class HistoryCursor:
+    # One terminal's place in the shared log. Up with nothing typed steps
+    # through every entry; with a start typed, through the distinct commands
+    # beginning with it. Running a command puts the cursor back at the end.
+    def __init__(self, log):
+        self.log = log
+        self.reset()
+
+    def reset(self):
+        self.pos = None  # offset of the entry shown, None while at the input line
+        self.draft = ""
+        self.search = None
+        self.found = []
+        self.index = -1
+
+    def up(self, draft):
+        if self.pos is None and self.index < 0:
+            self.reset()
+            self.draft = draft
+            if draft:
+                self.search = self.log.matches(draft, "prefix")
+            else:
+                self.pos = self.log.end()
+        if self.search is not None:
+            if self.index + 1 == len(self.found):
+                text = next(self.search, None)
+                if text is None:
+                    return None
+                self.found.append(text)
+            self.index += 1
+            return self.found[self.index]
+        entry = self.log.before(self.pos)
+        if entry is None:
+            return None
+        self.pos, text = entry
+        return text
+
+    def down(self):
+        # The newer entry, or the draft again past the newest; None when already there
+        if self.search is not None:
+            if self.index < 0:
+                return None
+            self.index -= 1
+            return self.found[self.index] if self.index >= 0 else self.draft
+        if self.pos is None:
+            return None
+        entry = self.log.after(self.pos)
+        if entry is None:
+            draft = self.draft
+            self.reset()
+            return draft
+        self.pos, text = entry
+        return text
+
+
+# ---------- PERF ----------
+class Histogram:
+    # Log-spaced latency buckets: constant memory, percentiles to within a bucket (25%)
+    EDGES = [0.01 * 1.25 ** i for i in range(80)]  # ms, 0.01 ms up to about 9 minutes
+
+    def __init__(self):
+        self.counts = [0] * (len(self.EDGES) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(self.EDGES, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        target, seen = p / 100 * self.count, 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target and n:
+                return min(self.EDGES[i] if i < len(self.EDGES) else self.max, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "total_ms": round(self.total, 3), "mean_ms": round(self.mean(), 3),
+                "p50_ms": round(self.percentile(50), 3), "p90_ms": round(self.percentile(90), 3),
+                "p99_ms": round(self.percentile(99), 3), "max_ms": round(self.max, 3),
+                "buckets": {f"{self.EDGES[i]:.3f}" if i < len(self.EDGES) else "inf": n
+                            for i, n in enumerate(self.counts) if n}}
+
+
+class PerfStats:
+    # Wall time per named handler or command; add() is safe from any thread
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.started = time.time()
+
+    def add(self, name, ms):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(ms)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.started = time.time()
+
+    def rows(self):
+        # (name, histogram), most total time first
+        with self.lock:
+            return sorted(self.histograms.items(), key=lambda item: -item[1].total)
+
+    def report(self, limit=20):
+        rows = self.rows()
+        if not rows:
+            return "No timings yet\n"
+        lines = [f"{'handler':<48} {'calls':>7} {'total ms':>10} {'mean':>8} {'p90':>8} {'max':>8}\n"]
+        for name, h in rows[:limit]:
+            lines.append(f"{name[:48]:<48} {h.count:>7} {h.total:>10.1f} {h.mean():>8.2f} "
+                         f"{h.percentile(90):>8.2f} {h.max:>8.1f}\n")
+        if len(rows) > limit:
+            lines.append(f"… {len(rows) - limit} more\n")
+        return "".join(lines)
+
+    def to_dict(self):
+        return {"started": self.started, "seconds": round(time.time() - self.started, 3),
+                "handlers": {name: h.to_dict() for name, h in self.rows()}}
+
+
+# ---------- PROCESSES ----------
+PRIORITIES = {"high": 4, "normal": 2, "low": 1}  # CPU share weights
+
+
+class Task:
+    # A generator run one next() at a time; yielding a number sleeps that many seconds
+    def __init__(self, process, gen, name):
+        self.process = process
+        self.gen = gen
+        self.name = name
+        self.wake = 0.0  # perf_counter time it may run again
+        self.cpu = 0.0
+        self.steps = 0
+        self.cancelled = False
+
+
+class Process:
+    def __init__(self, pid, name, kill=None, system=False):
+        self.pid = pid
+        self.name = name
+        self.kill_hook = kill
+        self.system = system  # cannot be killed
+        self.started = time.time()
+        self.tasks = []
+        self.priority = "normal"
+        self.cpu = 0.0  # seconds on the UI thread: task slices and event handlers
+        self.background = 0.0  # seconds of worker-thread CPU
+        self.vtime = 0.0  # cpu divided by the priority weight; the lowest runs next
+        self.recent = 0.0  # share of one CPU over the last sample period
+        self.sampled = 0.0  # cpu + background at that sample
+
+    def state(self, now=None):
+        if not self.tasks:
+            return "idle"
+        now = time.perf_counter() if now is None else now
+        return "running" if any(t.wake <= now for t in self.tasks) else "sleeping"
+
+
+class Scheduler:
+    # Process table and cooperative scheduler. tick() runs task slices until its
+    # budget is spent, always taking the process that has had the least CPU
+    # for its priority, so one busy app cannot starve the others. CPU spent
+    # outside tasks (event handlers, worker jobs) is charge()d to the process
+    # too, from any thread.
+    def __init__(self, sample_seconds=1.0):
+        self.lock = threading.Lock()
+        self.processes = OrderedDict()  # pid -> Process
+        self.next_pid = 1
+        self.running = None  # the task inside next() right now
+        self.sample_seconds = sample_seconds
+        self.sampled_at = time.perf_counter()
+
+    def spawn(self, name, kill=None, system=False):
+        with self.lock:
+            process = Process(self.next_pid, name, kill, system)
+            self.next_pid += 1
+            # Level with the least-served process, so a newcomer neither waits nor hogs
+            process.vtime = min((p.vtime for p in self.processes.values()), default=0.0)
+            self.processes[process.pid] = process
+        return process
+
+    def get(self, pid):
+        process = self.processes.get(pid)
+        if process is None:
+            raise ProcessLookupError(f"No process {pid}")
+        return process
+
+    def add_task(self, process, gen, name, delay=0.0):
+        task = Task(process, gen, name)
+        task.wake = time.perf_counter() + delay
+        process.tasks.append(task)
+        return task
+
+    def every(self, process, seconds, fn, name=None):
+        # fn() every so many seconds, the first time one period from now
+        def loop():
+            while True:
+                fn()
+                yield seconds
+        return self.add_task(process, loop(), name or getattr(fn, "__name__", "periodic"), delay=seconds)
+
+    def cancel(self, task):
+        if task in task.process.tasks:
+            task.process.tasks.remove(task)
+        task.cancelled = True
+        if task is not self.running:  # a running task is closed once its slice returns
+            task.gen.close()
+
+    def exit(self, pid):
+        # The process ended on its own, e.g. its window was closed
+        with self.lock:
+            process = self.processes.pop(pid, None)
+        if process is not None:
+            for task in list(process.tasks):
+                self.cancel(task)
+        return process
+
+    def kill(self, pid):
+        process = self.get(pid)
+        if process.system:
+            raise PermissionError(f"Cannot kill system process {pid}")
+        self.exit(pid)
+        if process.kill_hook is not None:
+            process.kill_hook()
+        return process
+
+    def set_priority(self, pid, priority):
+        if priority not in PRIORITIES:
+            raise ValueError(f"Priority must be one of {', '.join(PRIORITIES)}")
+        self.get(pid).priority = priority
+
+    def charge(self, pid, seconds, background=False):
+        with self.lock:
+            process = self.processes.get(pid)
+            if process is None:
+                return
+            if background:
+                process.background += seconds
+            else:
+                process.cpu += seconds
+                process.vtime += seconds / PRIORITIES[process.priority]
+
+    def pick(self, now):
+        best = None
+        for process in list(self.processes.values()):
+            if best is not None and process.vtime >= best[0].vtime:
+                continue
+            for task in process.tasks:
+                if task.wake <= now:
+                    best = (process, task)
+                    break
+        return best
+
+    def tick(self, budget=0.008):
+        # Runs slices for up to budget seconds; returns the seconds until a task is
+        # due next, or None when there are no tasks at all
+        start = time.perf_counter()
+        while True:
+            now = time.perf_counter()
+            best = self.pick(now)
+            if best is None or now - start >= budget:
+                break
+            process, task = best
+            process.tasks.remove(task)
+            process.tasks.append(task)  # round robin within the process
+            self.running = task
+            finished = False
+            try:
+                delay = next(task.gen)
+            except StopIteration:
+                finished = True
+            except Exception:
+                finished = True
+                log.exception("task %s of %s (%s) failed", task.name, process.name, process.pid)
+            finally:
+                self.running = None
+            spent = time.perf_counter() - now
+            task.cpu += spent
+            task.steps += 1
+            self.charge(process.pid, spent)
+            if task.cancelled:
+                task.gen.close()
+            elif finished:
+                if task in process.tasks:
+                    process.tasks.remove(task)
+            else:
+                task.wake = time.perf_counter() + (delay or 0)
+        self.sample()
+        wakes = [t.wake for p in list(self.processes.values()) for t in p.tasks]
+        return max(0.0, min(wakes) - time.perf_counter()) if wakes else None
+
+    def sample(self):
+        now = time.perf_counter()
+        elapsed = now - self.sampled_at
+        if elapsed < self.sample_seconds:
+            return
+        self.sampled_at = now
+        with self.lock:
+            for process in self.processes.values():
+                total = process.cpu + process.background
+                process.recent = (total - process.sampled) / elapsed
+                process.sampled = total
+
+    def table(self):
+        # (pid, name, state, tasks, priority, cpu s, background s, recent %), by pid
+        now = time.perf_counter()
+        return [(p.pid, p.name, p.state(now), len(p.tasks), p.priority, p.cpu, p.background, p.recent * 100)
+                for p in list(self.processes.values())]
+
+    def report(self, sort_recent=False):
+        rows = self.table()
+        if sort_recent:
+            rows.sort(key=lambda row: -(row[7] or 0))
+        lines = [f"{'PID':>5}  {'NAME':<24} {'STATE':<9} {'TASKS':>5} {'PRIO':<7} {'CPU s':>8} {'BG s':>8} {'%CPU':>6}\n"]
+        lines.extend(f"{pid:>5}  {name[:24]:<24} {state:<9} {tasks:>5} {prio:<7} {cpu:>8.2f} {bg:>8.2f} {pct:>6.1f}\n"
+                     for pid, name, state, tasks, prio, cpu, bg, pct in rows)
+        return "".join(lines)
+
+
+# ---------- SHELL ----------
+PROGRAMS = ("cmd", "explorer", "calculator", "browser", "monitor", "taskmgr")
+
+HELP = ("Available commands:\n"
+        "help - show this list\n"
+        "echo <text> - print text\n"
+        "dir - list files\n"
+        "start <program> - start program (cmd, explorer, calculator, browser, monitor, taskmgr, file)\n"
+        "clear - clear screen\n"
+        "mkdir <name> - create folder\n"
+        "touch <name> - create file\n"
+        "rm [-r] <name> - delete file/folder (-r: with everything in it)\n"
+        "cp [-r] <source>... <target> - copy files (-r: folders too)\n"
+        "mv <source>... <target> - move or rename\n"
+        "calc <expression> - calculate (sin, sqrt, log, pi, ...)\n"
+        "calc <expression> for x in start:stop[:step] - evaluate over a range\n"
+        "find <name> - find files and folders by name\n"
+        "grep <text> - find files containing text\n"
+        "snapshot create [name] | list | diff <name> [other] | restore <name> | delete <name>\n"
+        "perf [reset | export <file>] - time spent per command (and per UI handler on the desktop)\n"
+        "ps - list processes\n"
+        "top [count] - processes using the most CPU\n"
+        "kill <pid>... - end processes\n"
+        "history [text] - recent commands, or those matching text\n"
+        "largest [count] - biggest files on the disk\n"
+        "recent [count] - most recently modified files\n"
+        "du [folder] - size of each entry in a folder, folders with everything in them\n"
+        "exit - close terminal\n")
+
+# Commands that may walk or read the whole disk; run on a worker when the shell has one
+BLOCKING_COMMANDS = {"find", "grep", "snapshot", "largest", "recent", "du"}
+
+
+class Shell:
+    # The terminal command set. run() returns the output text; anything that
+    # needs a display goes through the launch/clear/exit hooks, which the GUI
+    # terminal provides and headless runs leave unset. Command timings go to
+    # the monitor's stats when there is one (the GUI's event-loop monitor).
+    # ps/kill/top use the desktop's process table; headless runs get their own,
+    # holding just the shell. history reads the desktop terminal's HistoryLog.
+    # With submit (fn, *args -> Future), BLOCKING_COMMANDS run off the caller's
+    # thread and stream() yields empty pieces until they are done.
+    def __init__(self, vfs, launch=None, clear=None, exit=None, monitor=None, scheduler=None, history=None,
+                 submit=None):
+        self.vfs = vfs
+        self.launch = launch
+        self.on_clear = clear
+        self.on_exit = exit
+        self.monitor = monitor
+        self.stats = monitor.stats if monitor is not None else PerfStats()
+        self.history = history
+        self.submit = submit
+        self.own_scheduler = scheduler is None
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.pid = self.scheduler.spawn("shell", system=True).pid if self.own_scheduler else None
+        self.exited = False
+        self.errors = 0
+        self.commands = {
+            "help": self.cmd_help,
+            "echo": self.cmd_echo,
+            "print": self.cmd_echo,
+            "dir": self.cmd_dir,
+            "ls": self.cmd_dir,
+            "clear": self.cmd_clear,
+            "cls": self.cmd_clear,
+            "start": self.cmd_start,
+            "mkdir": self.cmd_mkdir,
+            "touch": self.cmd_touch,
+            "rm": self.cmd_rm,
+            "cp": self.cmd_cp,
+            "mv": self.cmd_mv,
+            "calc": self.cmd_calc,
+            "find": self.cmd_find,
+            "grep": self.cmd_grep,
+            "snapshot": self.cmd_snapshot,
+            "perf": self.cmd_perf,
+            "ps": self.cmd_ps,
+            "top": self.cmd_top,
+            "kill": self.cmd_kill,
+            "history": self.cmd_history,
+            "largest": self.cmd_largest,
+            "recent": self.cmd_recent,
+            "du": self.cmd_du,
+            "exit": self.cmd_exit,
+        }
+
+    def run(self, line):
+        return "".join(self.stream(line))
+
+    def stream(self, line):
+        # Yields the output in pieces. Most commands produce one; a handler may
+        # return a generator instead (calc over a range), one piece per step.
+        args = line.split()
+        if not args:
+            return
+        name = args[0].lower()
+        handler = self.commands.get(name)
+        start = time.perf_counter()
+        if handler is None:
+            yield self.cmd_eval(line)
+            self.finished("cmd (expression)", start)
+            return
+        try:
+            if self.submit is not None and name in BLOCKING_COMMANDS:
+                output = yield from self.offload(handler, args[1:])
+            else:
+                output = handler(args[1:])
+            if isinstance(output, str):
+                yield output
+            else:
+                yield from output
+        except Exception as e:
+            self.errors += 1
+            yield f"Error: {e}\n"
+        finally:
+            self.finished("cmd " + name, start)
+
+    def offload(self, handler, args):
+        # The handler's result, from a worker; "" pieces until then keep each slice short
+        future = self.submit(handler, args)
+        while not future.done():
+            yield ""
+        if future.cancelled():  # the terminal is closing
+            return ""
+        return future.result()
+
+    def finished(self, name, start):
+        spent = time.perf_counter() - start
+        self.stats.add(name, spent * 1000)
+        if self.own_scheduler:  # on the desktop the terminal's task is charged already
+            self.scheduler.charge(self.pid, spent)
+
+    def fail(self, message):
+        self.errors += 1
+        return message + "\n"
+
+    def cmd_help(self, args):
+        return HELP
+
+    def cmd_echo(self, args):
+        return ">> " + " ".join(args) + "\n"
+
+    def cmd_dir(self, args):
+        return "".join(name + "\n" for name, path, is_dir in self.vfs.listdir())
+
+    def cmd_clear(self, args):
+        if self.on_clear:
+            self.on_clear()
+        return ""
+
+    def cmd_start(self, args):
+        if not args:
+            return self.fail("Usage: start <program>")
+        target = args[0].lower()
+        if target in PROGRAMS:
+            if self.launch is None:
+                return self.fail(f"Cannot start {target} without a display")
+            self.launch(target)
+            return "Started new terminal\n" if target == "cmd" else f"Started {target}\n"
+        path = self.vfs.path(args[0])
+        if not self.vfs.exists(path):
+            return self.fail("Not found")
+        if self.vfs.isdir(path):
+            return self.fail("Cannot start directory")
+        if self.launch is None:
+            return self.vfs.read_text(path) + "\n"
+        self.launch(path)
+        return "Opened file\n"
+
+    def cmd_mkdir(self, args):
+        if not args:
+            return self.fail("Usage: mkdir <name>")
+        self.vfs.mkdir(self.vfs.path(args[0]))
+        return "Folder created\n"
+
+    def cmd_touch(self, args):
+        if not args:
+            return self.fail("Usage: touch <name>")
+        self.vfs.touch(self.vfs.path(args[0]))
+        return "File created\n"
+
+    def cmd_rm(self, args):
+        recursive = args[:1] == ["-r"]
+        if recursive:
+            args = args[1:]
+        if not args:
+            return self.fail("Usage: rm [-r] <name>")
+        path = self.vfs.path(args[0])
+        if not self.vfs.exists(path):
+            return self.fail("Not found")
+        if recursive and self.vfs.isdir(path):
+            return self.bulk(BulkJob(self.vfs, "delete", [path]))
+        self.vfs.remove(path)
+        return "Deleted\n"
+
+    def cmd_cp(self, args):
+        recursive = args[:1] == ["-r"]
+        if recursive:
+            args = args[1:]
+        if len(args) < 2:
+            return self.fail("Usage: cp [-r] <source>... <target>")
+        sources = [self.vfs.path(a) for a in args[:-1]]
+        for src in sources:
+            if not self.vfs.exists(src):
+                return self.fail(f"Not found: {os.path.basename(src)}")
+            if self.vfs.isdir(src) and not recursive:
+                return self.fail(f"{os.path.basename(src)} is a folder (use cp -r)")
+        return self.bulk(BulkJob(self.vfs, "copy", sources, self.vfs.path(args[-1])))
+
+    def cmd_mv(self, args):
+        if len(args) < 2:
+            return self.fail("Usage: mv <source>... <target>")
+        sources = [self.vfs.path(a) for a in args[:-1]]
+        for src in sources:
+            if not self.vfs.exists(src):
+                return self.fail(f"Not found: {os.path.basename(src)}")
+        return self.bulk(BulkJob(self.vfs, "move", sources, self.vfs.path(args[-1])))
+
+    def bulk(self, job):
+        # Runs the job on its own thread and reports progress about once a second
+        job.start()
+        shown = time.perf_counter()
+        try:
+            while not job.finished.is_set():
+                if time.perf_counter() - shown >= 1:
+                    shown = time.perf_counter()
+                    yield job.describe() + "\n"
+                else:
+                    yield ""
+        finally:
+            if not job.finished.is_set():  # the terminal was killed or closed meanwhile
+                job.cancel()
+        if job.failure is not None:
+            raise job.failure
+        for error in job.errors[:10]:
+            yield f"Error: {error}\n"
+        if job.errors:
+            self.errors += 1
+        yield job.describe() + "\n"
+
+    def cmd_calc(self, args):
+        if not args:
+            return self.fail("Usage: calc <expression>")
+        text = " ".join(args)
+        if darko_calc.is_range(text):
+            return darko_calc.evaluate_range(text)
+        return f">> {darko_calc.evaluate(text)}\n"
+
+    def cmd_find(self, args):
+        if not args:
+            return self.fail("Usage: find <name>")
+        search = self.vfs.search
+        found = search.find(" ".join(args))
+        if not found:
+            return "No matches\n"
+        return "".join(search.rel(p) + ("/" if self.vfs.isdir(p) else "") + "\n" for p in found)
+
+    def cmd_grep(self, args):
+        if not args:
+            return self.fail("Usage: grep <text>")
+        search = self.vfs.search
+        found = search.grep(" ".join(args))
+        if not found:
+            return "No matches\n"
+        out = []
+        for path, lines in found:
+            out.extend(f"{search.rel(path)}:{n}: {line[:120]}\n" for n, line in lines[:3])
+            if len(lines) > 3:
+                out.append(f"{search.rel(path)}: … {len(lines) - 3} more\n")
+        return "".join(out)
+
+    def cmd_snapshot(self, args):
+        usage = "Usage: snapshot create [name] | list | diff <name> [other] | restore <name> | delete <name>"
+        snapshots = self.vfs.snapshots
+        sub = args[0].lower() if args else ""
+        if sub == "create" and len(args) <= 2:
+            name, count = snapshots.create(args[1] if len(args) == 2 else None)
+            return f"Snapshot {name} created ({count} entries)\n"
+        if sub == "list" and len(args) == 1:
+            rows = snapshots.list()
+            if not rows:
+                return "No snapshots\n"
+            return "".join(f"{name}  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(created))}  "
+                           f"{files} files  {size / 1024:.1f} KB\n" for name, created, files, size in rows)
+        if sub == "diff" and len(args) in (2, 3):
+            added, removed, modified = snapshots.diff(args[1], args[2] if len(args) == 3 else None)
+            lines = [f"+ {p}\n" for p in added] + [f"- {p}\n" for p in removed] + [f"M {p}\n" for p in modified]
+            return "".join(lines) + f"{len(added)} added, {len(removed)} removed, {len(modified)} modified\n"
+        if sub == "restore" and len(args) == 2:
+            return f"Restored {args[1]} ({snapshots.restore(args[1])} entries changed)\n"
+        if sub == "delete" and len(args) == 2:
+            snapshots.delete(args[1])
+            return f"Snapshot {args[1]} deleted\n"
+        return self.fail(usage)
+
+    def cmd_perf(self, args):
+        source = self.monitor or self.stats
+        if not args:
+            return source.report()
+        if args == ["reset"]:
+            source.reset()
+            return "Timings reset\n"
+        if len(args) == 2 and args[0] == "export":
+            path = self.vfs.path(args[1])
+            self.vfs.write_text(path, json.dumps(source.to_dict(), indent=1))
+            return f"Exported to {args[1]}\n"
+        return self.fail("Usage: perf [reset | export <file>]")
+
+    def cmd_ps(self, args):
+        return self.scheduler.report()
+
+    def cmd_top(self, args):
+        if len(args) > 1 or (args and not args[0].isdigit()):
+            return self.fail("Usage: top [count]")
+        count = int(args[0]) if args else 10
+        self.scheduler.sample()
+        lines = self.scheduler.report(sort_recent=True).splitlines(True)
+        total = sum(row[7] for row in self.scheduler.table())
+        return f"{len(lines) - 1} processes, {total:.1f}% CPU\n" + "".join(lines[:count + 1])
+
+    def cmd_kill(self, args):
+        if not args:
+            return self.fail("Usage: kill <pid>...")
+        out = []
+        for arg in args:
+            try:
+                process = self.scheduler.kill(int(arg))
+                out.append(f"Killed {process.pid} ({process.name})\n")
+            except ValueError:
+                out.append(self.fail(f"Not a process id: {arg}"))
+            except (ProcessLookupError, PermissionError) as e:
+                out.append(self.fail(str(e)))
+        return "".join(out)
+
+    def cmd_history(self, args, limit=20):
+        if self.history is None:
+            return "No command history here\n"  # headless: nothing to show, but nothing failed
+        if not args:
+            return "".join(f"{text}\n" for text in self.history.last(limit))
+        found = []
+        for text in self.history.matches(" ".join(args)):
+            found.append(f"{text}\n")
+            if len(found) == limit:
+                break
+        return "".join(found) or "No matching commands\n"
+
+    def count_arg(self, args, usage):
+        if len(args) > 1 or (args and not args[0].isdigit()):
+            raise ValueError(usage)
+        return int(args[0]) if args else 20
+
+    def cmd_largest(self, args):
+        count = self.count_arg(args, "Usage: largest [count]")
+        catalog = self.vfs.catalog
+        catalog.ensure()
+        rel = self.vfs.search.rel
+        return "".join(f"{size / 1024:>12.1f} KB  {rel(path)}\n" for path, size, mtime in catalog.largest(count)) \
+            or "No files\n"
+
+    def cmd_recent(self, args):
+        count = self.count_arg(args, "Usage: recent [count]")
+        catalog = self.vfs.catalog
+        catalog.ensure()
+        rel = self.vfs.search.rel
+        return "".join(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(mtime / 1e9))}  {size / 1024:>10.1f} KB  "
+                       f"{rel(path)}\n" for path, size, mtime in catalog.recent(count)) or "No files\n"
+
+    def cmd_du(self, args):
+        folder = self.vfs.path(" ".join(args)) if args else self.vfs.root
+        if not self.vfs.isdir(folder):
+            return self.fail("Not a folder")
+        catalog = self.vfs.catalog
+        catalog.ensure()
+        out = [f"{size / 1024:>12.1f} KB {files:>8} files  {os.path.basename(path)}{'/' if is_dir else ''}\n"
+               for path, is_dir, size, files in catalog.folder_totals(folder)]
+        size, files = catalog.totals(folder)
+        out.append(f"{size / 1024:>12.1f} KB {files:>8} files  total\n")
+        return "".join(out)
+
+    def cmd_exit(self, args):
+        self.exited = True
+        if self.on_exit:
+            self.on_exit()
+        return ""
+
+    def cmd_eval(self, line):
+        try:
+            return f">> {darko_calc.evaluate(line)}\n"
+        except Exception as e:
+            return self.fail(f"Unknown command or error: {e}")
+
+
+# ---------- CLI ----------
+def run_lines(shell, lines, out):
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        for piece in shell.stream(line):
+            out.write(piece)
+            out.flush()
+        if shell.exited:
+            return False
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="darko_core", description="Run DarkoOS terminal commands without a display.")
+    parser.add_argument("scripts", nargs="*", help=".drk scripts to run; commands are read from stdin when none are given")
+    parser.add_argument("-c", "--command", action="append", default=[], help="run one command (repeatable)")
+    parser.add_argument("--disk", default="v_disk", help="virtual disk directory (default: v_disk)")
+    parser.add_argument("--image", help="use this single-file disk image instead of the directory")
+    parser.add_argument("--size-gb", type=float, default=1, help="size of a new disk image (default: 1)")
+    parser.add_argument("--dedup", choices=sorted(CODECS), help="store file contents deduplicated, compressed with this")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    if args.image:
+        vfs = ImageVFS(args.disk, args.image, int(args.size_gb * 1024 ** 3), store=args.dedup)
+    else:
+        vfs = VFS(args.disk, store=args.dedup)
+    shell = Shell(vfs)
+    out = sys.stdout
+    if args.command:
+        run_lines(shell, args.command, out)
+    for script in args.scripts:
+        if shell.exited:
+            break
+        with open(script, "r", encoding="utf-8") as f:
+            run_lines(shell, f, out)
+    if not args.command and not args.scripts:
+        run_lines(shell, sys.stdin, out)
+    out.flush()
+    return 1 if shell.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
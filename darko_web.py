@@ -0,0 +1,515 @@
+# DarkoOS browser stack: pooled HTTP client, page cache and HTML pipeline.
+#
+# Imported by OS.py the first time a Browser window opens.
+
+import base64
+import codecs
+import hashlib
+import html
+import http.client
+import json
+import os
+import re
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+
+from darko_core import atomic_write
+
+
+# ---------- HTTP POOL ----------
+class HTTPPool:
+    # Keep-alive http.client connections per (scheme, host, port, proxy), shared
+    # by every Browser window. Counts connection reuse and time-to-first-byte.
+    # http_proxy / https_proxy / no_proxy are honoured: plain http goes to the
+    # proxy with absolute URLs, https is tunnelled through it with CONNECT.
+    REDIRECTS = (301, 302, 303, 307, 308)
+
+    def __init__(self, max_per_host=4, max_idle_per_host=4, timeout=15, idle_timeout=60):
+        self.max_per_host = max_per_host
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.cond = threading.Condition()
+        self.idle = {}  # key -> [(connection, last used)]
+        self.active = {}  # key -> connections checked out
+        self.ssl_context = None
+        self.hits = 0
+        self.misses = 0
+        self.ttfb = deque(maxlen=1000)  # seconds, most recent requests
+        self.proxies = urllib.request.getproxies()  # scheme -> proxy URL, from the environment
+        self.bypass = {}  # host -> True when no_proxy exempts it
+
+    def proxy(self, scheme, host):
+        # (host, port, Proxy-Authorization or None) of the proxy for scheme://host, or None
+        url = self.proxies.get(scheme)
+        if not url:
+            return None
+        if host not in self.bypass:
+            self.bypass[host] = bool(urllib.request.proxy_bypass(host))
+        if self.bypass[host]:
+            return None
+        parts = urllib.parse.urlsplit(url if "://" in url else "http://" + url)
+        auth = None
+        if parts.username:
+            credentials = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+            auth = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+        return parts.hostname, parts.port or 80, auth
+
+    def connect(self, key):
+        scheme, host, port, proxy = key
+        if scheme == "https":
+            if self.ssl_context is None:
+                import ssl
+                self.ssl_context = ssl.create_default_context()
+            if proxy is None:
+                return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+            conn = http.client.HTTPSConnection(proxy[0], proxy[1], timeout=self.timeout, context=self.ssl_context)
+            conn.set_tunnel(host, port, headers={"Proxy-Authorization": proxy[2]} if proxy[2] else None)
+            return conn
+        if proxy is None:
+            return http.client.HTTPConnection(host, port, timeout=self.timeout)
+        return http.client.HTTPConnection(proxy[0], proxy[1], timeout=self.timeout)
+
+    def acquire(self, key):
+        with self.cond:
+            while self.active.get(key, 0) >= self.max_per_host:
+                self.cond.wait()
+            self.active[key] = self.active.get(key, 0) + 1
+            idle = self.idle.get(key, [])
+            now = time.monotonic()
+            while idle:
+                conn, used = idle.pop()
+                if now - used < self.idle_timeout:
+                    self.hits += 1
+                    return conn, True
+                conn.close()
+            self.misses += 1
+        return self.connect(key), False
+
+    def release(self, key, conn, reusable):
+        with self.cond:
+            self.active[key] -= 1
+            idle = self.idle.setdefault(key, [])
+            if reusable and len(idle) < self.max_idle_per_host:
+                idle.append((conn, time.monotonic()))
+                conn = None
+            self.cond.notify()
+        if conn is not None:
+            conn.close()
+
+    def send(self, key, target, headers):
+        conn, reused = self.acquire(key)
+        start = time.perf_counter()
+        try:
+            conn.request("GET", target, headers=headers)
+            response = conn.getresponse()
+        except (http.client.HTTPException, ConnectionError) as e:
+            self.release(key, conn, False)
+            if reused:
+                return self.send(key, target, headers)  # the server dropped an idle connection
+            raise e
+        except BaseException:
+            self.release(key, conn, False)
+            raise
+        self.ttfb.append(time.perf_counter() - start)
+        return conn, response
+
+    def request(self, url, headers=None, progress=None, chunk_size=64 * 1024, redirects=5):
+        # Returns (final url, status, reason, headers, body); the body is read in chunks
+        headers = dict(headers or {})
+        for _ in range(redirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ("http", "https") or not parts.hostname:
+                raise ValueError(f"Unsupported URL: {url}")
+            port = parts.port or (443 if parts.scheme == "https" else 80)
+            proxy = self.proxy(parts.scheme, parts.hostname)
+            key = (parts.scheme, parts.hostname, port, proxy)
+            target = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+            sent = headers
+            if proxy is not None and parts.scheme == "http":
+                target = urllib.parse.urlunsplit(("http", parts.netloc, parts.path or "/", parts.query, ""))
+                if proxy[2]:
+                    sent = dict(headers, **{"Proxy-Authorization": proxy[2]})
+            conn, response = self.send(key, target, sent)
+            location = response.getheader("Location")
+            try:
+                if response.status in self.REDIRECTS and location:
+                    response.read()
+                    body = None
+                else:
+                    length = response.getheader("Content-Length")
+                    chunks, received = [], 0
+                    while True:
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        chunks.append(chunk)
+                        received += len(chunk)
+                        if progress:
+                            progress(received, length)
+                    body = b"".join(chunks)
+            except BaseException:
+                response.close()
+                self.release(key, conn, False)
+                raise
+            self.release(key, conn, not response.will_close)
+            if body is None:
+                url = urllib.parse.urljoin(url, location)
+                continue
+            return url, response.status, response.reason, response.headers, body
+        raise http.client.HTTPException("Too many redirects")
+
+    def stats(self):
+        ttfb = sorted(self.ttfb)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttfb_ms_p50": round(ttfb[len(ttfb) // 2] * 1000, 1) if ttfb else None,
+            "ttfb_ms_max": round(ttfb[-1] * 1000, 1) if ttfb else None,
+        }
+
+    def close(self):
+        with self.cond:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn, used in conns:
+                conn.close()
+
+
+# ---------- HTML PIPELINE ----------
+RENDER_CHUNK_BYTES = 4 * 1024
+RENDER_CAP_BYTES = 256 * 1024
+
+
+class HTMLChunker(HTMLParser):
+    # Keeps only the markup HTMLLabel can display and cuts it into chunks that
+    # close their open tags, so each one can be rendered after the previous.
+    KEEP = {"br", "ul", "ol", "li", "a", "b", "strong", "i", "em", "u", "mark", "span", "div", "p",
+            "pre", "code", "h1", "h2", "h3", "h4", "h5", "h6", "table", "tr", "th", "td"}
+    SKIP = {"head", "script", "style", "noscript", "template", "svg", "math", "canvas", "iframe",
+            "object", "video", "audio", "select", "textarea", "button"}
+    AS_DIV = {"section", "article", "header", "footer", "nav", "main", "aside", "form", "blockquote",
+              "figure", "figcaption", "dl", "dt", "dd", "center", "address", "details", "summary"}
+    BLOCK_END = {"p", "div", "li", "ul", "ol", "pre", "table", "tr", "h1", "h2", "h3", "h4", "h5", "h6"}
+    ATTRS = {"href", "style", "type"}
+
+    def __init__(self, chunk_bytes=RENDER_CHUNK_BYTES):
+        super().__init__(convert_charrefs=True)
+        self.chunk_bytes = chunk_bytes
+        self.chunks = []
+        self.parts = []
+        self.size = 0
+        self.stack = []  # (tag, opening markup) of tags still open
+        self.skipping = []
+        self.title = []
+        self.in_title = False
+
+    def emit(self, markup):
+        self.parts.append(markup)
+        self.size += len(markup)
+
+    def cut(self):
+        if not self.parts:
+            return
+        closing = "".join(f"</{tag}>" for tag, _ in reversed(self.stack))
+        self.chunks.append("".join(self.parts) + closing)
+        self.parts = [markup for _, markup in self.stack]
+        self.size = sum(len(m) for m in self.parts)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "title":
+            self.in_title = True
+            return
+        if tag == "body":
+            self.skipping = []  # a missing </head> must not hide the page
+        if tag in self.SKIP:
+            self.skipping.append(tag)
+            return
+        if self.skipping:
+            return
+        if tag == "img":
+            alt = dict(attrs).get("alt")
+            if alt:
+                self.emit(html.escape(f"[{alt}]", quote=False))
+            return
+        if tag == "hr":
+            tag = "br"
+        tag = "div" if tag in self.AS_DIV else tag
+        if tag not in self.KEEP:
+            return
+        kept = "".join(f' {k}="{html.escape(v)}"' for k, v in attrs if k in self.ATTRS and v)
+        markup = f"<{tag}{kept}>"
+        self.emit(markup)
+        if tag != "br":
+            self.stack.append((tag, markup))
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self.in_title = False
+            return
+        if tag in self.SKIP:
+            if tag in self.skipping:
+                del self.skipping[self.skipping.index(tag):]
+            return
+        if self.skipping:
+            return
+        tag = "div" if tag in self.AS_DIV else tag
+        if tag not in self.KEEP or tag == "br" or all(t != tag for t, _ in self.stack):
+            return
+        while self.stack:
+            open_tag, _ = self.stack.pop()
+            self.emit(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+        if tag in self.BLOCK_END and self.size >= self.chunk_bytes:
+            self.cut()
+
+    def handle_data(self, data):
+        if self.in_title:
+            self.title.append(data)
+        elif not self.skipping:
+            self.emit(html.escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        self.cut()
+
+
+def split_html(text, chunk_bytes=RENDER_CHUNK_BYTES):
+    # Runs on a worker: (title, [chunk, ...]) with scripts, styles and images stripped
+    parser = HTMLChunker(chunk_bytes)
+    parser.feed(text)
+    parser.close()
+    return " ".join("".join(parser.title).split()), parser.chunks
+
+
+def append_html(label, markup):
+    # HTMLLabel.set_html replaces the whole page, so the chunks rendered so far are
+    # kept and laid out again with the new one; each chunk closes its own tags,
+    # which keeps the growing prefix well formed.
+    label.rendered = getattr(label, "rendered", "") + markup
+    top = label.yview()[0]
+    label.set_html(label.rendered)
+    label.yview_moveto(top)
+
+
+# ---------- WEB CACHE ----------
+META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([A-Za-z0-9_.:-]+)""", re.I)
+
+
+def detect_charset(content_type, body):
+    # Header first, then a BOM, then a <meta> tag near the top of the document
+    candidates = []
+    if content_type:
+        match = re.search(r"charset\s*=\s*[\"']?([A-Za-z0-9_.:-]+)", content_type, re.I)
+        if match:
+            candidates.append(match.group(1))
+    if body.startswith(codecs.BOM_UTF8):
+        candidates.append("utf-8-sig")
+    elif body.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        candidates.append("utf-16")
+    match = META_CHARSET.search(body[:4096])
+    if match:
+        candidates.append(match.group(1).decode("ascii"))
+    for name in candidates:
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            continue
+    return "utf-8"
+
+
+class Page:
+    # url is what was asked for and keys the cache; final_url is where the
+    # redirects ended, which relative links resolve against
+    def __init__(self, url, body, content_type="", etag=None, last_modified=None, fetched=None, final_url=None):
+        self.url = url
+        self.final_url = final_url or url
+        self.body = body
+        self.content_type = content_type
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched = fetched or time.time()
+        self.charset = detect_charset(content_type, body)
+
+    def text(self):
+        return self.body.decode(self.charset, errors="replace")
+
+    def meta(self):
+        return {"url": self.url, "final_url": self.final_url, "content_type": self.content_type, "etag": self.etag,
+                "last_modified": self.last_modified, "fetched": self.fetched}
+
+
+class PageCache:
+    # Size-bounded LRU of fetched pages, in memory and spilled to disk under
+    # v_disk so other Browser windows and later sessions can revalidate them.
+    def __init__(self, directory, max_bytes=32 * 1024 * 1024, max_disk_bytes=256 * 1024 * 1024, index=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.index = index  # DiskIndex to keep usage current, if any
+        self.lock = threading.Lock()
+        self.mem = OrderedDict()  # url -> Page
+        self.mem_bytes = 0
+        self.disk = None  # key -> bytes on disk, oldest first; loaded on first use
+        self.disk_bytes = 0
+
+    def key(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def load_disk(self):
+        if self.disk is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.name.endswith(".body"):
+                    st = e.stat()
+                    found.append((st.st_mtime, e.name[:-5], st.st_size))
+        self.disk = OrderedDict((k, size) for _, k, size in sorted(found))
+        self.disk_bytes = sum(self.disk.values())
+
+    def get(self, url):
+        with self.lock:
+            page = self.mem.get(url)
+            if page is not None:
+                self.mem.move_to_end(url)
+                return page
+            self.load_disk()
+            key = self.key(url)
+            if key not in self.disk:
+                return None
+            self.disk.move_to_end(key)
+        base = os.path.join(self.directory, key)
+        try:
+            with open(base + ".meta", "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            with open(base + ".body", "rb") as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url:
+            return None
+        page = Page(url, body, meta.get("content_type", ""), meta.get("etag"),
+                    meta.get("last_modified"), meta.get("fetched"), meta.get("final_url"))
+        self.remember(page)
+        return page
+
+    def remember(self, page):
+        with self.lock:
+            old = self.mem.pop(page.url, None)
+            if old is not None:
+                self.mem_bytes -= len(old.body)
+            if len(page.body) > self.max_bytes:
+                return
+            self.mem[page.url] = page
+            self.mem_bytes += len(page.body)
+            while self.mem_bytes > self.max_bytes:
+                self.mem_bytes -= len(self.mem.popitem(last=False)[1].body)
+
+    def trim(self):
+        # Forgets the in-memory copies; pages spilled to disk can still be revalidated
+        with self.lock:
+            self.mem.clear()
+            self.mem_bytes = 0
+
+    def put(self, page):
+        self.remember(page)
+        if len(page.body) > self.max_disk_bytes:
+            return
+        key = self.key(page.url)
+        base = os.path.join(self.directory, key)
+        with self.lock:
+            self.load_disk()
+        atomic_write(base + ".body", lambda f: f.write(page.body))
+        atomic_write(base + ".meta", lambda f: f.write(json.dumps(page.meta()).encode("utf-8")))
+        with self.lock:
+            self.disk_bytes += len(page.body) - self.disk.pop(key, 0)
+            self.disk[key] = len(page.body)
+            evicted = []
+            while self.disk_bytes > self.max_disk_bytes:
+                old, size = self.disk.popitem(last=False)
+                self.disk_bytes -= size
+                evicted.append(old)
+        for old in evicted:
+            for ext in (".body", ".meta"):
+                try:
+                    os.remove(os.path.join(self.directory, old + ext))
+                except OSError:
+                    pass
+                if self.index is not None:
+                    self.index.remove(os.path.join(self.directory, old + ext))
+        if self.index is not None:
+            self.index.update(base + ".body")
+            self.index.update(base + ".meta")
+
+
+# Link paths that read like actions rather than pages; never fetched unasked
+UNSAFE_LINK = re.compile(r"log_?(?:out|off)|sign_?out|delete|remove|unsubscribe|cancel|confirm", re.I)
+
+
+class FetchEngine:
+    # Fetches pages on a worker through the shared HTTPPool, streaming the body
+    # in chunks and revalidating cached copies with If-None-Match / If-Modified-Since.
+    def __init__(self, cache, pool, prefetch_links=0):
+        self.cache = cache
+        self.pool = pool
+        self.prefetch_links = prefetch_links  # 0 turns prefetching off
+        self.prefetcher = ThreadPoolExecutor(max_workers=pool.max_per_host, thread_name_prefix="darko-prefetch")
+
+    def fetch(self, url, progress=None, revalidate=True):
+        cached = self.cache.get(url)
+        if cached is not None and not revalidate:
+            return cached
+        headers = {"User-Agent": "DarkoOS"}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+        final_url, status, reason, response_headers, body = self.pool.request(url, headers, progress)
+        if status == 304 and cached is not None:
+            cached.fetched = time.time()
+            cached.final_url = final_url
+            return cached
+        if status >= 400:
+            raise http.client.HTTPException(f"HTTP {status} {reason}")
+        page = Page(url, body, response_headers.get("Content-Type", ""),
+                    response_headers.get("ETag"), response_headers.get("Last-Modified"), final_url=final_url)
+        if page.etag or page.last_modified:
+            self.cache.put(page)
+        else:
+            self.cache.remember(page)
+        return page
+
+    def links(self, page):
+        found = []
+        for href in re.findall(r"""<a\s[^>]*href\s*=\s*["']([^"'#]+)""", page.text(), re.I):
+            url = urllib.parse.urljoin(page.final_url, href)
+            if url.startswith(("http://", "https://")) and url not in (page.url, page.final_url) and url not in found:
+                found.append(url)
+        return found
+
+    def prefetchable(self, page):
+        # Links to the page's own origin without a query string or an action-like path
+        origin = urllib.parse.urlsplit(page.final_url)[:2]
+        found = []
+        for url in self.links(page):
+            parts = urllib.parse.urlsplit(url)
+            if parts[:2] == origin and not parts.query and not UNSAFE_LINK.search(parts.path):
+                found.append(url)
+        return found
+
+    def prefetch(self, page):
+        # Warm the cache with the first few safe links on a page, several at a time
+        if not self.prefetch_links:
+            return
+        for url in self.prefetchable(page)[:self.prefetch_links]:
+            if self.cache.get(url) is None:
+                self.prefetcher.submit(self.fetch, url)
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from darko_core import ImageVFS, VFS  # noqa: E402
+
+
+@pytest.fixture(params=["folder", "image"])
+def make_vfs(request, tmp_path):
+    # make_vfs(store=None) -> a fresh VFS of either backend under tmp_path
+    def make(store=None):
+        root = str(tmp_path / "v_disk")
+        if request.param == "image":
+            return ImageVFS(root, str(tmp_path / "v_disk.img"), 64 * 1024 * 1024, store=store)
+        return VFS(root, store=store)
+    return make
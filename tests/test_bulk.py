@@ -0,0 +1,128 @@
+import os
+
+import pytest
+
+from darko_core import SYSTEM_DIR, BulkJob, Shell
+
+
+def build(vfs):
+    root = vfs.root
+    vfs.mkdir(os.path.join(root, "src"))
+    vfs.mkdir(os.path.join(root, "src", "sub"))
+    for i in range(20):
+        vfs.write_text(os.path.join(root, "src", "sub" if i % 2 else "", f"f{i}.txt"), f"file {i}\n" * 100)
+    return os.path.join(root, "src")
+
+
+def contents(vfs, top):
+    return {os.path.relpath(path, top): None if is_dir else vfs.read_text(path)
+            for path, is_dir, size, mtime in vfs.walk(top)}
+
+
+def test_copy_move_delete(make_vfs):
+    vfs = make_vfs()
+    src = build(vfs)
+    expected = contents(vfs, src)
+    job = BulkJob(vfs, "copy", [src], os.path.join(vfs.root, "copy"))
+    job.run()
+    assert not job.errors
+    assert job.files == 20
+    assert contents(vfs, os.path.join(vfs.root, "copy")) == expected
+
+    BulkJob(vfs, "move", [os.path.join(vfs.root, "copy")], os.path.join(vfs.root, "moved")).run()
+    assert not vfs.exists(os.path.join(vfs.root, "copy"))
+    assert contents(vfs, os.path.join(vfs.root, "moved")) == expected
+
+    BulkJob(vfs, "delete", [os.path.join(vfs.root, "moved")]).run()
+    assert not vfs.exists(os.path.join(vfs.root, "moved"))
+    assert [os.path.relpath(p, src) for p in vfs.search.find("f3.txt")] == [os.path.join("sub", "f3.txt")]
+
+
+def test_copy_into_itself_is_refused(make_vfs):
+    vfs = make_vfs()
+    src = build(vfs)
+    with pytest.raises(OSError):
+        BulkJob(vfs, "copy", [src], os.path.join(src, "sub")).run()
+
+
+def test_dedup_counts_follow_copy_and_delete(make_vfs):
+    vfs = make_vfs(store="zlib")
+    src = build(vfs)
+    vfs.store.collect()
+    logical, physical = vfs.store.usage()
+    BulkJob(vfs, "copy", [src], os.path.join(vfs.root, "copy")).run()
+    assert vfs.store.usage()[0] == 2 * logical
+    BulkJob(vfs, "delete", [os.path.join(vfs.root, "copy")]).run()
+    assert vfs.store.usage() == (logical, physical)
+
+
+def test_paths_outside_the_disk_are_refused(make_vfs, tmp_path):
+    vfs = make_vfs()
+    build(vfs)
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "keep.txt").write_text("keep")
+    escape = os.path.join(vfs.root, "..", "outside")
+    for op, sources, target in (("delete", [escape], None),
+                                ("copy", [escape], vfs.root),
+                                ("copy", [os.path.join(vfs.root, "src")], escape),
+                                ("move", [os.path.join(vfs.root, "src")], escape)):
+        with pytest.raises(PermissionError):
+            BulkJob(vfs, op, sources, target)
+
+    shell = Shell(vfs)
+    for line in ("rm -r ../outside", "rm ../outside/keep.txt", "cp -r src ../outside", "mv src ../outside"):
+        assert shell.run(line).startswith("Error")
+    assert shell.errors == 4
+    assert sorted(os.listdir(outside)) == ["keep.txt"]
+    assert vfs.exists(os.path.join(vfs.root, "src"))
+
+
+def test_system_dir_and_root_are_refused(make_vfs):
+    vfs = make_vfs()
+    src = build(vfs)
+    vfs.snapshots.create("s1")  # something under SYSTEM_DIR to lose
+    system = os.path.join(vfs.root, SYSTEM_DIR)
+    for op, sources, target in (("delete", [system], None),
+                                ("delete", [os.path.join(system, "snapshots")], None),
+                                ("copy", [src], system),
+                                ("move", [src], os.path.join(system, "snapshots")),
+                                ("delete", [vfs.root], None)):
+        with pytest.raises(PermissionError):
+            BulkJob(vfs, op, sources, target)
+
+    shell = Shell(vfs)
+    for line in (f"rm -r {SYSTEM_DIR}", f"mv src {SYSTEM_DIR}", "rm -r ."):
+        assert shell.run(line).startswith("Error")
+    assert vfs.snapshots.names() == ["s1"]
+    assert vfs.exists(src)
+
+
+def test_cancel_stops_the_job(make_vfs):
+    vfs = make_vfs()
+    src = build(vfs)
+    job = BulkJob(vfs, "copy", [src], os.path.join(vfs.root, "copy"), threads=1)
+    job.cancel()
+    job.run()
+    assert job.files == 0
+    assert "cancelled" in job.describe()
+
+
+def test_shell_reports_a_finished_copy_as_complete(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    out = Shell(vfs).run("cp -r src copy")
+    assert out.startswith("Copied 20/20 files")
+    assert "cancelled" not in out
+
+
+def test_closing_the_shell_stream_cancels_its_job(make_vfs, monkeypatch):
+    vfs = make_vfs()
+    build(vfs)
+    jobs = []
+    monkeypatch.setattr(BulkJob, "start", lambda job: jobs.append(job))  # never finishes on its own
+    stream = Shell(vfs).stream("cp -r src copy")
+    next(stream)
+    assert not jobs[0].cancelled
+    stream.close()  # as when the terminal is killed
+    assert jobs[0].cancelled
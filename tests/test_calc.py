@@ -0,0 +1,83 @@
+import math
+
+import pytest
+
+import darko_calc
+from darko_calc import CalcError, evaluate, evaluate_range
+
+
+@pytest.mark.parametrize("text", [
+    "(1).__class__",  # attribute
+    "pi.real",
+    "[1, 2][0]",  # subscript (and a list)
+    "(lambda: 1)()",
+    "'a' * 3",  # strings
+    "sin.__name__",
+    "__import__('os')",
+    "open('x')",
+    "x",  # unknown name
+    "sqrt(x=4)",  # keywords
+    "(1 if 1 else 2)",
+])
+def test_whitelist_refuses(text):
+    with pytest.raises((CalcError, SyntaxError)):
+        evaluate(text)
+
+
+@pytest.mark.parametrize("text, value", [
+    ("2 + 3 * 4", 14),
+    ("2 ** 10", 1024),
+    ("sqrt(16) + abs(-2)", 6),
+    ("min(3, 1, 2) + max(1, 5, 2)", 6),
+    ("gcd(12, 18)", 6),
+    ("factorial(5)", 120),
+    ("round(pi, 2)", 3.14),
+])
+def test_evaluate(text, value):
+    assert evaluate(text) == value
+
+
+@pytest.mark.parametrize("text", ["10 ** 100000", "(-7) ** 50000", "factorial(100000)", "gcd(2.5, 5)"])
+def test_oversized_or_invalid_is_refused(text):
+    with pytest.raises(CalcError):
+        evaluate(text)
+
+
+def test_float_and_small_powers_still_work():
+    assert evaluate("2 ** 0.5") == math.sqrt(2)
+    assert evaluate("1 ** 10000000") == 1
+    assert evaluate("2 ** -2") == 0.25
+
+
+def test_range_summary_without_numpy(monkeypatch):
+    monkeypatch.setattr(darko_calc.Expression, "vectorized", lambda self, np: None)
+    lines = list(evaluate_range("x ** 2 for x in 0:4"))
+    assert lines[-1] == ">> n=4 sum=14 mean=3.5 min=0 (at x=0) max=9 (at x=3) [no NumPy]\n"
+
+
+def summary(text):
+    return list(evaluate_range(text))[-1].replace(" [no NumPy]", "")
+
+
+@pytest.mark.parametrize("text", [
+    "sin(x) * x for x in -3:3:0.25",
+    "min(x, 1, 2) for x in 0:10",
+    "max(x, 3, 5 - x) for x in 0:10",
+    "gcd(x, 12) for x in 0:13",
+    "factorial(x) for x in 0:10",
+    "x ** 2 - 3 * x for x in -5:5:0.5",
+])
+def test_range_matches_between_numpy_and_python(text, monkeypatch):
+    pytest.importorskip("numpy")
+    vectorized = summary(text)
+    monkeypatch.setattr(darko_calc.Expression, "vectorized", lambda self, np: None)
+    assert summary(text) == vectorized
+
+
+def test_range_errors():
+    with pytest.raises(CalcError):
+        list(evaluate_range("x for x in 5:0"))
+    with pytest.raises(CalcError):
+        list(evaluate_range("x for x in 0:1:0"))
+    with pytest.raises(CalcError):
+        list(evaluate_range("y for x in 0:3"))
@@ -0,0 +1,72 @@
+import os
+
+from darko_core import VFS, BulkJob
+
+
+def catalogued(vfs):
+    # {relative path: size, or None for folders} of every catalog row
+    return {path: None if is_dir else size
+            for path, is_dir, size in vfs.catalog.query("SELECT path, is_dir, size FROM entries")}
+
+
+def on_disk(vfs):
+    return {os.path.relpath(path, vfs.root): None if is_dir else size
+            for path, is_dir, size, mtime in vfs.walk()}
+
+
+def build(vfs):
+    root = vfs.root
+    vfs.mkdir(os.path.join(root, "docs"))
+    vfs.mkdir(os.path.join(root, "docs", "old"))
+    vfs.write_text(os.path.join(root, "docs", "small.txt"), "s\n")
+    vfs.write_text(os.path.join(root, "docs", "old", "big.log"), "x" * 10000)
+    vfs.write_text(os.path.join(root, "calculator.drk"), "")
+
+
+def test_reconcile_catalogs_the_disk(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    vfs.catalog.reconcile()
+    assert catalogued(vfs) == on_disk(vfs)
+    assert vfs.catalog.reconcile() == 0
+    assert vfs.catalog.largest(1)[0][0] == os.path.join(vfs.root, "docs", "old", "big.log")
+    assert vfs.catalog.totals(os.path.join(vfs.root, "docs")) == (10002, 2)
+    assert vfs.catalog.programs() == {os.path.join(vfs.root, "calculator.drk"): "calculator"}
+
+
+def test_reconcile_finds_changes_made_behind_its_back(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    vfs.catalog.reconcile()
+    root = vfs.root
+    # Raw calls skip the hooks, as programs outside DarkoOS would
+    vfs.write_raw(os.path.join(root, "docs", "small.txt"), b"grown\n" * 100)
+    vfs.write_raw(os.path.join(root, "new.txt"), b"new")
+    vfs.makedirs_raw(os.path.join(root, "empty"))
+    vfs.remove_raw(os.path.join(root, "docs", "old", "big.log"))
+    vfs.remove_raw(os.path.join(root, "docs", "old"))
+    assert catalogued(vfs) != on_disk(vfs)
+    assert vfs.catalog.reconcile() > 0
+    assert catalogued(vfs) == on_disk(vfs)
+    assert vfs.catalog.totals() == (600 + 3, 3)
+
+
+def test_hooks_keep_the_catalog_current(make_vfs):
+    vfs = make_vfs()
+    vfs.catalog.reconcile()
+    build(vfs)
+    root = vfs.root
+    vfs.rename(os.path.join(root, "docs"), os.path.join(root, "papers"))
+    vfs.remove(os.path.join(root, "calculator.drk"))
+    BulkJob(vfs, "copy", [os.path.join(root, "papers")], os.path.join(root, "copy")).run()
+    assert catalogued(vfs) == on_disk(vfs)
+    assert vfs.catalog.totals(os.path.join(root, "copy")) == (10002, 2)
+    assert vfs.catalog.programs() == {}
+
+
+def test_names_starting_with_dots_are_catalogued(tmp_path):
+    vfs = VFS(str(tmp_path / "v_disk"))
+    vfs.write_text(os.path.join(vfs.root, "..notes.txt"), "dotted\n")
+    vfs.catalog.reconcile()
+    assert catalogued(vfs) == {"..notes.txt": 7}
+    assert vfs.catalog.rel(os.path.dirname(vfs.root)) is None
@@ -0,0 +1,84 @@
+import os
+import threading
+
+
+def fresh_usage(store):
+    # What a full collect() counts, to compare the running counts with
+    with store.lock:
+        store.garbage = True
+        store.logical = store.physical = None
+    store.collect()
+    return store.usage()
+
+
+def chunk_files(store):
+    return sum(len(store.fs.list_raw(os.path.join(store.directory, sub))) for sub in store.fs.list_raw(store.directory))
+
+
+def test_identical_files_share_chunks(make_vfs):
+    vfs = make_vfs(store="zlib")
+    text = "".join(f"line {i} of a fairly repetitive file\n" for i in range(5000))
+    vfs.write_text(os.path.join(vfs.root, "a.txt"), text)
+    chunks = chunk_files(vfs.store)
+    vfs.write_text(os.path.join(vfs.root, "b.txt"), text)
+    assert chunk_files(vfs.store) == chunks
+    assert vfs.read_text(os.path.join(vfs.root, "b.txt")) == text
+    logical, physical = fresh_usage(vfs.store)
+    assert logical == 2 * len(text.encode("utf-8"))
+    assert physical < logical
+
+
+def test_running_counts_follow_writes_and_removes(make_vfs):
+    vfs = make_vfs(store="zlib")
+    vfs.store.collect()
+    a, b = os.path.join(vfs.root, "a.txt"), os.path.join(vfs.root, "b.txt")
+    vfs.write_text(a, "first version\n" * 1000)
+    vfs.write_text(b, "another file\n" * 1000)
+    vfs.write_text(a, "second version\n" * 10)
+    vfs.remove(b)
+    vfs.store.collect()
+    assert vfs.store.usage() == fresh_usage(vfs.store)
+    assert vfs.store.usage()[0] == len("second version\n" * 10)
+
+
+def test_collect_removes_only_unused_chunks(make_vfs):
+    vfs = make_vfs(store="zlib")
+    kept, dropped = os.path.join(vfs.root, "kept.txt"), os.path.join(vfs.root, "dropped.txt")
+    vfs.write_text(kept, "kept\n" * 1000)
+    vfs.write_text(dropped, "dropped\n" * 1000)
+    before = chunk_files(vfs.store)
+    vfs.remove(dropped)
+    vfs.store.collect()
+    assert chunk_files(vfs.store) < before
+    assert vfs.read_text(kept) == "kept\n" * 1000
+
+
+def test_save_during_collection_keeps_its_chunks(make_vfs):
+    vfs = make_vfs(store="zlib")
+    store = vfs.store
+    store.collect()
+    path = os.path.join(vfs.root, "doc.txt")
+    text = "contents no other file has\n" * 500
+    sizes = store.sizes
+    collector = []
+
+    def collect_midway(p):
+        # The chunks are stored and the manifest is not written yet
+        with store.lock:
+            store.garbage = True
+        thread = threading.Thread(target=store.collect)
+        thread.start()
+        thread.join(0.2)
+        collector.append(thread)
+        return sizes(p)
+
+    store.sizes = collect_midway
+    try:
+        vfs.write_text(path, text)
+    finally:
+        store.sizes = sizes
+    collector[0].join(5)
+    assert not collector[0].is_alive()
+    assert vfs.read_text(path) == text
+    store.collect()
+    assert vfs.read_text(path) == text
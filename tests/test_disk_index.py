@@ -0,0 +1,96 @@
+import os
+
+from darko_core import SYSTEM_DIR, VFS, BulkJob
+
+
+def totals(vfs, index=None):
+    # {relative dir: bytes of files directly inside}, SYSTEM_DIR left out as its files
+    # change without going through the hooks
+    index = index or vfs.index
+    if not index.loaded:
+        index.reconcile()
+    return {os.path.relpath(d, vfs.root): size for d, size in index.dir_totals.items()
+            if os.path.relpath(d, vfs.root).split(os.sep)[0] != SYSTEM_DIR}
+
+
+def fresh(vfs):
+    index = type(vfs.index)(vfs)
+    index.reconcile()
+    return index
+
+
+def build(vfs):
+    root = vfs.root
+    vfs.mkdir(os.path.join(root, "docs"))
+    vfs.mkdir(os.path.join(root, "docs", "old"))
+    vfs.write_text(os.path.join(root, "docs", "small.txt"), "s\n")
+    vfs.write_text(os.path.join(root, "docs", "old", "big.log"), "x" * 10000)
+    vfs.write_text(os.path.join(root, "top.txt"), "top")
+
+
+def test_hooks_keep_the_totals_equal_to_a_fresh_walk(tmp_path):
+    vfs = VFS(str(tmp_path / "v_disk"))
+    vfs.index.reconcile()
+    build(vfs)
+    root = vfs.root
+    assert totals(vfs) == totals(vfs, fresh(vfs))
+    assert vfs.index.dir_bytes(os.path.join(root, "docs")) == 10002
+    assert vfs.index.dir_bytes(os.path.join(root, "docs"), recursive=False) == 2
+
+    vfs.write_text(os.path.join(root, "docs", "small.txt"), "grown\n" * 10)
+    vfs.rename(os.path.join(root, "docs"), os.path.join(root, "papers"))
+    vfs.rename(os.path.join(root, "top.txt"), os.path.join(root, "papers", "top.txt"))
+    vfs.remove(os.path.join(root, "papers", "old", "big.log"))
+    assert totals(vfs) == totals(vfs, fresh(vfs))
+    assert vfs.index.dir_bytes(os.path.join(root, "docs")) == 0
+    assert vfs.index.dir_bytes(os.path.join(root, "papers")) == 63
+
+
+def test_refresh_matches_a_fresh_walk_after_a_bulk_copy(tmp_path):
+    vfs = VFS(str(tmp_path / "v_disk"))
+    vfs.index.reconcile()
+    build(vfs)
+    root = vfs.root
+    BulkJob(vfs, "copy", [os.path.join(root, "docs")], os.path.join(root, "copy")).run()
+    assert totals(vfs) == totals(vfs, fresh(vfs))
+    assert vfs.index.dir_bytes(os.path.join(root, "copy")) == 10002
+    BulkJob(vfs, "delete", [os.path.join(root, "copy")]).run()
+    assert totals(vfs) == totals(vfs, fresh(vfs))
+    assert os.path.join(root, "copy") not in vfs.index.dirs
+
+
+def test_refresh_rereads_a_subtree_changed_behind_its_back(tmp_path):
+    vfs = VFS(str(tmp_path / "v_disk"))
+    vfs.index.reconcile()
+    build(vfs)
+    root = vfs.root
+    used = vfs.index.used_bytes()
+    # Raw calls skip the hooks, as programs outside DarkoOS would
+    vfs.write_raw(os.path.join(root, "docs", "old", "new.bin"), b"n" * 500)
+    vfs.remove_raw(os.path.join(root, "docs", "small.txt"))
+    vfs.makedirs_raw(os.path.join(root, "docs", "empty"))
+    assert totals(vfs) != totals(vfs, fresh(vfs))
+    vfs.index.refresh(os.path.join(root, "docs"))
+    assert totals(vfs) == totals(vfs, fresh(vfs))
+    assert vfs.index.used_bytes() == used + 500 - 2
+
+
+def test_changes_during_a_reconcile_are_not_lost(tmp_path):
+    vfs = VFS(str(tmp_path / "v_disk"))
+    build(vfs)
+    root = vfs.root
+    index = vfs.index
+    scan = index.scan
+
+    def slow_scan():
+        # The walk has read the disk; these land before its result is installed
+        result = scan()
+        vfs.write_text(os.path.join(root, "late.txt"), "late!")
+        vfs.remove(os.path.join(root, "top.txt"))
+        return result
+
+    index.scan = slow_scan
+    index.reconcile()
+    del index.scan
+    assert totals(vfs) == totals(vfs, fresh(vfs))
+    assert index.dir_bytes(root, recursive=False) == 5
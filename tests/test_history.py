@@ -0,0 +1,84 @@
+import os
+
+from darko_core import HistoryCursor, HistoryLog
+
+
+def make_log(tmp_path, lines=()):
+    log = HistoryLog(str(tmp_path / "history" / "commands.log"))
+    for line in lines:
+        log.append(line)
+    return log
+
+
+def test_append_skips_blanks_and_repeats(tmp_path):
+    log = make_log(tmp_path, ["dir", "dir", "  ", "echo a\nb", "dir"])
+    assert log.last(10) == ["dir", "echo a b", "dir"]
+    assert log.last(2) == ["echo a b", "dir"]
+    with open(log.path, "rb") as f:
+        assert f.read() == b"dir\necho a b\ndir\n"
+
+
+def test_missing_file_is_an_empty_log(tmp_path):
+    log = make_log(tmp_path)
+    assert log.last(5) == []
+    assert log.end() == 0
+    assert HistoryCursor(log).up("") is None
+    log.load()
+    assert list(log.matches("")) == []
+
+
+def test_terminals_share_the_log(tmp_path):
+    first = make_log(tmp_path, ["mkdir docs"])
+    second = make_log(tmp_path, ["cd docs"])
+    first.append("touch a.txt")
+    assert second.last(3) == ["mkdir docs", "cd docs", "touch a.txt"]
+    assert HistoryCursor(second).up("") == "touch a.txt"
+
+
+def test_cursor_walks_every_entry_and_back_to_the_draft(tmp_path):
+    log = make_log(tmp_path, ["one", "two", "one", "three"])
+    cursor = HistoryCursor(log)
+    assert [cursor.up("")] + [cursor.up("x") for _ in range(4)] == ["three", "one", "two", "one", None]
+    assert cursor.down() == "two"
+    assert cursor.down() == "one"
+    assert cursor.down() == "three"
+    assert cursor.down() == ""
+    assert cursor.down() is None
+
+
+def test_cursor_with_a_draft_steps_through_distinct_prefix_matches(tmp_path):
+    log = make_log(tmp_path, ["cp a b", "dir", "cp c d", "cp a b", "cd x"])
+    log.load()
+    log.append("cp e f")
+    cursor = HistoryCursor(log)
+    assert cursor.up("cp") == "cp e f"
+    assert cursor.up("cp") == "cp a b"
+    assert cursor.up("cp") == "cp c d"
+    assert cursor.up("cp") is None
+    assert cursor.down() == "cp a b"
+    assert cursor.down() == "cp e f"
+    assert cursor.down() == "cp"
+    cursor.reset()
+    assert cursor.up("") == "cp e f"
+
+
+def test_matches_by_mode(tmp_path):
+    log = make_log(tmp_path, ["grep needle", "find notes", "echo done", "grep needle"])
+    log.load()
+    log.append("snapshot create nightly")
+    assert log.index_bytes() == len("\ngrep needle\necho done\nfind notes\n")
+    assert list(log.matches("")) == ["snapshot create nightly", "grep needle", "echo done", "find notes"]
+    assert list(log.matches("gre", "prefix")) == ["grep needle"]
+    assert list(log.matches("ne", "substring")) == ["grep needle", "echo done"]
+    # Characters in order come after the plain matches
+    assert list(log.matches("fns")) == ["find notes"]
+    assert list(log.matches("nd")) == ["find notes", "grep needle"]
+
+
+def test_a_grown_file_is_mapped_again(tmp_path):
+    log = make_log(tmp_path, ["first"])
+    assert log.last(1) == ["first"]
+    with open(log.path, "ab") as f:
+        f.write("é second\n".encode("utf-8"))
+    assert log.last(2) == ["first", "é second"]
+    assert os.path.getsize(log.path) == log.end()
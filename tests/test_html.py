@@ -0,0 +1,58 @@
+import re
+
+import pytest
+
+import darko_web
+
+PAGE = (
+    "<html><head><title>  Darko \n News </title><script>alert(1)</script></head><body>"
+    + "".join(f"<div><p>Item <b>{i}</b> <a href='/p/{i}'>more</a></p><ul><li>x</li></ul></div>" for i in range(200))
+    + "</body></html>"
+)
+TAG = re.compile(r"<(/?)([a-z0-9]+)[^>]*>")
+
+
+def balanced(markup):
+    stack = []
+    for closing, tag in TAG.findall(markup):
+        if tag == "br":
+            continue
+        if not closing:
+            stack.append(tag)
+        elif not stack or stack.pop() != tag:
+            return False
+    return not stack
+
+
+def test_split_html_keeps_title_and_drops_scripts():
+    title, chunks = darko_web.split_html(PAGE, chunk_bytes=512)
+    assert title == "Darko News"
+    assert len(chunks) > 1
+    assert not any("alert" in chunk or "<script" in chunk for chunk in chunks)
+
+
+def test_every_chunk_and_prefix_is_balanced():
+    _, chunks = darko_web.split_html(PAGE, chunk_bytes=512)
+    for n in range(1, len(chunks) + 1):
+        assert balanced(chunks[n - 1])
+        assert balanced("".join(chunks[:n]))
+    text = TAG.sub("", "".join(chunks))
+    assert [int(i) for i in re.findall(r"Item (\d+)", text)] == list(range(200))
+
+
+def test_append_html_renders_the_growing_prefix():
+    tkhtmlview = pytest.importorskip("tkhtmlview")
+    import tkinter as tk
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    try:
+        label = tkhtmlview.HTMLLabel(root, html="")
+        _, chunks = darko_web.split_html(PAGE, chunk_bytes=512)
+        for chunk in chunks:
+            darko_web.append_html(label, chunk)
+        shown = label.get("1.0", "end")
+        assert [int(i) for i in re.findall(r"Item (\d+)", shown)] == list(range(200))
+    finally:
+        root.destroy()
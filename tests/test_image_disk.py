@@ -0,0 +1,106 @@
+import errno
+import os
+
+import pytest
+
+from darko_core import ImageDisk, ImageVFS
+
+BLOCK = ImageDisk.BLOCK
+
+
+@pytest.fixture
+def disk(tmp_path):
+    disk = ImageDisk(str(tmp_path / "disk.img"), 1024 * 1024)
+    yield disk
+    disk.close()
+
+
+def test_round_trip_survives_remount(tmp_path):
+    path = str(tmp_path / "disk.img")
+    disk = ImageDisk(path, 1024 * 1024)
+    data = bytes(range(256)) * 50  # several blocks, last one partial
+    disk.mkdir(("docs",))
+    disk.write(("docs", "a.bin"), data)
+    free = disk.free_blocks
+    disk.close()
+
+    disk = ImageDisk(path)
+    try:
+        assert disk.read(("docs", "a.bin")) == data
+        assert disk.read(("docs", "a.bin"), 10) == data[:10]
+        assert disk.free_blocks == free
+        assert disk.listdir(("docs",)) == [("a.bin", False)]
+    finally:
+        disk.close()
+
+
+def test_release_coalesces_free_runs(disk):
+    free = disk.free_blocks
+    for name in ("a", "b", "c"):
+        disk.write((name,), b"x" * 3 * BLOCK)
+    assert disk.free_blocks == free - 9
+    disk.remove(("b",))
+    disk.remove(("a",))
+    disk.remove(("c",))
+    assert disk.free_blocks == free
+    assert len(disk.free) == 1
+
+
+def test_allocation_spans_fragmented_runs(disk):
+    for i in range(6):
+        disk.write((f"f{i}",), b"x" * 2 * BLOCK)
+    for i in (0, 2, 4):
+        disk.remove((f"f{i}",))
+    # Fill everything after the last file so only the 2-block holes are left
+    disk.write(("tail",), b"t" * (disk.free[-1][1] * BLOCK))
+    data = bytes(range(256)) * (5 * BLOCK // 256)
+    disk.write(("big",), data)
+    extents = disk.stat(("big",))[5]
+    assert len(extents) == 3
+    assert disk.read(("big",)) == data
+
+
+def test_overwrite_frees_old_blocks(disk):
+    free = disk.free_blocks
+    disk.write(("a",), b"x" * 4 * BLOCK)
+    disk.write(("a",), b"y" * BLOCK)
+    assert disk.free_blocks == free - 1
+    assert disk.read(("a",)) == b"y" * BLOCK
+
+
+def test_linked_blocks_are_freed_with_the_last_entry(disk):
+    free = disk.free_blocks
+    disk.write(("a",), b"x" * 2 * BLOCK)
+    disk.link(("a",), ("b",))
+    assert disk.free_blocks == free - 2
+    disk.remove(("a",))
+    assert disk.read(("b",)) == b"x" * 2 * BLOCK
+    assert disk.free_blocks == free - 2
+    disk.remove(("b",))
+    assert disk.free_blocks == free
+
+
+def test_full_disk_refuses_and_leaves_no_entry(disk):
+    with pytest.raises(OSError) as e:
+        disk.write(("huge",), b"x" * (disk.free_blocks + 1) * BLOCK)
+    assert e.value.errno == errno.ENOSPC
+    assert disk.listdir(()) == []
+
+
+def test_rename_into_itself_is_refused(disk):
+    disk.mkdir(("a",))
+    disk.mkdir(("a", "b"))
+    with pytest.raises(OSError):
+        disk.rename(("a",), ("a", "b", "c"))
+    disk.rename(("a", "b"), ("c",))
+    assert sorted(disk.listdir(())) == [("a", True), ("c", True)]
+
+
+def test_image_vfs_accepts_names_starting_with_dots(tmp_path):
+    vfs = ImageVFS(str(tmp_path / "v_disk"), str(tmp_path / "v_disk.img"), 8 * 1024 * 1024)
+    path = os.path.join(vfs.root, "..notes.txt")
+    vfs.write_text(path, "dotted\n")
+    assert vfs.read_text(path) == "dotted\n"
+    assert vfs.parts(path) == ("..notes.txt",)
+    with pytest.raises(FileNotFoundError):
+        vfs.parts(os.path.join(vfs.root, "..", "outside.txt"))
@@ -0,0 +1,92 @@
+import os
+import time
+
+import pytest
+
+from darko_core import ListingCache, VFS, list_entries
+
+
+def names(entries):
+    return sorted(name for name, path, is_dir in entries)
+
+
+def build(vfs):
+    root = vfs.root
+    vfs.mkdir(os.path.join(root, "docs"))
+    vfs.mkdir(os.path.join(root, "docs", "old"))
+    vfs.write_text(os.path.join(root, "docs", "a.txt"), "a")
+    vfs.write_text(os.path.join(root, "top.txt"), "top")
+
+
+def test_mutations_drop_the_listings_they_change(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    root = vfs.root
+    docs = os.path.join(root, "docs")
+    assert names(vfs.listdir()) == ["docs", "top.txt"]
+    assert names(vfs.listdir(docs)) == ["a.txt", "old"]
+    assert names(vfs.listdir(os.path.join(docs, "old"))) == []
+    assert vfs.listings.cached(root) and vfs.listings.cached(docs)
+
+    vfs.write_text(os.path.join(docs, "b.txt"), "b")
+    assert not vfs.listings.cached(docs)
+    assert vfs.listings.cached(root)
+    assert names(vfs.listdir(docs)) == ["a.txt", "b.txt", "old"]
+
+    vfs.rename(docs, os.path.join(root, "papers"))
+    assert not vfs.listings.cached(root)
+    assert not vfs.listings.cached(os.path.join(docs, "old"))
+    assert names(vfs.listdir()) == ["papers", "top.txt"]
+    assert names(vfs.listdir(os.path.join(root, "papers"))) == ["a.txt", "b.txt", "old"]
+
+    vfs.remove(os.path.join(root, "top.txt"))
+    assert names(vfs.listdir()) == ["papers"]
+
+
+def test_stale_listing_is_noticed_by_mtime(tmp_path):
+    vfs = VFS(str(tmp_path / "v_disk"))
+    vfs.listings.clear()
+    vfs.listings.watcher = None
+    build(vfs)
+    docs = os.path.join(vfs.root, "docs")
+    assert names(vfs.listdir(docs)) == ["a.txt", "old"]
+    # Behind the VFS's back, as another program would
+    with open(os.path.join(docs, "outside.txt"), "w") as f:
+        f.write("x")
+    os.utime(docs, ns=(0, os.stat(docs).st_mtime_ns + 1))
+    assert names(vfs.listdir(docs)) == ["a.txt", "old", "outside.txt"]
+
+
+def test_watched_listing_is_dropped_by_inotify(tmp_path):
+    cache = ListingCache()
+    if cache.watcher is None:
+        pytest.skip("no inotify here")
+    folder = tmp_path / "watched"
+    folder.mkdir()
+    assert cache.get(str(folder)) == []
+    assert cache.current(str(folder))
+    (folder / "new.txt").write_text("x")
+    deadline = time.monotonic() + 5
+    while cache.cached(str(folder)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert names(cache.get(str(folder))) == ["new.txt"]
+
+
+def test_least_recently_used_listings_are_evicted(tmp_path):
+    cache = ListingCache(max_dirs=2)
+    folders = []
+    for name in "abc":
+        folder = tmp_path / name
+        folder.mkdir()
+        (folder / f"{name}.txt").write_text(name)
+        folders.append(str(folder))
+    cache.get(folders[0])
+    cache.get(folders[1])
+    cache.get(folders[0])
+    cache.get(folders[2])
+    assert cache.cached(folders[0]) and cache.cached(folders[2])
+    assert not cache.cached(folders[1])
+    assert cache.entry_count() == 2
+    assert cache.get(folders[1]) == list_entries(folders[1])
+    cache.clear()
+    assert cache.entry_count() == 0
@@ -0,0 +1,136 @@
+import time
+
+import pytest
+
+from darko_core import Scheduler
+
+
+def spin(seconds=0.001):
+    while True:
+        end = time.perf_counter() + seconds
+        while time.perf_counter() < end:
+            pass
+        yield
+
+
+def test_least_served_process_runs_next():
+    scheduler = Scheduler()
+    busy = scheduler.spawn("busy")
+    idle = scheduler.spawn("idle")
+    ran = []
+
+    def steps(name):
+        while True:
+            ran.append(name)
+            yield
+
+    scheduler.add_task(busy, steps("busy"), "loop")
+    scheduler.add_task(idle, steps("idle"), "loop")
+    scheduler.charge(busy.pid, 1.0)
+    scheduler.charge(idle.pid, 5.0, background=True)  # worker CPU does not count against the UI share
+    scheduler.tick(budget=0.01)
+    assert ran[0] == "idle"
+    assert idle.background == 5.0 and idle.cpu < 1.0
+
+
+def test_cpu_is_shared_by_priority():
+    scheduler = Scheduler()
+    high = scheduler.spawn("high")
+    low = scheduler.spawn("low")
+    scheduler.set_priority(high.pid, "high")
+    scheduler.set_priority(low.pid, "low")
+    fast = scheduler.add_task(high, spin(), "spin")
+    slow = scheduler.add_task(low, spin(), "spin")
+    deadline = time.perf_counter() + 0.3
+    while time.perf_counter() < deadline:
+        scheduler.tick(budget=0.02)
+    assert fast.steps > 2 * slow.steps > 0
+    with pytest.raises(ValueError):
+        scheduler.set_priority(low.pid, "urgent")
+
+
+def test_yielded_delay_puts_a_task_to_sleep():
+    scheduler = Scheduler()
+    process = scheduler.spawn("sleeper")
+
+    def steps():
+        yield 60
+        yield
+
+    task = scheduler.add_task(process, steps(), "nap")
+    due = scheduler.tick()
+    assert task.steps == 1
+    assert process.state() == "sleeping"
+    assert 50 < due <= 60
+    scheduler.tick()
+    assert task.steps == 1
+    assert scheduler.tick() > 50
+
+
+def test_finished_and_failing_tasks_leave_the_others_running(caplog):
+    scheduler = Scheduler()
+    process = scheduler.spawn("app")
+    ticks = []
+
+    def broken():
+        yield
+        raise RuntimeError("boom")
+
+    def short():
+        yield
+
+    scheduler.add_task(process, broken(), "broken")
+    scheduler.add_task(process, short(), "short")
+    scheduler.every(process, 0, lambda: ticks.append(1), "poll")
+    for _ in range(5):
+        scheduler.tick(budget=0.001)
+    assert [task.name for task in process.tasks] == ["poll"]
+    assert ticks
+    assert [r.getMessage() for r in caplog.records] == [f"task broken of app ({process.pid}) failed"]
+    assert process.state() == "running"
+
+
+def test_kill_cancels_tasks_and_spares_system_processes():
+    scheduler = Scheduler()
+    killed = []
+    closed = []
+    app = scheduler.spawn("app", kill=lambda: killed.append(True))
+    system = scheduler.spawn("desktop", system=True)
+
+    def steps():
+        try:
+            while True:
+                yield
+        finally:
+            closed.append(True)
+
+    task = scheduler.add_task(app, steps(), "loop")
+    scheduler.tick(budget=0.001)
+    scheduler.kill(app.pid)
+    assert killed == [True] and closed == [True]
+    assert task.cancelled and app.tasks == []
+    with pytest.raises(ProcessLookupError):
+        scheduler.kill(app.pid)
+    with pytest.raises(PermissionError):
+        scheduler.kill(system.pid)
+    assert [row[0] for row in scheduler.table()] == [system.pid]
+    assert scheduler.tick() is None
+
+
+def test_a_task_may_cancel_itself():
+    scheduler = Scheduler()
+    process = scheduler.spawn("app")
+    closed = []
+
+    def steps():
+        try:
+            scheduler.cancel(task)
+            yield
+            yield
+        finally:
+            closed.append(True)
+
+    task = scheduler.add_task(process, steps(), "once")
+    scheduler.tick()
+    assert task.steps == 1 and closed == [True]
+    assert process.tasks == []
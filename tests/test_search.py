@@ -0,0 +1,91 @@
+import os
+
+from darko_core import SYSTEM_DIR, VFS, SearchIndex
+
+
+def build(vfs):
+    root = vfs.root
+    vfs.mkdir(os.path.join(root, "reports"))
+    vfs.write_text(os.path.join(root, "reports", "annual_report.txt"), "revenue grew\nthe needle is here\n")
+    vfs.write_text(os.path.join(root, "reports", "notes.md"), "nothing to see\nneedles and pins\n")
+    vfs.write_text(os.path.join(root, "report.txt"), "short\n")
+    vfs.write_text(os.path.join(root, "other.txt"), "haystack only\n")
+
+
+def rel(vfs, paths):
+    return sorted(os.path.relpath(p, vfs.root) for p in paths)
+
+
+def grep(vfs, text):
+    return {os.path.relpath(p, vfs.root): [n for n, line in lines] for p, lines in vfs.search.grep(text)}
+
+
+def fresh(vfs):
+    # A new index crawled from scratch, to compare the incrementally kept one with
+    index = SearchIndex(vfs, os.path.join(vfs.root, SYSTEM_DIR, "fresh.idx"))
+    index.crawl()
+    return index
+
+
+def test_cold_and_crawled_queries_agree(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    cold_find = vfs.search.find("report")
+    cold_grep = grep(vfs, "needle")
+    vfs.search.crawl()
+    assert vfs.search.loaded
+    assert vfs.search.find("report") == cold_find
+    assert grep(vfs, "needle") == cold_grep
+    assert cold_grep == {os.path.join("reports", "annual_report.txt"): [2], os.path.join("reports", "notes.md"): [2]}
+    assert rel(vfs, cold_find) == ["report.txt", "reports", os.path.join("reports", "annual_report.txt")]
+
+
+def test_crawled_queries_use_whole_words_and_prefixes(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    vfs.search.crawl()
+    assert grep(vfs, "the needle") == {os.path.join("reports", "annual_report.txt"): [2]}
+    assert grep(vfs, "needle is here") == {os.path.join("reports", "annual_report.txt"): [2]}
+    assert grep(vfs, "needles and") == {os.path.join("reports", "notes.md"): [2]}
+    assert grep(vfs, "absent words") == {}
+    assert rel(vfs, vfs.search.find("port")) == ["report.txt", "reports", os.path.join("reports", "annual_report.txt")]
+
+
+def test_mutations_keep_the_index_equal_to_a_fresh_crawl(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    vfs.search.crawl()
+    root = vfs.root
+    vfs.write_text(os.path.join(root, "other.txt"), "now a needle too\n")
+    vfs.remove(os.path.join(root, "report.txt"))
+    vfs.rename(os.path.join(root, "reports"), os.path.join(root, "archive"))
+    vfs.mkdir(os.path.join(root, "empty"))
+    index = fresh(vfs)
+    assert vfs.search.docs == index.docs
+    assert vfs.search.names == index.names
+    assert vfs.search.content == index.content
+    assert vfs.search.keys == index.keys
+    assert vfs.search.content_keys == index.content_keys
+    assert grep(vfs, "needle") == {"other.txt": [1], os.path.join("archive", "annual_report.txt"): [2],
+                                   os.path.join("archive", "notes.md"): [2]}
+
+
+def test_saved_index_is_reused(make_vfs):
+    vfs = make_vfs()
+    build(vfs)
+    vfs.search.crawl()
+    again = SearchIndex(vfs, vfs.search.index_path)
+    reads = []
+    read = again.read
+    again.read = lambda path: reads.append(path) or read(path)
+    again.crawl()
+    assert again.docs == vfs.search.docs
+    assert reads == []  # nothing changed, so nothing is read back
+
+
+def test_names_starting_with_dots_are_indexed(tmp_path):
+    vfs = VFS(str(tmp_path / "v_disk"))
+    vfs.write_text(os.path.join(vfs.root, "..notes.txt"), "dotted needle\n")
+    vfs.search.crawl()
+    assert rel(vfs, vfs.search.find("notes")) == ["..notes.txt"]
+    assert vfs.search.ignored(os.path.join(os.path.dirname(vfs.root), "outside.txt"))
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+
+def tree(vfs):
+    # {relative path: contents, or None for folders} of the live disk
+    return {os.path.relpath(path, vfs.root).replace(os.sep, "/"): None if is_dir else vfs.read_text(path)
+            for path, is_dir, size, mtime in vfs.walk()}
+
+
+@pytest.mark.parametrize("store", [None, "zlib"])
+def test_restore_round_trip(make_vfs, store):
+    vfs = make_vfs(store=store)
+    root = vfs.root
+    vfs.mkdir(os.path.join(root, "docs"))
+    vfs.write_text(os.path.join(root, "docs", "a.txt"), "alpha\n" * 2000)
+    vfs.write_text(os.path.join(root, "docs", "b.txt"), "alpha\n" * 2000)  # same chunks as a.txt
+    vfs.write_text(os.path.join(root, "top.txt"), "top\n")
+    before = tree(vfs)
+    if store:
+        vfs.store.collect()
+        usage = vfs.store.usage()
+    vfs.snapshots.create("s1")
+
+    vfs.write_text(os.path.join(root, "docs", "a.txt"), "changed\n")
+    vfs.remove(os.path.join(root, "top.txt"))
+    vfs.mkdir(os.path.join(root, "new"))
+    vfs.write_text(os.path.join(root, "new", "c.txt"), "new\n")
+    added, removed, modified = vfs.snapshots.diff("s1")
+    assert added == ["new", "new/c.txt"]
+    assert removed == ["top.txt"]
+    assert modified == ["docs/a.txt"]
+    if store:
+        vfs.store.collect()  # the snapshot must keep the old chunks alive
+
+    changed = vfs.snapshots.restore("s1")
+    assert changed == 5
+    assert tree(vfs) == before
+    assert vfs.snapshots.diff("s1") == ([], [], [])
+    if store:
+        vfs.store.collect()
+        assert vfs.store.usage() == usage
+        assert tree(vfs) == before
+
+
+def test_restore_leaves_unchanged_files_alone(make_vfs):
+    vfs = make_vfs()
+    path = os.path.join(vfs.root, "same.txt")
+    vfs.write_text(path, "same\n")
+    vfs.snapshots.create("s1")
+    vfs.write_text(os.path.join(vfs.root, "other.txt"), "other\n")
+    mtime = vfs.info(path)[2]
+    assert vfs.snapshots.restore("s1") == 1
+    assert vfs.info(path)[2] == mtime
+    assert not vfs.exists(os.path.join(vfs.root, "other.txt"))
+
+
+def test_snapshot_names_are_checked(make_vfs):
+    vfs = make_vfs()
+    with pytest.raises(ValueError):
+        vfs.snapshots.create("../escape")
+    vfs.snapshots.create("s1")
+    with pytest.raises(FileExistsError):
+        vfs.snapshots.create("s1")
+    with pytest.raises(FileNotFoundError):
+        vfs.snapshots.restore("missing")
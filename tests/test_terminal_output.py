@@ -0,0 +1,54 @@
+import sys
+import types
+
+import pytest
+
+tk = pytest.importorskip("tkinter")
+
+
+@pytest.fixture
+def terminal(monkeypatch):
+    # OS.py reads the installer's config on import
+    config = types.ModuleType("config")
+    config.user, config.passw, config.ram, config.disk_gb = "user", "", 1, 1
+    monkeypatch.setitem(sys.modules, "config", config)
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        pytest.skip("no display")
+    import OS
+    text = tk.Text(root)
+    text.pack()
+    yield OS.TerminalOutput(text, max_lines=10, frame_ms=1)
+    root.destroy()
+
+
+def test_writes_are_flushed_once_in_front_of_the_input(terminal):
+    widget = terminal.widget
+    terminal.write("C:\\> ")
+    terminal.flush()
+    widget.insert("end", "di")
+    terminal.write("one\n")
+    terminal.write("two\n")
+    assert terminal.read_input() == "di"
+    assert widget.get("1.0", "end-1c") == "C:\\> di"
+    terminal.flush()
+    assert widget.get("1.0", "end-1c") == "C:\\> one\ntwo\ndi"
+    assert terminal.read_input() == "di"
+    terminal.set_input("dir")
+    assert terminal.commit_input() == "dir"
+    assert terminal.read_input() == ""
+
+
+def test_scrollback_is_capped(terminal):
+    widget = terminal.widget
+    terminal.write("".join(f"line {i}\n" for i in range(25)))
+    terminal.flush()
+    assert int(widget.index("end-1c").split(".")[0]) == 10
+    assert widget.get("1.0", "1.end") == "line 16"
+    terminal.trim(4)
+    assert widget.get("1.0", "end-1c").splitlines() == ["line 22", "line 23", "line 24"]
+    terminal.trim(100)
+    assert terminal.max_lines == 4
+    terminal.clear()
+    assert widget.get("1.0", "end-1c") == "" and terminal.read_input() == ""
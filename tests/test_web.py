@@ -0,0 +1,90 @@
+import http.server
+import threading
+
+import pytest
+
+import darko_web
+
+BODY = b"<html><title>Latin</title><a href='next'>next</a> <a href='/logout'>out</a></html>"
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/r":
+            self.send_response(302)
+            self.send_header("Location", "/docs/latin")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(BODY)))
+        self.end_headers()
+        self.wfile.write(BODY)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.requests = []
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd, f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    for name in ("http_proxy", "https_proxy", "HTTP_PROXY", "HTTPS_PROXY", "all_proxy", "ALL_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+    pool = darko_web.HTTPPool()
+    yield darko_web.FetchEngine(darko_web.PageCache(str(tmp_path / "web")), pool, prefetch_links=4)
+    pool.close()
+
+
+def test_redirected_page_is_cached_under_the_requested_url(server, engine):
+    httpd, base = server
+    page = engine.fetch(base + "/r")
+    assert page.url == base + "/r"
+    assert page.final_url == base + "/docs/latin"
+    assert engine.links(page) == [base + "/docs/next", base + "/logout"]
+    assert engine.prefetchable(page) == [base + "/docs/next"]
+
+    httpd.requests.clear()
+    assert engine.fetch(base + "/r", revalidate=False) is page
+    assert httpd.requests == []
+
+    again = engine.fetch(base + "/r")
+    assert again.body == BODY
+    assert httpd.requests == [("/r", '"v1"'), ("/docs/latin", '"v1"')]  # revalidated, not downloaded
+
+
+def test_redirected_page_survives_a_restart(server, engine, tmp_path):
+    httpd, base = server
+    engine.fetch(base + "/r")
+    cache = darko_web.PageCache(str(tmp_path / "web"))
+    page = cache.get(base + "/r")
+    assert page is not None
+    assert page.final_url == base + "/docs/latin"
+
+
+def test_prefetch_is_off_by_default(server, tmp_path):
+    httpd, base = server
+    engine = darko_web.FetchEngine(darko_web.PageCache(str(tmp_path / "web")), darko_web.HTTPPool())
+    page = engine.fetch(base + "/r")
+    httpd.requests.clear()
+    engine.prefetch(page)
+    engine.prefetcher.shutdown(wait=True)
+    assert httpd.requests == []